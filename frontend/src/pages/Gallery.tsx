@@ -4,7 +4,7 @@ import { API_URL } from "../main"
 
 interface GalleryImage {
 	id: string | number
-	url: string
+	thumbnailUrl: string
 	title?: string
 	description?: string
 }
@@ -42,6 +42,26 @@ export default function Gallery() {
 		fetchGallery()
 	}, [auth.user?.id_token])
 
+	// The listing only carries thumbnails; the full image is fetched when opened.
+	const openFullImage = async (id: GalleryImage["id"]) => {
+		const tab = window.open("", "_blank")
+		try {
+			const response = await fetch(`${API_URL}/api/gallery/${id}/image`, {
+				headers: {
+					Authorization: `Bearer ${auth.user?.id_token}`,
+				},
+			})
+			if (!response.ok) {
+				throw new Error(`HTTP error! status: ${response.status}`)
+			}
+			const { url } = await response.json()
+			if (tab) tab.location.href = url
+		} catch (err) {
+			tab?.close()
+			setError(err instanceof Error ? err.message : "Unknown error")
+		}
+	}
+
 	if (loading) return <div>Loading gallery...</div>
 	if (error) return <div>Error: {error}</div>
 
@@ -49,20 +69,20 @@ export default function Gallery() {
 		<div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-4 p-4">
 			{images.map((img) => (
 				<div key={img.id} className="card bg-base-200 shadow-sm w-full">
-					<a
-						href={img.url}
-						target="_blank"
-						rel="noopener noreferrer"
-						className="block"
+					<button
+						type="button"
+						onClick={() => openFullImage(img.id)}
+						className="block w-full cursor-pointer"
 					>
 						<figure className="bg-base-300 aspect-4/3 flex items-center justify-center overflow-hidden hover:opacity-90 transition-opacity">
 							<img
-								src={img.url}
+								src={img.thumbnailUrl}
 								alt={img.title || "Fractal image"}
+								loading="lazy"
 								className="object-contain w-full h-full"
 							/>
 						</figure>
-					</a>
+					</button>
 					<div className="card-body">
 						<h2 className="card-title">{img.title || `Image #${img.id}`}</h2>
 						{img.description && (
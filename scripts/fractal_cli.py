@@ -1,97 +1,70 @@
 import os
-import requests
-import jwt
+import time
 from dotenv import load_dotenv
-import os
+
+from fractal_client import ApiError, FractalClient
 
 BASE_URL = ""
 
 load_dotenv()
 
-current_user_info = None
-current_token = None
+# One client for the whole session: its pooled connection is reused by every
+# menu action, and it keeps the login's tokens fresh.
+client = None
+
+def print_error(message, e):
+    print(f"{message}: {e}")
+    if e.status is not None:
+        print(f"HTTP Status Code: {e.status}")
+        print(f"Response Body: {e.body}")
 
 def login(username, password):
-    global current_token, current_user_info
     try:
-        r = requests.post(f"{BASE_URL}/auth/login", json={"username": username, "password": password})
-        r.raise_for_status()
-        data = r.json()
+        data = client.login(username, password)
 
-        if r.status_code == 202 and data.get('challengeName') == 'EMAIL_OTP':
+        if data.get('challengeName') == 'EMAIL_OTP':
             clear_terminal()
             print("\nMFA challenge initiated. Please check your email for a verification code.")
             mfa_code = input("Enter MFA code: ")
             return confirm_mfa(username, mfa_code, data['session'])
 
-        current_token = data['idToken']
-        
-        decoded_token = jwt.decode(current_token, options={"verify_signature": False}) 
-        current_user_info = decoded_token
-        
-        print(f"Logged in as {current_user_info.get('cognito:username', username)}.")
+        print(f"Logged in as {client.claims.get('cognito:username', username)}.")
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"Login failed: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
-        current_token = None
-        current_user_info = None
+    except ApiError as e:
+        print_error("Login failed", e)
+        client.logout()
         return False
 
 def confirm_mfa(username, mfa_code, session):
-    global current_token, current_user_info
     try:
-        r = requests.post(f"{BASE_URL}/auth/confirm-mfa", json={"username": username, "mfaCode": mfa_code, "session": session})
-        r.raise_for_status()
-        data = r.json()
-        current_token = data['idToken']
-        
-        decoded_token = jwt.decode(current_token, options={"verify_signature": False}) 
-        current_user_info = decoded_token
-        
-        print(f"Logged in as {current_user_info.get('cognito:username', username)}.")
+        client.confirm_mfa(username, mfa_code, session)
+        print(f"Logged in as {client.claims.get('cognito:username', username)}.")
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"MFA confirmation failed: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
-        current_token = None
-        current_user_info = None
+    except ApiError as e:
+        print_error("MFA confirmation failed", e)
+        client.logout()
         return False
 
 def signup(username, email, password):
     try:
-        r = requests.post(f"{BASE_URL}/auth/signup", json={"username": username, "email": email, "password": password})
-        r.raise_for_status()
+        client.signup(username, email, password)
         print(f"Sign up successful for {username}. Please check your email to confirm your account.")
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"Sign up failed: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+    except ApiError as e:
+        print_error("Sign up failed", e)
         return False
 
 def confirm_signup(username, confirmation_code):
     try:
-        r = requests.post(f"{BASE_URL}/auth/confirm", json={"username": username, "confirmationCode": confirmation_code})
-        r.raise_for_status()
+        client.confirm_signup(username, confirmation_code)
         print(f"Account for {username} confirmed successfully.")
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"Confirmation failed: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+    except ApiError as e:
+        print_error("Confirmation failed", e)
         return False
 
 def generate_fractal():
-    import time
-
-    if not current_token:
+    if not client.logged_in:
         print("Please log in first.")
         return
 
@@ -120,13 +93,10 @@ def generate_fractal():
     if offset_y: params["offsetY"] = float(offset_y)
     if colour_scheme: params["color"] = colour_scheme
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
         # Initial request to queue the fractal
         print("\nSubmitting fractal generation request...")
-        r = requests.get(f"{BASE_URL}/fractal", headers=headers, params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        data = client.generate(params)
 
         fractal_hash = data.get('hash')
         current_status = data.get('status')
@@ -145,68 +115,52 @@ def generate_fractal():
         elif current_status == 'pending' or current_status == 'generating':
             print(f"Your fractal (hash: {fractal_hash}) is {message}\n")
 
-            POLL_INTERVAL = 5  # seconds
-            
+            POLL_INTERVAL = 5  # seconds; the client long-polls unless the API cannot
+
             while True:
                 try:
-                    status_r = requests.get(f"{BASE_URL}/fractal/status/{fractal_hash}", headers=headers, timeout=10)
-                    status_r.raise_for_status()
-                    status_data = status_r.json()
-
+                    status_data = client.wait_for(fractal_hash, current_status, POLL_INTERVAL,
+                                                  on_update=lambda update: print(f"\r{update.get('message')} ", end="", flush=True))
                     current_status = status_data.get('status')
-                    message = status_data.get('message')
-                    url = status_data.get('url')
 
                     if current_status == 'complete':
-                        print(f"\n\n\x1b]8;;{url}\x1b\\Fractal generated successfully!\x1b]8;;\x1b\\")
-                        return
-                    elif current_status == 'too_complex' or current_status == 'failed':
-                        print(f"\n\n{message}")
-                        return
-                    else:  # status is 'pending' or 'generating'
-                        print(f"\r{message} ", end="", flush=True)
-                        time.sleep(POLL_INTERVAL)
-
-                except requests.exceptions.RequestException as poll_e:
+                        print(f"\n\n\x1b]8;;{status_data.get('url')}\x1b\\Fractal generated successfully!\x1b]8;;\x1b\\")
+                    else:
+                        print(f"\n\n{status_data.get('message')}")
+                    return
+
+                except ApiError as poll_e:
                     print(f"\nError while polling for status: {poll_e}")
+                    current_status = None
                     time.sleep(POLL_INTERVAL)
-            
-
 
         else:
             print(f"\nUnexpected response from server: {data}")
 
-    except requests.exceptions.RequestException as e:
-        print(f"\nFractal generation failed: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+    except ApiError as e:
+        print_error("\nFractal generation failed", e)
 
-def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sortBy=None, sortOrder=None, prompt_for_options=True):
-    if not current_token:
+def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sortBy=None, sortOrder=None, prompt_for_options=True, cursor=None):
+    if not client.logged_in:
         print("Please log in first.")
         return
 
-    endpoint = ""
+    fetch = None
     title = ""
-    
-    user_role = current_user_info.get('custom:role', 'user')
 
     if view_type == "my_gallery":
-        endpoint = "/gallery"
+        fetch = client.gallery
         title = "My Gallery"
     elif view_type == "all_history":
-        endpoint = "/admin/history"
+        fetch = client.admin_history
         title = "All History"
     elif view_type == "all_gallery":
-        endpoint = "/admin/gallery"
+        fetch = client.admin_gallery
         title = "All Gallery"
     else:
         print("Invalid view type.")
         return
 
-    query_params = {}
-
     if prompt_for_options:
         print("\n--- Filters, Sorting, and Pagination Options (leave blank for default/skip) ---")
         
@@ -239,29 +193,24 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
         sortBy = sortBy
         sortOrder = sortOrder
 
-    if filters:
-        for k, v in filters.items():
-            query_params[k] = v
-
-    if limit is not None: query_params["limit"] = int(limit)
-    if offset is not None: query_params["offset"] = int(offset)
-    if sortBy: query_params["sortBy"] = sortBy
-    if sortOrder: query_params["sortOrder"] = sortOrder
-
     clear_terminal()
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
-        r = requests.get(f"{BASE_URL}{endpoint}", headers=headers, params=query_params)
-        r.raise_for_status()
-        response_data = r.json()
+        # Pages after the first follow the previous page's cursor; `offset`
+        # only tracks the position for display.
+        response_data = fetch(limit=int(limit) if limit is not None else None,
+                              offset=int(offset) if offset is not None and not cursor else None,
+                              filters=filters, sort_by=sortBy or None, sort_order=sortOrder or None, cursor=cursor)
         data = response_data.get('data', [])
         total_count = int(response_data.get('totalCount', len(data)))
+        total_text = f"~{total_count}" if response_data.get('totalCountApproximate') else str(total_count)
         current_limit = response_data.get('limit', len(data))
-        current_offset = response_data.get('offset', 0)
+        current_offset = int(offset) if offset is not None else 0
+        next_cursor = response_data.get('next')
+        prev_cursor = response_data.get('prev')
 
         if data:
-            print(f"\n--- {title} (Total: {total_count}, Showing {current_offset}-{current_offset + len(data)} of {total_count}) ---")
+            print(f"\n--- {title} (Total: {total_text}, Showing {current_offset}-{current_offset + len(data)} of {total_text}) ---")
             for entry in data:
                 timestamp_field = 'added_at' if 'added_at' in entry else 'generated_at'
                 user_info = ""
@@ -297,8 +246,8 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
             
             # New interactive section
             while True:
-                has_more_pages = current_offset + len(data) < total_count
-                can_go_back = current_offset > 0
+                has_more_pages = bool(next_cursor)
+                can_go_back = bool(prev_cursor)
 
                 nav_options = []
                 if can_go_back:
@@ -317,15 +266,15 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
                 if action == '1': # Previous Page
                     if can_go_back:
                         clear_terminal()
-                        offset = max(0, offset - current_limit)
-                        return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': offset, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder, 're_render': True}
+                        offset = max(0, current_offset - current_limit)
+                        return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': offset, 'cursor': prev_cursor, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder, 're_render': True}
                     else:
                         print("\nAlready on the first page.\n")
                 elif action == '2': # Next Page
                     if has_more_pages:
                         clear_terminal()
-                        offset += current_limit
-                        return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': offset, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder, 're_render': True}
+                        offset = current_offset + len(data)
+                        return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': offset, 'cursor': next_cursor, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder, 're_render': True}
                     else:
                         print("\nAlready on the last page.\n")
                 elif action == '0': # Get link from ID
@@ -333,6 +282,12 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
                     try:
                         selected_id = int(id_input)
                         found_entry = next((e for e in data if e.get('id') == selected_id), None)
+                        if found_entry and not found_entry.get('url') and view_type != "all_history" and found_entry.get('thumbnailUrl'):
+                            # Gallery listings only carry thumbnails; fetch the full image's link.
+                            try:
+                                found_entry['url'] = client.gallery_image(selected_id).get('url')
+                            except ApiError as image_e:
+                                print(f"\nCould not get the full image link: {image_e}")
                         if found_entry:
                             if found_entry.get('url'):
                                 print(f"\n\x1b]8;;{found_entry['url']}\x1b\\Click here to open fractal with ID {selected_id}\x1b]8;;\x1b\\")
@@ -350,11 +305,11 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
             print(f"No {title.lower()} items found for the current query.")
             input("Press Enter to continue...")
             return {'data': [], 'totalCount': total_count, 'limit': current_limit, 'offset': current_offset, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder}
-    except requests.exceptions.RequestException as e:
+    except ApiError as e:
         print(f"\nFailed to retrieve {title.lower()}: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+        if e.status is not None:
+            print(f"HTTP Status Code: {e.status}")
+            print(f"Response Body: {e.body}")
         else:
             print(f"No HTTP response received. Error: {e}")
         input("Press Enter to continue...")
@@ -364,7 +319,7 @@ def clear_terminal():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 def delete_gallery_entry():
-    if not current_token:
+    if not client.logged_in:
         print("Please log in first.")
         return
 
@@ -373,16 +328,11 @@ def delete_gallery_entry():
         print("Invalid ID. Please enter a number.")
         return
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
-        r = requests.delete(f"{BASE_URL}/gallery/{gallery_id}", headers=headers)
-        r.raise_for_status()
+        client.delete_gallery_entry(gallery_id)
         print(f"Gallery entry {gallery_id} deleted successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to delete gallery entry {gallery_id}: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+    except ApiError as e:
+        print_error(f"Failed to delete gallery entry {gallery_id}", e)
 
 def get_quick_login_users():
     """Scans environment variables to build a dictionary of quick login users."""
@@ -406,7 +356,6 @@ def get_quick_login_users():
     return users
 
 def quick_login():
-    global current_token, current_user_info
     clear_terminal()
     print("\n--- Quick Login ---")
     
@@ -441,8 +390,7 @@ def quick_login():
         username = available_users[choice]
         if login(username, password):
             user_menu()
-            current_user_info = None
-            current_token = None
+            client.logout()
         else:
             input("\nPress Enter to continue...")
     else:
@@ -450,7 +398,6 @@ def quick_login():
         input("Press Enter to continue...")
 
 def auth_menu():
-    global current_user_info, current_token
     while True:
         clear_terminal()
         print("\n--- Authentication Menu ---")
@@ -470,8 +417,7 @@ def auth_menu():
             password = input("Enter password: ")
             if login(username, password):
                 user_menu()
-                current_user_info = None
-                current_token = None
+                client.logout()
             else:
                 input("\nPress Enter to continue...")
         elif choice == "3":
@@ -498,14 +444,11 @@ def auth_menu():
             input("Press Enter to continue...")
 
 def user_menu():
-    global current_user_info, current_token
     while True:
         clear_terminal()
-        if current_user_info:
-            user_role = 'user'
-            if current_user_info.get('cognito:groups') and 'admin' in current_user_info.get('cognito:groups'):
-                user_role = 'admin'
-            username = current_user_info.get('cognito:username', 'Unknown')
+        if client.logged_in:
+            user_role = client.role
+            username = client.claims.get('cognito:username', 'Unknown')
             print(f"Logged in as: {username} (Role: {user_role})")
         else:
             print("Not logged in.")
@@ -538,12 +481,13 @@ def user_menu():
 
             limit = None
             offset = 0
+            cursor = None
             filters = None
             sortBy = None
             sortOrder = None
 
             while True:
-                result = view_data(view_type="my_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_my_gallery)
+                result = view_data(view_type="my_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_my_gallery, cursor=cursor)
                 
                 if result:
                     current_limit = result['limit']
@@ -556,6 +500,8 @@ def user_menu():
                     
                     if result.get('re_render'):
                         offset = result['offset']
+                        limit = result['limit']
+                        cursor = result.get('cursor')
                         continue
                     else:
                         break
@@ -572,12 +518,13 @@ def user_menu():
 
             limit = None
             offset = 0
+            cursor = None
             filters = None
             sortBy = None
             sortOrder = None
 
             while True:
-                result = view_data(view_type="all_history", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_all_history)
+                result = view_data(view_type="all_history", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_all_history, cursor=cursor)
                 
                 if result:
                     current_limit = result['limit']
@@ -590,6 +537,8 @@ def user_menu():
                     
                     if result.get('re_render'):
                         offset = result['offset']
+                        limit = result['limit']
+                        cursor = result.get('cursor')
                         continue
                     else:
                         break
@@ -605,12 +554,13 @@ def user_menu():
 
             limit = None
             offset = 0
+            cursor = None
             filters = None
             sortBy = None
             sortOrder = None
 
             while True:
-                result = view_data(view_type="all_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_all_gallery)
+                result = view_data(view_type="all_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_options=prompt_for_options_all_gallery, cursor=cursor)
                 
                 if result:
                     current_limit = result['limit']
@@ -623,6 +573,8 @@ def user_menu():
                     
                     if result.get('re_render'):
                         offset = result['offset']
+                        limit = result['limit']
+                        cursor = result.get('cursor')
                         continue
                     else:
                         break
@@ -634,8 +586,7 @@ def user_menu():
             input("\nPress Enter to continue...")
             
         elif choice == "6":
-            current_user_info = None
-            current_token = None
+            client.logout()
             print("\nLogged out successfully.")
             input("Press Enter to continue...")
             break
@@ -648,13 +599,14 @@ def user_menu():
             input("Press Enter to continue...")
 
 def main_menu():
-    global BASE_URL
+    global BASE_URL, client
     ip_address = os.getenv('SERVER_IP', 'localhost')
     print(f"Using server IP from .env: {ip_address}")
     # BASE_URL = f"http://{ip_address}:3000/api"
     BASE_URL = f"https://api.fractals.cab432.com/api"
 
-    auth_menu()
+    with FractalClient(BASE_URL) as client:
+        auth_menu()
 
 if __name__ == "__main__":
     main_menu()
@@ -0,0 +1,601 @@
+"""Client for the fractal API, used by the CLI and both load scripts.
+
+`FractalClient` (on `requests`) and `AsyncFractalClient` (on `aiohttp`)
+have the same methods. Each keeps one session with a pool of keep-alive
+connections, so logging in, paging through the gallery and polling a job
+reuse a connection instead of opening a new TCP and TLS one per call, and
+each holds its own tokens, so one process can act as many users at once.
+
+Requests that fail to connect, or get a 429 or 5xx, are retried with
+jittered exponential backoff (honouring `Retry-After`) if they are safe to
+repeat; every endpoint the clients call with GET or DELETE is, including
+`GET /fractal`, which dedupes jobs by hash. The id token is refreshed
+through `/auth/refresh` shortly before it expires, and once more if the API
+rejects it; a client that was given a password logs in again if it has no
+refresh token or the refresh fails. `wait_for` long-polls for job status
+changes, which the workers publish, rather than polling on a timer.
+
+Listings (`gallery`, `admin_gallery`, `admin_history`) are paged by cursor:
+each page's `next` and `prev` are passed back as `cursor`, and `pages`
+follows `next` through a whole listing.
+
+    with FractalClient("https://api.fractals.cab432.com/api") as client:
+        client.login("user", password)
+        job = client.generate({"width": 1920, "height": 1080, "iterations": 800})
+        print(client.wait_for(job["hash"]).get("url"))
+"""
+
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+
+# Connections each client keeps open to the API.
+POOL_SIZE = 10
+
+# Idle seconds before a pooled connection is closed (aiohttp; requests keeps
+# them until the server closes them).
+KEEPALIVE_SECONDS = 30
+
+# Attempts per request, counting the first, and the backoff between them:
+# a random wait of up to BACKOFF_SECONDS * 2**attempt, capped at MAX_BACKOFF_SECONDS.
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 10
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "DELETE"})
+# POSTs that are as safe to repeat: batch submissions dedupe by hash like GET /fractal.
+IDEMPOTENT_POSTS = frozenset({"/fractal/batch", "/fractal/status/batch"})
+
+# Parameter sets or hashes per batch request, the API's limit.
+BATCH_SIZE = 100
+
+# The id token is refreshed once it has less than this left.
+REFRESH_MARGIN_SECONDS = 60
+
+DEFAULT_TIMEOUT = 30
+
+# `wait_for` long-polls `/fractal/status/<hash>/wait` for up to WAIT_SECONDS
+# a request (the request timeout gets WAIT_GRACE_SECONDS on top), and falls
+# back to polling every POLL_INTERVAL seconds against an API without it.
+WAIT_SECONDS = 25
+WAIT_GRACE_SECONDS = 10
+POLL_INTERVAL = 5
+
+# Job statuses after which `wait_for` stops.
+FINAL_STATUSES = frozenset({"complete", "too_complex", "failed", "not_found"})
+
+# `verifyToken`'s reply to an expired or otherwise bad token; other 403s
+# (admin-only routes) are not worth a refresh.
+INVALID_TOKEN = "Invalid token."
+
+
+class ApiError(Exception):
+    """A request that failed; `status` and `body` are None if no response came back."""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def token_claims(token):
+    """The claims of a JWT, without verifying it (the API does that)."""
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def backoff(attempt, retry_after=None):
+    """Seconds to wait before retry `attempt` (0 for the first retry)."""
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _query(params):
+    """Drops unset query parameters; aiohttp also refuses booleans."""
+    return {k: str(v).lower() if isinstance(v, bool) else v for k, v in (params or {}).items() if v is not None}
+
+
+def _retryable(method, path):
+    return method in IDEMPOTENT_METHODS or (method == "POST" and path in IDEMPOTENT_POSTS)
+
+
+def _rejected(status, text):
+    return status == 401 or (status == 403 and text == INVALID_TOKEN)
+
+
+def _chunks(items, size=BATCH_SIZE):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _listing_params(limit, offset, filters, sort_by, sort_order, full=None, cursor=None):
+    return _query({**(filters or {}), "limit": limit, "offset": offset, "sortBy": sort_by,
+                   "sortOrder": sort_order, "full": full, "cursor": cursor})
+
+
+class _Tokens:
+    """Login state shared by both clients."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.username = None
+        self.password = None
+        self.id_token = None
+        self.refresh_token = None
+        self.expires_at = 0.0
+        self.claims = {}
+        # Status and wait requests made, for measuring how many a job costs.
+        self.status_requests = 0
+        self._long_poll = True
+
+    @property
+    def logged_in(self):
+        return self.id_token is not None
+
+    @property
+    def role(self):
+        return "admin" if "admin" in self.claims.get("cognito:groups", []) else "user"
+
+    def logout(self):
+        self.password = None
+        self.id_token = None
+        self.refresh_token = None
+        self.expires_at = 0.0
+        self.claims = {}
+
+    def _store(self, username, data, refreshed=False):
+        """Takes the tokens from a login or MFA response, or a refresh one (which keeps the refresh token)."""
+        self.username = username
+        self.id_token = data["idToken"]
+        if not refreshed:
+            self.refresh_token = data.get("refreshToken")
+        self.claims = token_claims(self.id_token)
+        self.expires_at = float(self.claims.get("exp") or time.time() + float(data.get("expiresIn") or 3600))
+
+    def _stale(self):
+        return self.id_token is not None and time.time() > self.expires_at - REFRESH_MARGIN_SECONDS
+
+    def _can_renew(self):
+        return self.username is not None and (self.refresh_token is not None or self.password is not None)
+
+    def _headers(self, auth):
+        return {"Authorization": f"Bearer {self.id_token}"} if auth and self.id_token else {}
+
+    def _url(self, path):
+        return f"{self.base_url}{path}"
+
+
+class FractalClient(_Tokens):
+    """Blocking client over one pooled `requests.Session`; safe to share between threads.
+
+    Pass `session` to share a connection pool between clients for different users.
+    """
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT, session=None):
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError as error:
+            raise RuntimeError("FractalClient needs requests: pip install requests") from error
+        super().__init__(base_url, timeout)
+        self._requests = requests
+        self._owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self._renewing = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
+
+    def _send(self, method, path, params, body, auth, timeout):
+        errors = (self._requests.ConnectionError, self._requests.Timeout)
+        renewed = False
+        attempt = 0
+        while True:
+            if auth and self._stale() and self._can_renew():
+                self._renew(self.id_token)
+            token = self.id_token
+            try:
+                r = self.session.request(method, self._url(path), params=_query(params), json=body,
+                                         headers=self._headers(auth), timeout=timeout or self.timeout)
+            except errors as error:
+                if not _retryable(method, path) or attempt + 1 >= MAX_ATTEMPTS:
+                    raise ApiError(f"{method} {path} failed: {error}") from error
+                time.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            if auth and not renewed and _rejected(r.status_code, r.text) and self._can_renew():
+                renewed = True
+                self._renew(token)
+                continue
+            if r.status_code in RETRY_STATUSES and _retryable(method, path) and attempt + 1 < MAX_ATTEMPTS:
+                time.sleep(backoff(attempt, r.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            data = _parse(r.text)
+            if r.status_code >= 400:
+                raise ApiError(f"{method} {path} failed with HTTP {r.status_code}: {r.text}", r.status_code, data)
+            return r.status_code, data
+
+    def _renew(self, token):
+        """Refreshes `token`, unless another thread already replaced it."""
+        with self._renewing:
+            if self.id_token != token:
+                return
+            if self.refresh_token is not None:
+                try:
+                    _, data = self._send("POST", "/auth/refresh", None,
+                                         {"username": self.username, "refreshToken": self.refresh_token}, False, None)
+                    self._store(self.username, data, refreshed=True)
+                    return
+                except ApiError:
+                    if self.password is None:
+                        raise
+            if self.password is None:
+                raise ApiError("Session expired; log in again.", 401)
+            self._login(self.username, self.password)
+
+    def _login(self, username, password):
+        status, data = self._send("POST", "/auth/login", None, {"username": username, "password": password}, False, None)
+        if status == 200:
+            self._store(username, data)
+        return data
+
+    def login(self, username, password, remember_password=False):
+        """Logs in; returns the response, a `challengeName` one if an emailed MFA code is needed.
+
+        With `remember_password` the client can log in again by itself if
+        its refresh token stops working.
+        """
+        data = self._login(username, password)
+        self.password = password if remember_password else None
+        return data
+
+    def confirm_mfa(self, username, mfa_code, session):
+        _, data = self._send("POST", "/auth/confirm-mfa", None,
+                             {"username": username, "mfaCode": mfa_code, "session": session}, False, None)
+        self._store(username, data)
+        return data
+
+    def signup(self, username, email, password):
+        return self._send("POST", "/auth/signup", None, {"username": username, "email": email, "password": password},
+                          False, None)[1]
+
+    def confirm_signup(self, username, confirmation_code):
+        return self._send("POST", "/auth/confirm", None, {"username": username, "confirmationCode": confirmation_code},
+                          False, None)[1]
+
+    def generate(self, params, timeout=None):
+        """Submits a job (`GET /fractal`); returns `{"hash", "status", "message"}`, plus `url` if complete."""
+        return self._send("GET", "/fractal", params, None, True, timeout)[1]
+
+    def status(self, fractal_hash):
+        self.status_requests += 1
+        return self._send("GET", f"/fractal/status/{fractal_hash}", None, None, True, None)[1]
+
+    def wait(self, fractal_hash, since=None, timeout=WAIT_SECONDS):
+        """The job's status response once its status is not `since`, or unchanged after `timeout` seconds."""
+        self.status_requests += 1
+        return self._send("GET", f"/fractal/status/{fractal_hash}/wait", {"since": since, "timeout": timeout},
+                          None, True, timeout + WAIT_GRACE_SECONDS)[1]
+
+    def wait_for(self, fractal_hash, since=None, poll_interval=POLL_INTERVAL, on_update=None):
+        """Waits for a job's final status and returns that status response.
+
+        The API answers a long-poll on every status change, so this makes
+        one request per change (or per `WAIT_SECONDS` without one); an API
+        without the wait endpoint is polled every `poll_interval` seconds.
+        Pass the status `generate` returned as `since` to skip asking for it
+        again. `on_update` is called with every response before the final one.
+        """
+        while True:
+            if self._long_poll:
+                try:
+                    data = self.wait(fractal_hash, since)
+                except ApiError as error:
+                    if error.status != 404:
+                        raise
+                    self._long_poll = False
+                    continue
+            else:
+                data = self.status(fractal_hash)
+            if data.get("status") in FINAL_STATUSES:
+                return data
+            if on_update:
+                on_update(data)
+            if not self._long_poll:
+                time.sleep(poll_interval)
+            since = data.get("status")
+
+    def generate_batch(self, params_list, timeout=None):
+        """`generate` for many parameter sets; returns the answer for each, in order.
+
+        Sent `BATCH_SIZE` at a time; the API queues each distinct new
+        fractal once, however often it appears.
+        """
+        results = []
+        for chunk in _chunks(list(params_list)):
+            body = {"fractals": [_query(params) for params in chunk]}
+            results.extend(self._send("POST", "/fractal/batch", None, body, True, timeout)[1]["results"])
+        return results
+
+    def status_batch(self, hashes):
+        """`status` for many jobs: `{hash: status response}`."""
+        self.status_requests += 1
+        statuses = {}
+        for chunk in _chunks(list(hashes)):
+            statuses.update(self._send("POST", "/fractal/status/batch", None, {"hashes": chunk}, True, None)[1]["statuses"])
+        return statuses
+
+    def wait_for_batch(self, hashes, poll_interval=POLL_INTERVAL, on_update=None):
+        """Polls `status_batch` until every job is final; returns `{hash: final status response}`.
+
+        `on_update` is called with the responses of unfinished jobs after each poll.
+        """
+        pending = set(hashes)
+        final = {}
+        while True:
+            statuses = self.status_batch(pending)
+            final.update({h: data for h, data in statuses.items() if data.get("status") in FINAL_STATUSES})
+            pending -= final.keys()
+            if not pending:
+                return final
+            if on_update:
+                on_update({h: statuses[h] for h in pending})
+            time.sleep(poll_interval)
+
+    def gallery(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, full=None, cursor=None):
+        return self._send("GET", "/gallery", _listing_params(limit, offset, filters, sort_by, sort_order, full, cursor),
+                          None, True, None)[1]
+
+    def admin_gallery(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, full=None,
+                      cursor=None):
+        return self._send("GET", "/admin/gallery",
+                          _listing_params(limit, offset, filters, sort_by, sort_order, full, cursor), None, True, None)[1]
+
+    def admin_history(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, cursor=None):
+        return self._send("GET", "/admin/history",
+                          _listing_params(limit, offset, filters, sort_by, sort_order, None, cursor), None, True, None)[1]
+
+    def pages(self, listing, **kwargs):
+        """Yields each page of `listing` (e.g. `client.gallery`), following `next` to the end.
+
+        `kwargs` are the listing's arguments, applied to every page; the
+        cursor keeps the first page's sort.
+        """
+        while True:
+            page = listing(**kwargs)
+            yield page
+            if not page.get("next"):
+                return
+            kwargs = {**kwargs, "offset": None, "cursor": page["next"]}
+
+    def gallery_image(self, gallery_id):
+        """`{"url", "tilesUrl"}` of a gallery entry's full image."""
+        return self._send("GET", f"/gallery/{gallery_id}/image", None, None, True, None)[1]
+
+    def delete_gallery_entry(self, gallery_id):
+        return self._send("DELETE", f"/gallery/{gallery_id}", None, None, True, None)[1]
+
+
+class AsyncFractalClient(_Tokens):
+    """`FractalClient` for asyncio, over one pooled `aiohttp.ClientSession`.
+
+    Create it inside a running event loop; pass `session` to share a
+    connection pool between clients for different users.
+    """
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT, session=None):
+        try:
+            import aiohttp
+        except ImportError as error:
+            raise RuntimeError("AsyncFractalClient needs aiohttp: pip install aiohttp") from error
+        super().__init__(base_url, timeout)
+        self._aiohttp = aiohttp
+        self._owns_session = session is None
+        if session is None:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=KEEPALIVE_SECONDS))
+        self.session = session
+        self._renewing = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session:
+            await self.session.close()
+
+    async def _send(self, method, path, params, body, auth, timeout):
+        errors = (self._aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        renewed = False
+        attempt = 0
+        while True:
+            if auth and self._stale() and self._can_renew():
+                await self._renew(self.id_token)
+            token = self.id_token
+            try:
+                async with self.session.request(method, self._url(path), params=_query(params), json=body,
+                                                headers=self._headers(auth),
+                                                timeout=self._aiohttp.ClientTimeout(total=timeout or self.timeout)) as r:
+                    status, text, retry_after = r.status, await r.text(), r.headers.get("Retry-After")
+            except errors as error:
+                if not _retryable(method, path) or attempt + 1 >= MAX_ATTEMPTS:
+                    raise ApiError(f"{method} {path} failed: {error!r}") from error
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            if auth and not renewed and _rejected(status, text) and self._can_renew():
+                renewed = True
+                await self._renew(token)
+                continue
+            if status in RETRY_STATUSES and _retryable(method, path) and attempt + 1 < MAX_ATTEMPTS:
+                await asyncio.sleep(backoff(attempt, retry_after))
+                attempt += 1
+                continue
+            data = _parse(text)
+            if status >= 400:
+                raise ApiError(f"{method} {path} failed with HTTP {status}: {text}", status, data)
+            return status, data
+
+    async def _renew(self, token):
+        async with self._renewing:
+            if self.id_token != token:
+                return
+            if self.refresh_token is not None:
+                try:
+                    _, data = await self._send("POST", "/auth/refresh", None,
+                                               {"username": self.username, "refreshToken": self.refresh_token},
+                                               False, None)
+                    self._store(self.username, data, refreshed=True)
+                    return
+                except ApiError:
+                    if self.password is None:
+                        raise
+            if self.password is None:
+                raise ApiError("Session expired; log in again.", 401)
+            await self._login(self.username, self.password)
+
+    async def _login(self, username, password):
+        status, data = await self._send("POST", "/auth/login", None, {"username": username, "password": password},
+                                        False, None)
+        if status == 200:
+            self._store(username, data)
+        return data
+
+    async def login(self, username, password, remember_password=False):
+        data = await self._login(username, password)
+        self.password = password if remember_password else None
+        return data
+
+    async def confirm_mfa(self, username, mfa_code, session):
+        _, data = await self._send("POST", "/auth/confirm-mfa", None,
+                                   {"username": username, "mfaCode": mfa_code, "session": session}, False, None)
+        self._store(username, data)
+        return data
+
+    async def signup(self, username, email, password):
+        return (await self._send("POST", "/auth/signup", None,
+                                 {"username": username, "email": email, "password": password}, False, None))[1]
+
+    async def confirm_signup(self, username, confirmation_code):
+        return (await self._send("POST", "/auth/confirm", None,
+                                 {"username": username, "confirmationCode": confirmation_code}, False, None))[1]
+
+    async def generate(self, params, timeout=None):
+        return (await self._send("GET", "/fractal", params, None, True, timeout))[1]
+
+    async def status(self, fractal_hash):
+        self.status_requests += 1
+        return (await self._send("GET", f"/fractal/status/{fractal_hash}", None, None, True, None))[1]
+
+    async def wait(self, fractal_hash, since=None, timeout=WAIT_SECONDS):
+        self.status_requests += 1
+        return (await self._send("GET", f"/fractal/status/{fractal_hash}/wait", {"since": since, "timeout": timeout},
+                                 None, True, timeout + WAIT_GRACE_SECONDS))[1]
+
+    async def wait_for(self, fractal_hash, since=None, poll_interval=POLL_INTERVAL, on_update=None):
+        while True:
+            if self._long_poll:
+                try:
+                    data = await self.wait(fractal_hash, since)
+                except ApiError as error:
+                    if error.status != 404:
+                        raise
+                    self._long_poll = False
+                    continue
+            else:
+                data = await self.status(fractal_hash)
+            if data.get("status") in FINAL_STATUSES:
+                return data
+            if on_update:
+                on_update(data)
+            if not self._long_poll:
+                await asyncio.sleep(poll_interval)
+            since = data.get("status")
+
+    async def generate_batch(self, params_list, timeout=None):
+        results = []
+        for chunk in _chunks(list(params_list)):
+            body = {"fractals": [_query(params) for params in chunk]}
+            results.extend((await self._send("POST", "/fractal/batch", None, body, True, timeout))[1]["results"])
+        return results
+
+    async def status_batch(self, hashes):
+        self.status_requests += 1
+        replies = await asyncio.gather(*[self._send("POST", "/fractal/status/batch", None, {"hashes": chunk}, True, None)
+                                         for chunk in _chunks(list(hashes))])
+        return {h: data for _, reply in replies for h, data in reply["statuses"].items()}
+
+    async def wait_for_batch(self, hashes, poll_interval=POLL_INTERVAL, on_update=None):
+        pending = set(hashes)
+        final = {}
+        while True:
+            statuses = await self.status_batch(pending)
+            final.update({h: data for h, data in statuses.items() if data.get("status") in FINAL_STATUSES})
+            pending -= final.keys()
+            if not pending:
+                return final
+            if on_update:
+                on_update({h: statuses[h] for h in pending})
+            await asyncio.sleep(poll_interval)
+
+    async def gallery(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, full=None,
+                      cursor=None):
+        return (await self._send("GET", "/gallery",
+                                 _listing_params(limit, offset, filters, sort_by, sort_order, full, cursor),
+                                 None, True, None))[1]
+
+    async def admin_gallery(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, full=None,
+                            cursor=None):
+        return (await self._send("GET", "/admin/gallery",
+                                 _listing_params(limit, offset, filters, sort_by, sort_order, full, cursor),
+                                 None, True, None))[1]
+
+    async def admin_history(self, limit=None, offset=None, filters=None, sort_by=None, sort_order=None, cursor=None):
+        return (await self._send("GET", "/admin/history",
+                                 _listing_params(limit, offset, filters, sort_by, sort_order, None, cursor),
+                                 None, True, None))[1]
+
+    async def pages(self, listing, **kwargs):
+        while True:
+            page = await listing(**kwargs)
+            yield page
+            if not page.get("next"):
+                return
+            kwargs = {**kwargs, "offset": None, "cursor": page["next"]}
+
+    async def gallery_image(self, gallery_id):
+        return (await self._send("GET", f"/gallery/{gallery_id}/image", None, None, True, None))[1]
+
+    async def delete_gallery_entry(self, gallery_id):
+        return (await self._send("DELETE", f"/gallery/{gallery_id}", None, None, True, None))[1]
@@ -0,0 +1,67 @@
+"""NumPy Julia-set engine that renders the same images as `fractalGenerationService.js`."""
+
+from .adaptive import render_mu_adaptive, within_error_budget
+from .colour import COLOUR_SCHEMES, colour_table, colourise
+from .compare import image_diff
+from .cost import CostEstimate, CostModel, probe_cost
+from .deepzoom import delta_grid, escape_time_perturbed, is_deep_zoom
+from .encodings import ENCODINGS, encode_image, resolve_encoding
+from .iterations import decode_iterations, encode_iterations, geometry_hash
+from .params import FractalParams
+from .png import decode_png, encode_png, encode_png_stream
+from .progressive import progressive_passes, render_progressive
+from .pyramid import build_pyramid
+from .queues import MemoryQueue, SqsQueue
+from .render import complex_grid, escape_time, render_mu, render_png, render_rgba
+from .stores import MemoryStore, S3Store
+from .streaming import StreamedRender
+from .sweep import Sweep, encode_animation, sweep_params
+from .tilecache import TileCache, render_mu_cached
+from .tiled import render_tiled, tile_grid
+from .worker import Worker
+
+__all__ = [
+    "COLOUR_SCHEMES",
+    "CostEstimate",
+    "CostModel",
+    "ENCODINGS",
+    "FractalParams",
+    "MemoryQueue",
+    "MemoryStore",
+    "S3Store",
+    "SqsQueue",
+    "StreamedRender",
+    "Sweep",
+    "TileCache",
+    "Worker",
+    "build_pyramid",
+    "colour_table",
+    "colourise",
+    "complex_grid",
+    "decode_iterations",
+    "decode_png",
+    "delta_grid",
+    "encode_image",
+    "encode_iterations",
+    "encode_png",
+    "encode_animation",
+    "encode_png_stream",
+    "escape_time",
+    "escape_time_perturbed",
+    "geometry_hash",
+    "image_diff",
+    "is_deep_zoom",
+    "probe_cost",
+    "progressive_passes",
+    "render_mu",
+    "render_mu_adaptive",
+    "render_mu_cached",
+    "render_png",
+    "render_progressive",
+    "render_rgba",
+    "render_tiled",
+    "resolve_encoding",
+    "sweep_params",
+    "tile_grid",
+    "within_error_budget",
+]
@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+import time
+
+from .adaptive import render_mu_adaptive
+from .cli_args import add_param_arguments, params_from_args
+from .colour import colourise
+from .compare import image_diff
+from .encodings import DEFAULT_COMPRESS_LEVEL, ENCODINGS, encode_image, extension, resolve_encoding
+from .kernels import KERNELS
+from .png import decode_png
+from .progressive import PROGRESSIVE_STRIDES, render_progressive
+from .queues import SqsQueue
+from .render import render_rgba
+from .stores import S3Store
+from .sweep import KEYFRAME_PIXELS, Sweep, encode_animation, sweep_params
+from .tilecache import DEFAULT_MAX_TILES
+from .tiled import render_tiled
+from .worker import PYRAMIDS, SHORT_LANE_SECONDS, ApiReporter, Worker
+
+
+def render_command(args):
+    params = params_from_args(args)
+    encoding = resolve_encoding(args.encoding, params.colour_scheme)
+    start = time.perf_counter()
+    if args.max_time is not None:
+        mu, stride = render_progressive(params, max_time=args.max_time, kernel=args.kernel)
+        if mu is None:
+            print(f"Not even a 1/{PROGRESSIVE_STRIDES[0]} preview finished within {args.max_time}s.")
+            return 1
+        if stride != 1:
+            print(f"Deadline reached; image refined to 1/{stride} resolution.")
+        rgba = colourise(mu, params.max_iterations, params.colour_scheme)
+    elif args.method == "adaptive":
+        mu, evaluated = render_mu_adaptive(params, kernel=args.kernel)
+        print(f"Iterated {evaluated / mu.size:.0%} of pixels.")
+        rgba = colourise(mu, params.max_iterations, params.colour_scheme)
+    elif args.workers:
+        rgba = render_tiled(params, workers=args.workers, kernel=args.kernel)
+    else:
+        rgba = render_rgba(params, kernel=args.kernel)
+    with open(args.output, "wb") as f:
+        f.write(encode_image(rgba, encoding, args.compress_level))
+    print(f"Rendered {params.width}x{params.height} in {time.perf_counter() - start:.2f}s -> {args.output}")
+
+
+def compare_command(args):
+    params = params_from_args(args)
+    with open(args.image, "rb") as f:
+        actual = decode_png(f.read())
+    expected = render_rgba(params)
+    # RGB and greyscale PNGs keep the first three channels, or just the first.
+    expected = expected[..., :actual.shape[-1]]
+    result = image_diff(expected, actual, tolerance=args.tolerance)
+    print(f"{result['mismatched']} of {result['pixels']} pixels differ "
+          f"(max channel delta {result['max_delta']:.0f}).")
+    return 1 if result["mismatched"] else 0
+
+
+def sweep_command(args):
+    start = params_from_args(args)
+    end = start.with_changes(**{field: value for field, value in (
+        ("c_real", args.to_real), ("c_imag", args.to_imag), ("scale", args.to_scale),
+        ("offset_x", args.to_offsetX), ("offset_y", args.to_offsetY), ("max_iterations", args.to_iterations),
+    ) if value is not None})
+    encoding = resolve_encoding(args.encoding, start.colour_scheme)
+    frames = sweep_params(start, end, args.frames)
+    sweep = Sweep(frames, workers=args.workers, keyframe_pixels=KEYFRAME_PIXELS if args.approximate else 0,
+                  kernel=args.kernel)
+    os.makedirs(args.output_dir, exist_ok=True)
+    animation = []
+    started = time.perf_counter()
+    for index, (frame, mu) in enumerate(zip(frames, sweep)):
+        rgba = colourise(mu, frame.max_iterations, frame.colour_scheme)
+        with open(os.path.join(args.output_dir, f"frame_{index:05d}.{extension(encoding)}"), "wb") as f:
+            f.write(encode_image(rgba, encoding, args.compress_level))
+        if args.animation:
+            animation.append(rgba)
+    if args.animation:
+        try:
+            data = encode_animation(animation, "webp" if args.animation.endswith(".webp") else "gif", args.fps)
+        except RuntimeError as error:
+            print(error)
+            return 1
+        with open(args.animation, "wb") as f:
+            f.write(data)
+    stats = sweep.stats()
+    print(f"Rendered {len(frames)} frames in {time.perf_counter() - started:.2f}s -> {args.output_dir} "
+          f"({stats['computed_per_pixel']:.2f} points iterated per frame pixel).")
+    return 0
+
+
+def worker_command(args):
+    if not args.queue_url:
+        print("A queue URL is required (--queue-url or SQS_QUEUE_URL).")
+        return 1
+    try:
+        queue = SqsQueue(args.queue_url, region=args.region)
+        store = S3Store(args.bucket, region=args.region, endpoint_url=args.s3_endpoint_url) if args.bucket else None
+    except RuntimeError as error:
+        print(error)
+        return 1
+    reporter = ApiReporter(args.api_url, args.api_key) if args.api_url and args.api_key else None
+    if store is None or reporter is None:
+        print("Warning: without --bucket and --api-url/--api-key, images are not stored or reported.")
+    worker = Worker(queue, store, reporter, workers=args.workers, max_time=args.max_time,
+                    schedule=not args.fifo, short_lane_seconds=args.short_lane_seconds,
+                    long_slots=args.long_slots, stream=not args.no_stream, encoding=args.encoding,
+                    compress_level=args.compress_level, pyramid=args.pyramid,
+                    tile_cache_tiles=args.tile_cache_tiles)
+    print(f"Worker polling {args.queue_url} with {worker.workers} processes.")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    print(worker.stats)
+    print(worker.tile_cache_stats())
+    return 0
+
+
+def add_encoding_arguments(parser, default):
+    parser.add_argument("--encoding", choices=ENCODINGS, default=default,
+                        help="Image format; 'auto' picks greyscale PNG for the greyscale scheme, RGB PNG otherwise.")
+    parser.add_argument("--compress-level", type=int, choices=range(10), default=DEFAULT_COMPRESS_LEVEL,
+                        metavar="0-9", help="zlib level (WebP effort on the same scale).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fractal_engine", description="Offline Julia-set renderer.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="Render a fractal to a PNG file.")
+    add_param_arguments(render)
+    render.add_argument("-o", "--output", default="fractal.png")
+    render.add_argument("--workers", type=int, help="Render tiles across this many processes.")
+    render.add_argument("--max-time", type=float,
+                        help="Render progressively and stop refining after this many seconds.")
+    render.add_argument("--method", choices=["brute", "adaptive"], default="brute",
+                        help="'adaptive' fills uniform tiles from their borders (approximate).")
+    render.add_argument("--kernel", choices=KERNELS, default="polar",
+                        help="'auto' uses the algebraic fast path for integer powers.")
+    add_encoding_arguments(render, default="rgba")
+    render.set_defaults(handler=render_command)
+
+    compare = commands.add_parser("compare", help="Diff a worker PNG against the engine's render.")
+    add_param_arguments(compare)
+    compare.add_argument("image")
+    compare.add_argument("--tolerance", type=int, default=0, help="Allowed per-channel delta.")
+    compare.set_defaults(handler=compare_command)
+
+    sweep = commands.add_parser("sweep", help="Render the frames of a sweep from one view to another.")
+    add_param_arguments(sweep)
+    sweep.add_argument("--frames", type=int, default=30)
+    sweep.add_argument("--to-real", type=float, help="Final c_real (default: unchanged).")
+    sweep.add_argument("--to-imag", type=float, help="Final c_imag (default: unchanged).")
+    sweep.add_argument("--to-scale", type=float, help="Final scale, reached geometrically (default: unchanged).")
+    sweep.add_argument("--to-offsetX", type=float, help="Final offsetX (default: unchanged).")
+    sweep.add_argument("--to-offsetY", type=float, help="Final offsetY (default: unchanged).")
+    sweep.add_argument("--to-iterations", type=int, help="Final iterations (default: unchanged).")
+    sweep.add_argument("-o", "--output-dir", default="frames")
+    sweep.add_argument("--animation", help="Also write the frames as an animated .gif or .webp (needs Pillow).")
+    sweep.add_argument("--fps", type=float, default=25)
+    sweep.add_argument("--workers", type=int, help="Render across this many processes (default: one per core).")
+    sweep.add_argument("--approximate", action="store_true",
+                       help="Sample pan/zoom frames from shared keyframes: faster, but pixels can move by "
+                            "up to half a pixel.")
+    sweep.add_argument("--kernel", choices=KERNELS, default="polar",
+                       help="'auto' uses the algebraic fast path for integer powers.")
+    add_encoding_arguments(sweep, default="rgba")
+    sweep.set_defaults(handler=sweep_command)
+
+    worker = commands.add_parser("worker", help="Render queued jobs across a process pool.")
+    worker.add_argument("--queue-url", default=os.environ.get("SQS_QUEUE_URL"))
+    worker.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    worker.add_argument("--bucket", default=os.environ.get("S3_BUCKET_NAME"))
+    worker.add_argument("--s3-endpoint-url", default=os.environ.get("S3_ENDPOINT_URL"),
+                        help="S3-compatible endpoint to store to instead of AWS, e.g. a local MinIO.")
+    worker.add_argument("--api-url", default=os.environ.get("FRACTAL_API_URL"),
+                        help="Base URL of the API, which records each job's status.")
+    worker.add_argument("--api-key", default=os.environ.get("FRACTAL_API_KEY"),
+                        help="The x-api-key the API accepts (the DLQ handler's key).")
+    worker.add_argument("--workers", type=int, help="Pool size (default: one per core).")
+    worker.add_argument("--max-time", type=float, default=120,
+                        help="Seconds before a render is returned degraded or marked too complex.")
+    worker.add_argument("--fifo", action="store_true",
+                        help="Start renders in arrival order instead of by predicted cost.")
+    worker.add_argument("--short-lane-seconds", type=float, default=SHORT_LANE_SECONDS,
+                        help="Jobs predicted to take longer go in the long lane.")
+    worker.add_argument("--long-slots", type=int,
+                        help="Processes long-lane jobs may occupy at once (default: half the pool).")
+    worker.add_argument("--no-stream", action="store_true",
+                        help="Encode each image whole and upload it after the render.")
+    worker.add_argument("--pyramid", choices=PYRAMIDS, default="tiles",
+                        help="Previews stored with each image: thumbnail and Deep Zoom tiles, thumbnail only, or none.")
+    worker.add_argument("--tile-cache-tiles", type=int, default=0,
+                        help="Tiles of reusable mu each process keeps for panned and zoomed views "
+                             f"(default: none; try {DEFAULT_MAX_TILES}).")
+    add_encoding_arguments(worker, default="auto")
+    worker.set_defaults(handler=worker_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
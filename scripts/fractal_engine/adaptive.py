@@ -0,0 +1,141 @@
+"""Mariani-Silver rendering: trace tile borders, fill uniform tiles wholesale.
+
+If every pixel on a tile's border has the same iteration count, the tile is
+assumed not to hide any boundary detail. Interior tiles (border never
+escapes) are filled with `max_iterations`, and tiles whose border escapes at
+one count are filled by interpolating `mu` from the border, so smooth
+colouring keeps its gradient. Tiles with mixed borders are split in four
+until they reach `min_size`, at which point the rest of their pixels are
+computed directly.
+
+A small feature entirely inside a uniform border gets missed, so this is an
+approximation. `within_error_budget` checks it against the brute-force
+render.
+"""
+
+import numpy as np
+
+from .colour import colourise
+from .compare import image_diff
+from .render import point_sampler, render_mu
+
+# Larger tiles miss more detail behind uniform borders on small frames (1% of
+# a 320x180 frame at 64/16) and, with splitting, evaluate no fewer pixels.
+DEFAULT_TILE_SIZE = 32
+DEFAULT_MIN_SIZE = 8
+
+# A pixel counts against the budget when any channel is off by more than
+# `tolerance`; at most `max_fraction` of the frame may do so.
+DEFAULT_ERROR_BUDGET = {"tolerance": 8, "max_fraction": 0.005}
+
+
+def _splits(length, step):
+    points = list(range(0, length - 1, step)) + [length - 1]
+    return points if len(points) > 1 else [0, 0]
+
+
+def _border_slices(tile):
+    x0, x1, y0, y1 = tile
+    return [np.s_[y0, x0:x1 + 1], np.s_[y1, x0:x1 + 1], np.s_[y0:y1 + 1, x0], np.s_[y0:y1 + 1, x1]]
+
+
+class _Frame:
+    """`mu` and iteration counts for the frame, filled in as pixels are evaluated."""
+
+    def __init__(self, params, kernel):
+        self.params = params
+        grid, self.escape = point_sampler(params, kernel)
+        real, imag = grid(params)
+        self.real_axis = real[0]
+        self.imag_axis = imag[:, 0]
+        self.mu = np.full((params.height, params.width), np.nan)
+        self.counts = np.zeros((params.height, params.width), dtype=np.int32)
+        self.known = np.zeros((params.height, params.width), dtype=bool)
+        self.evaluated = 0
+
+    def evaluate(self, regions):
+        """Computes every pixel in the given index regions not already known, in one batch."""
+        needed = np.zeros_like(self.known)
+        for region in regions:
+            needed[region] = True
+        needed &= ~self.known
+        ys, xs = np.nonzero(needed)
+        if ys.size == 0:
+            return
+        mu, counts = self.escape(self.real_axis[xs], self.imag_axis[ys], self.params, return_counts=True)
+        self.mu[ys, xs] = mu
+        self.counts[ys, xs] = counts
+        self.known[ys, xs] = True
+        self.evaluated += ys.size
+
+    def is_uniform(self, tile):
+        """The single iteration count on the tile's border, or None if it varies."""
+        edges = [self.counts[edge] for edge in _border_slices(tile)]
+        low = min(edge.min() for edge in edges)
+        high = max(edge.max() for edge in edges)
+        return low if low == high else None
+
+    def fill(self, tile, count):
+        """Fills the inside of a tile whose border has a single iteration count."""
+        x0, x1, y0, y1 = tile
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return
+        inside = np.s_[y0 + 1:y1, x0 + 1:x1]
+        if count >= self.params.max_iterations:
+            self.mu[inside] = self.params.max_iterations
+        else:
+            # Average of row-wise and column-wise linear interpolation between opposite edges.
+            tx = ((np.arange(x0 + 1, x1) - x0) / (x1 - x0))[np.newaxis, :]
+            ty = ((np.arange(y0 + 1, y1) - y0) / (y1 - y0))[:, np.newaxis]
+            left, right = self.mu[y0 + 1:y1, x0][:, np.newaxis], self.mu[y0 + 1:y1, x1][:, np.newaxis]
+            top, bottom = self.mu[y0, x0 + 1:x1][np.newaxis, :], self.mu[y1, x0 + 1:x1][np.newaxis, :]
+            self.mu[inside] = ((left + (right - left) * tx) + (top + (bottom - top) * ty)) / 2
+        self.counts[inside] = count
+        self.known[inside] = True
+
+
+def render_mu_adaptive(params, tile_size=DEFAULT_TILE_SIZE, min_size=DEFAULT_MIN_SIZE, kernel="polar"):
+    """Approximate `mu` frame via border tracing.
+
+    Returns `(mu, evaluated)`, where `evaluated` is how many pixels were
+    actually iterated (out of `width * height`).
+    """
+    frame = _Frame(params, kernel)
+    xs, ys = _splits(params.width, tile_size), _splits(params.height, tile_size)
+    tiles = [(xa, xb, ya, yb) for ya, yb in zip(ys, ys[1:]) for xa, xb in zip(xs, xs[1:])]
+
+    while tiles:
+        frame.evaluate(edge for tile in tiles for edge in _border_slices(tile))
+
+        subdivided, leaves = [], []
+        for tile in tiles:
+            x0, x1, y0, y1 = tile
+            count = frame.is_uniform(tile)
+            if count is not None:
+                frame.fill(tile, count)
+            elif x1 - x0 <= min_size or y1 - y0 <= min_size:
+                leaves.append(np.s_[y0:y1 + 1, x0:x1 + 1])
+            else:
+                xm, ym = (x0 + x1) // 2, (y0 + y1) // 2
+                subdivided += [(x0, xm, y0, ym), (xm, x1, y0, ym), (x0, xm, ym, y1), (xm, x1, ym, y1)]
+
+        frame.evaluate(leaves)
+        tiles = subdivided
+
+    return frame.mu, frame.evaluated
+
+
+def within_error_budget(params, mu, reference_mu=None, budget=DEFAULT_ERROR_BUDGET):
+    """Compares an approximate `mu` frame to the brute-force one, as colours.
+
+    Returns the `image_diff` result with an added `within_budget` flag.
+    """
+    if reference_mu is None:
+        reference_mu = render_mu(params)
+    result = image_diff(
+        colourise(reference_mu, params.max_iterations, params.colour_scheme),
+        colourise(mu, params.max_iterations, params.colour_scheme),
+        tolerance=budget["tolerance"],
+    )
+    result["within_budget"] = result["mismatched_fraction"] <= budget["max_fraction"]
+    return result
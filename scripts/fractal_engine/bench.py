@@ -0,0 +1,793 @@
+"""Benchmarks for the engine. Run with `python -m fractal_engine.bench <name>`."""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from multiprocessing import Pool
+
+import numpy as np
+
+from .adaptive import DEFAULT_ERROR_BUDGET, render_mu_adaptive, within_error_budget
+from .adaptive import DEFAULT_MIN_SIZE as ADAPTIVE_MIN_SIZE
+from .adaptive import DEFAULT_TILE_SIZE as ADAPTIVE_TILE_SIZE
+from .cli_args import add_param_arguments, params_from_args
+from .colour import COLOUR_SCHEMES, colour_table, colourise, colourise_exact
+from .compare import image_diff
+from .cost import CostModel, probe_cost
+from .deepzoom import delta_grid, escape_time_perturbed, is_deep_zoom, reference_digits
+from .encodings import encode_image
+from .iterations import decode_iterations, encode_iterations
+from .kernels import select_step
+from .params import FractalParams
+from .png import decode_png, encode_png
+from .progressive import render_progressive
+from .queues import MemoryQueue
+from .reference import render_mu_exact, render_mu_scalar
+from .render import complex_grid, escape_time, render_mu, render_png
+from .stores import PART_SIZE, MemoryStore
+from .streaming import StreamedRender
+from .sweep import KEYFRAME_PIXELS, Sweep, sweep_params
+from .tilecache import DEFAULT_TILE_SIZE as ZOOM_TILE_SIZE
+from .tilecache import TileCache, render_mu_cached
+from .tiled import DEFAULT_TILE_SIZE, render_tiled
+from .worker import MemoryReporter, Worker
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_vectorized(args):
+    """Vectorised renderer vs the per-pixel loop.
+
+    The per-pixel loop is timed on every `--sample`-th column and scaled up,
+    since a full 1920x1080 pass takes many minutes in pure Python.
+    """
+    params = params_from_args(args)
+    columns = range(0, params.width, args.sample)
+
+    mu, vector_seconds = timed(render_mu, params)
+    scalar_mu, sampled_seconds = timed(render_mu_scalar, params, columns)
+    scalar_seconds = sampled_seconds * params.width / len(columns)
+
+    sampled = np.s_[:, columns]
+    colours = image_diff(
+        colourise(scalar_mu[sampled], params.max_iterations, params.colour_scheme),
+        colourise(mu[sampled], params.max_iterations, params.colour_scheme),
+    )
+    return {
+        "params": params.as_dict(),
+        "vectorized_seconds": vector_seconds,
+        "scalar_seconds_estimated": scalar_seconds,
+        "speedup": scalar_seconds / vector_seconds,
+        "sampled_columns": len(columns),
+        "max_mu_delta": float(np.nanmax(np.abs(scalar_mu[sampled] - mu[sampled]))),
+        "pixel_mismatches": colours["mismatched"],
+    }
+
+
+def load_script_cases(count, seed, width=1920, height=1080):
+    """Parameter sets drawn from the same ranges `load_script.py` uses."""
+    rng = random.Random(seed)
+    return [
+        FractalParams(
+            width=width,
+            height=height,
+            max_iterations=rng.randint(250, 2500),
+            power=rng.randint(2, 3),
+            scale=round(rng.uniform(0.5, 1.5), 3),
+            offset_x=round(rng.uniform(-1, 1), 3),
+            offset_y=round(rng.uniform(-1, 1), 3),
+            colour_scheme=rng.choice(COLOUR_SCHEMES),
+            c_real=round(rng.uniform(-2, 2), 3),
+            c_imag=round(rng.uniform(-2, 2), 3),
+        )
+        for _ in range(count)
+    ]
+
+
+def bench_tiled(args):
+    """Wall time of the tiled renderer per worker count on load-script parameters."""
+    cases = [params_from_args(args)] + load_script_cases(args.cases, args.seed, args.width, args.height)
+    worker_counts = [int(w) for w in args.workers.split(",")] if args.workers else _default_worker_counts()
+
+    results = []
+    for params in cases:
+        first_seconds = None
+        for workers in worker_counts:
+            with Pool(workers) as pool:
+                _, seconds = timed(render_tiled, params, pool=pool, tile_size=args.tile_size, bands=args.bands)
+            first_seconds = first_seconds or seconds
+            speedup = first_seconds / seconds
+            results.append({
+                "params": params.as_dict(),
+                "workers": workers,
+                "seconds": seconds,
+                "speedup": speedup,
+                "efficiency": speedup * worker_counts[0] / workers,
+            })
+    return {"cpu_count": os.cpu_count(), "results": results}
+
+
+# Julia sets with large interiors, where the short-circuits matter most.
+INTERIOR_CASES = [
+    {"c_real": -0.2, "c_imag": 0.5},    # main cardioid: fixed-point trap
+    {"c_real": -1.0, "c_imag": 0.1},    # period-2 bulb: 2-cycle trap
+    {"c_real": -0.12, "c_imag": 0.75},  # period-3 bulb: cycle detection only
+]
+
+
+def bench_interior(args):
+    """Escape-time loop with and without the interior short-circuits."""
+    base = params_from_args(args)
+    cases = [base] + [base.with_changes(**case) for case in INTERIOR_CASES]
+
+    results = []
+    for params in cases:
+        zr, zi = complex_grid(params)
+        plain, plain_seconds = timed(escape_time, zr, zi, params, interior_checks=False)
+        checked, checked_seconds = timed(escape_time, zr, zi, params, interior_checks=True)
+        diff = image_diff(
+            colourise(plain, params.max_iterations, params.colour_scheme),
+            colourise(checked, params.max_iterations, params.colour_scheme),
+        )
+        results.append({
+            "params": params.as_dict(),
+            "interior_fraction": float(np.mean(plain >= params.max_iterations)),
+            "plain_seconds": plain_seconds,
+            "checked_seconds": checked_seconds,
+            "speedup": plain_seconds / checked_seconds,
+            "pixel_mismatches": diff["mismatched"],
+        })
+    return {"results": results}
+
+
+def kernel_throughput(power, kernel, points, steps):
+    """Raw steps/second of one kernel, on points of the unit circle with c = 0.
+
+    |z| stays 1 under z^power there, so every point is live for every step.
+    """
+    step = select_step(power, kernel)
+    theta = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    zr, zi = np.cos(theta), np.sin(theta)
+    buffers = [np.empty(points) for _ in range(3)]
+    start = time.perf_counter()
+    for _ in range(steps):
+        step(zr, zi, 0.0, 0.0, power, buffers)
+    return points * steps / (time.perf_counter() - start)
+
+
+def bench_kernels(args):
+    """Per-power iterations/second of the polar and algebraic kernels."""
+    powers = [float(p) for p in args.powers.split(",")]
+    results = []
+    for power in powers:
+        polar = kernel_throughput(power, "polar", args.points, args.steps)
+        auto = kernel_throughput(power, "auto", args.points, args.steps)
+        params = params_from_args(args).with_changes(power=power)
+        polar_frame, polar_seconds = timed(render_mu, params, kernel="polar")
+        auto_frame, auto_seconds = timed(render_mu, params, kernel="auto")
+        diff = image_diff(
+            colourise(polar_frame, params.max_iterations, params.colour_scheme),
+            colourise(auto_frame, params.max_iterations, params.colour_scheme),
+        )
+        results.append({
+            "power": power,
+            "auto_kernel": select_step(power, "auto").__name__,
+            "polar_iterations_per_second": polar,
+            "auto_iterations_per_second": auto,
+            "kernel_speedup": auto / polar,
+            "render_polar_seconds": polar_seconds,
+            "render_auto_seconds": auto_seconds,
+            "render_speedup": polar_seconds / auto_seconds,
+            "pixel_mismatches": diff["mismatched"],
+        })
+    return {"results": results}
+
+
+def _kernels_arguments(parser):
+    parser.add_argument("--powers", default="2,3,4,5,2.5", help="Comma-separated powers to measure.")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--steps", type=int, default=20)
+
+
+def bench_adaptive(args):
+    """Border-tracing renderer vs brute force, with the per-pixel error budget."""
+    params = params_from_args(args)
+    cases = [params] + [params.with_changes(**case) for case in ADAPTIVE_CASES]
+    budget = {"tolerance": args.tolerance, "max_fraction": args.max_fraction}
+
+    results = []
+    for params in cases:
+        reference, brute_seconds = timed(render_mu, params)
+        (mu, evaluated), adaptive_seconds = timed(
+            render_mu_adaptive, params, tile_size=args.tile_size, min_size=args.min_size)
+        check = within_error_budget(params, mu, reference, budget)
+        results.append({
+            "params": params.as_dict(),
+            "brute_seconds": brute_seconds,
+            "adaptive_seconds": adaptive_seconds,
+            "speedup": brute_seconds / adaptive_seconds,
+            "evaluated_fraction": evaluated / mu.size,
+            "mismatched_fraction": check["mismatched_fraction"],
+            "within_budget": check["within_budget"],
+        })
+    return {"budget": budget, "results": results}
+
+
+# Zoomed-out views at high iteration counts, where large areas are uniform.
+ADAPTIVE_CASES = [
+    {"scale": 2.5, "c_real": -0.8, "c_imag": 0.156, "max_iterations": 2500},
+    {"scale": 2, "c_real": -0.12, "c_imag": 0.75, "max_iterations": 2500},
+    {"scale": 2, "power": 3, "c_real": 0.4, "c_imag": 0.1, "max_iterations": 2500},
+]
+
+
+def _adaptive_arguments(parser):
+    parser.add_argument("--tile-size", type=int, default=ADAPTIVE_TILE_SIZE)
+    parser.add_argument("--min-size", type=int, default=ADAPTIVE_MIN_SIZE)
+    parser.add_argument("--tolerance", type=int, default=DEFAULT_ERROR_BUDGET["tolerance"])
+    parser.add_argument("--max-fraction", type=float, default=DEFAULT_ERROR_BUDGET["max_fraction"])
+
+
+# Points on Julia-set boundaries, where deep zooms keep their detail.
+DEEP_ZOOM_CASES = [
+    {"offset_x": 0.5277386661751394, "offset_y": 0.822674988762222},
+    {"c_real": -0.8, "c_imag": 0.156, "offset_x": -0.7428046730409771, "offset_y": -0.07081457402803164},
+    {"power": 3, "c_real": 0.4, "c_imag": 0.6, "offset_x": 0.7474048758770466, "offset_y": -0.4366031401892547},
+]
+
+
+def bench_deepzoom(args):
+    """Perturbation and plain doubles vs a decimal brute-force render, on small deep-zoom frames."""
+    base = params_from_args(args).with_changes(width=args.exact_width, height=args.exact_height)
+    scales = [float(scale) for scale in args.scales.split(",")]
+
+    results = []
+    for case in DEEP_ZOOM_CASES:
+        for scale in scales:
+            params = base.with_changes(scale=scale, **case)
+            exact, exact_seconds = timed(render_mu_exact, params, reference_digits(params))
+            perturbed, perturbed_seconds = timed(escape_time_perturbed, *delta_grid(params), params)
+            doubles, double_seconds = timed(escape_time, *complex_grid(params), params)
+            expected = colourise(exact, params.max_iterations, params.colour_scheme)
+            results.append({
+                "params": params.as_dict(),
+                "deep_zoom": is_deep_zoom(params),
+                "exact_seconds": exact_seconds,
+                "perturbed_seconds": perturbed_seconds,
+                "double_seconds": double_seconds,
+                "perturbed_max_mu_delta": float(np.abs(perturbed - exact).max()),
+                "perturbed_mismatched_fraction": image_diff(
+                    expected, colourise(perturbed, params.max_iterations, params.colour_scheme))["mismatched_fraction"],
+                "double_max_mu_delta": float(np.abs(doubles - exact).max()),
+                "double_mismatched_fraction": image_diff(
+                    expected, colourise(doubles, params.max_iterations, params.colour_scheme))["mismatched_fraction"],
+            })
+    return {"results": results}
+
+
+def _deepzoom_arguments(parser):
+    parser.add_argument("--scales", default="1e-5,1e-7,1e-9,1e-13,1e-20",
+                        help="Comma-separated scales to render each case at.")
+    parser.add_argument("--exact-width", type=int, default=32, help="Frame width; the brute force is slow.")
+    parser.add_argument("--exact-height", type=int, default=18)
+
+
+def bench_colour(args):
+    """Colour-table gather vs evaluating every scheme per pixel, on one `mu` frame."""
+    params = params_from_args(args)
+    mu = render_mu(params)
+
+    results = {}
+    for scheme in COLOUR_SCHEMES:
+        exact, exact_seconds = timed(colourise_exact, mu, params.max_iterations, scheme)
+        colour_table.cache_clear()
+        _, cold_seconds = timed(colourise, mu, params.max_iterations, scheme)
+        table, table_seconds = timed(colourise, mu, params.max_iterations, scheme)
+        diff = image_diff(exact, table)
+        results[scheme] = {
+            "exact_seconds": exact_seconds,
+            "table_seconds": table_seconds,
+            "table_build_seconds": cold_seconds - table_seconds,
+            "speedup": exact_seconds / table_seconds,
+            "mismatched_fraction": diff["mismatched_fraction"],
+            "max_delta": diff["max_delta"],
+        }
+    return {"params": params.as_dict(), "schemes": results}
+
+
+def bench_encode(args):
+    """Encode time, stored bytes and estimated download time per colour scheme, encoding and level."""
+    params = params_from_args(args)
+    mu = render_mu(params)
+    levels = [int(level) for level in args.levels.split(",")]
+
+    results = {}
+    for scheme in COLOUR_SCHEMES:
+        rgba = colourise(mu, params.max_iterations, scheme)
+        encodings = ["rgba", "rgb", "palette", "webp"] + (["grey"] if scheme == "greyscale" else [])
+        rows = []
+        for encoding in encodings:
+            for level in levels:
+                try:
+                    data, seconds = timed(encode_image, rgba, encoding, level)
+                except RuntimeError as error:  # WebP without Pillow
+                    rows.append({"encoding": encoding, "error": str(error)})
+                    break
+                rows.append({
+                    "encoding": encoding,
+                    "level": level,
+                    "encode_seconds": seconds,
+                    "bytes": len(data),
+                    # One presigned GET: a round trip, then the body at the given bandwidth.
+                    "download_seconds": args.rtt + len(data) * 8 / (args.bandwidth_mbps * 1e6),
+                })
+        baseline = next(row["bytes"] for row in rows if row["encoding"] == "rgba" and row["level"] == 6)
+        for row in rows:
+            if "bytes" in row:
+                row["bytes_vs_rgba_level_6"] = row["bytes"] / baseline
+        results[scheme] = rows
+    return {"params": params.as_dict(), "rtt": args.rtt, "bandwidth_mbps": args.bandwidth_mbps, "schemes": results}
+
+
+def _encode_arguments(parser):
+    parser.add_argument("--levels", default="1,6,9", help="Comma-separated compression levels.")
+    parser.add_argument("--rtt", type=float, default=0.03, help="Seconds of round trip per download.")
+    parser.add_argument("--bandwidth-mbps", type=float, default=50, help="Client download bandwidth.")
+
+
+def bench_recolour(args):
+    """Worker CPU for one fractal in every scheme: full renders vs recolouring a stored buffer."""
+    params = params_from_args(args)
+    variants = [params.with_changes(colour_scheme=scheme) for scheme in COLOUR_SCHEMES]
+
+    fresh = {}
+    render_seconds = 0
+    for variant in variants:
+        fresh[variant.colour_scheme], seconds = timed(render_png, variant)
+        render_seconds += seconds
+
+    # The first variant is rendered and its buffer stored; the others are recoloured.
+    def render_and_store():
+        mu = render_mu(params)
+        png = encode_png(colourise(mu, params.max_iterations, params.colour_scheme))
+        return encode_iterations(mu), png
+
+    def recolour(stored, variant):
+        mu = decode_iterations(stored, variant.width, variant.height)
+        return encode_png(colourise(mu, variant.max_iterations, variant.colour_scheme))
+
+    (stored, first), store_seconds = timed(render_and_store)
+    recoloured = {params.colour_scheme: first}
+    recolour_seconds = 0
+    for variant in variants[1:]:
+        recoloured[variant.colour_scheme], seconds = timed(recolour, stored, variant)
+        recolour_seconds += seconds
+
+    mismatched = [
+        image_diff(decode_png(fresh[scheme]), decode_png(recoloured[scheme]))["mismatched_fraction"]
+        for scheme in fresh
+    ]
+    with_store_seconds = store_seconds + recolour_seconds
+    return {
+        "params": params.as_dict(),
+        "variants": len(variants),
+        "render_all_seconds": render_seconds,
+        "render_once_and_recolour_seconds": with_store_seconds,
+        "cpu_saved_fraction": 1 - with_store_seconds / render_seconds,
+        "cpu_saved_per_recoloured_variant": 1 - recolour_seconds / (render_seconds * (len(variants) - 1) / len(variants)),
+        "stored_bytes": len(stored),
+        "raw_float32_bytes": params.width * params.height * 4,
+        "max_mismatched_fraction": max(mismatched),
+    }
+
+
+def zoom_pan_session(params):
+    """A browsing session: small pans, a 2x zoom in and back out, then a return visit."""
+    step_x, step_y = 2 * params.scale / params.width, 2 * params.scale / params.height
+    pan = lambda view, dx, dy: view.with_changes(
+        offset_x=view.offset_x + dx * step_x, offset_y=view.offset_y + dy * step_y)
+    views = [params]
+    views.append(pan(views[-1], params.width // 10, 0))
+    views.append(pan(views[-1], params.width // 10, 0))
+    views.append(pan(views[-1], 0, params.height // 10))
+    views.append(views[-1].with_changes(scale=params.scale / 2))
+    views.append(pan(views[-1], -params.width // 20, 0))
+    views.append(views[3].with_changes(scale=params.scale * 2))
+    views.append(params)
+    return views
+
+
+def bench_zoompan(args):
+    """Tile-cache reuse over a pan/zoom session vs rendering every view from scratch."""
+    params = params_from_args(args)
+    cache = TileCache(tile_size=args.tile_size)
+
+    steps = []
+    for view in zoom_pan_session(params):
+        before = dict(cache.counters)
+        cached, cached_seconds = timed(render_mu_cached, view, cache)
+        fresh, fresh_seconds = timed(render_mu, view)
+        diff = image_diff(colourise(fresh, view.max_iterations, view.colour_scheme),
+                          colourise(cached, view.max_iterations, view.colour_scheme))
+        steps.append({
+            "scale": view.scale,
+            "offset_x": view.offset_x,
+            "offset_y": view.offset_y,
+            "fresh_seconds": fresh_seconds,
+            "cached_seconds": cached_seconds,
+            "pixels_computed": cache.counters["pixels_computed"] - before["pixels_computed"],
+            "pixels_reused": cache.counters["pixels_reused"] - before["pixels_reused"],
+            "mismatched_fraction": diff["mismatched_fraction"],
+        })
+    fresh_total = sum(step["fresh_seconds"] for step in steps)
+    cached_total = sum(step["cached_seconds"] for step in steps)
+    return {
+        "params": params.as_dict(),
+        "steps": steps,
+        "fresh_seconds": fresh_total,
+        "cached_seconds": cached_total,
+        "speedup": fresh_total / cached_total,
+        "cache": cache.stats(),
+    }
+
+
+def sweep_cases(params, frames):
+    """A 16x zoom with rising iterations, a pan across the view, an iteration ramp and a sweep over `c`."""
+    return {
+        "zoom": sweep_params(params, params.with_changes(scale=params.scale / 16,
+                                                         max_iterations=2 * params.max_iterations), frames),
+        "pan": sweep_params(params, params.with_changes(offset_x=params.offset_x + params.scale), frames),
+        "iterations": sweep_params(params.with_changes(max_iterations=max(1, params.max_iterations // frames)),
+                                   params, frames),
+        "c": sweep_params(params, params.with_changes(c_real=params.c_real + 0.05), frames),
+    }
+
+
+def bench_sweep(args):
+    """Frame sequences through `Sweep` vs rendering every frame cold."""
+    params = params_from_args(args)
+    results = {}
+    for name, frames in sweep_cases(params, args.frames).items():
+        cold, cold_seconds = timed(lambda: [render_mu(frame) for frame in frames])
+        sweep = Sweep(frames, workers=args.workers, keyframe_pixels=args.keyframe_pixels)
+        swept, sweep_seconds = timed(list, sweep)
+        mismatched = [
+            image_diff(colourise(expected, frame.max_iterations, frame.colour_scheme),
+                       colourise(actual, frame.max_iterations, frame.colour_scheme),
+                       tolerance=args.tolerance)["mismatched_fraction"]
+            for expected, actual, frame in zip(cold, swept, frames)
+        ]
+        results[name] = {
+            "frames": len(frames),
+            "cold_seconds": cold_seconds,
+            "sweep_seconds": sweep_seconds,
+            "speedup": cold_seconds / sweep_seconds,
+            "mean_mismatched_fraction": float(np.mean(mismatched)),
+            "max_mismatched_fraction": max(mismatched),
+            "sweep": sweep.stats(),
+        }
+    return {"params": params.as_dict(), "cases": results}
+
+
+def _sweep_arguments(parser):
+    parser.add_argument("--frames", type=int, default=24)
+    parser.add_argument("--workers", type=int, help="Pool size (default: one per core).")
+    parser.add_argument("--keyframe-pixels", type=float, default=0,
+                        help="Keyframe size in frames' worth of points; 0 (the default) renders every frame exactly.")
+    parser.add_argument("--approximate", dest="keyframe_pixels", action="store_const", const=KEYFRAME_PIXELS,
+                        help=f"Sample keyframes of the default approximate size ({KEYFRAME_PIXELS}).")
+    parser.add_argument("--tolerance", type=int, default=0, help="Allowed per-channel delta.")
+
+
+def _zoompan_arguments(parser):
+    parser.add_argument("--tile-size", type=int, default=ZOOM_TILE_SIZE)
+
+
+def bench_cost(args):
+    """Cost predicted from a probe render vs the measured render time, and a refit of the model."""
+    base = params_from_args(args)
+    cases = ([base] + [base.with_changes(**case) for case in INTERIOR_CASES + ADAPTIVE_CASES]
+             + load_script_cases(args.cases, args.seed, args.width, args.height))
+    model = CostModel()
+
+    def render(params):
+        mu, _ = render_progressive(params, max_time=None)
+        return encode_png(colourise(mu, params.max_iterations, params.colour_scheme))
+
+    estimates, actual = [], []
+    for params in cases:
+        estimates.append(probe_cost(params))
+        actual.append(timed(render, params)[1])
+
+    features = np.array([[e.pixel_steps, e.loop_steps, e.pixels] for e in estimates])
+    coefficients, *_ = np.linalg.lstsq(features, np.array(actual), rcond=None)
+    fitted = CostModel(*np.clip(coefficients, 0, None))
+
+    def accuracy(model):
+        ratios = np.array([model.seconds(e) for e in estimates]) / np.array(actual)
+        return {
+            "median_ratio": float(np.median(ratios)),
+            "within_2x_fraction": float(np.mean((ratios >= 0.5) & (ratios <= 2))),
+            "worst_ratio": float(ratios[np.argmax(np.abs(np.log(ratios)))]),
+        }
+
+    return {
+        "cases": [
+            {
+                "max_iterations": params.max_iterations,
+                "power": params.power,
+                "c": [params.c_real, params.c_imag],
+                "probe_seconds": estimate.probe_seconds,
+                "predicted_seconds": model.seconds(estimate),
+                "actual_seconds": seconds,
+            }
+            for params, estimate, seconds in zip(cases, estimates, actual)
+        ],
+        "model": model.__dict__,
+        "accuracy": accuracy(model),
+        "fitted_model": fitted.__dict__,
+        "fitted_accuracy": accuracy(fitted),
+    }
+
+
+def _cost_arguments(parser):
+    parser.add_argument("--cases", type=int, default=30, help="Load-script parameter sets to render.")
+    parser.add_argument("--seed", type=int, default=2)
+
+
+def bench_lanes(args):
+    """Wait of cheap jobs queued behind an expensive one: arrival order vs cost-predicted lanes."""
+    # A slow-escaping view the interior checks cannot shortcut, at the CLI's size.
+    long_job = params_from_args(args).with_changes(max_iterations=args.long_iterations, c_real=-0.7269, c_imag=0.1889)
+    short_jobs = [params.with_changes(max_iterations=args.short_iterations)
+                  for params in load_script_cases(args.jobs, args.seed, args.width, args.height)]
+    jobs = [json.dumps({"options": params.to_options(), "hash": f"job-{i}", "historyId": i, "user": {"id": "bench"}})
+            for i, params in enumerate([long_job] + short_jobs)]
+
+    class FinishTimes:
+        def __init__(self):
+            self.times = {}
+
+        def update(self, job, status, worker_id, s3_key=None, thumbnail_key=None, tiles_key=None):
+            if status != "generating":
+                self.times[job["hash"]] = time.monotonic()
+            return {}
+
+    results = {}
+    for name, schedule in [("arrival_order", False), ("cost_lanes", True)]:
+        queue = MemoryQueue()
+        for job in jobs:
+            queue.send(job)
+        reporter = FinishTimes()
+        worker = Worker(queue, store=MemoryStore(), reporter=reporter, workers=args.workers,
+                        poll_wait=0, schedule=schedule, log=lambda message: None)
+        start = time.monotonic()
+        worker.run(stop_when_idle=True)
+        short_waits = np.array([reporter.times[f"job-{i}"] - start for i in range(1, len(jobs))])
+        results[name] = {
+            "seconds": time.monotonic() - start,
+            "long_job_seconds": reporter.times["job-0"] - start,
+            "short_job_median_seconds": float(np.median(short_waits)),
+            "short_job_p95_seconds": float(np.percentile(short_waits, 95)),
+            "cost_log": list(worker.cost_log) if schedule else None,
+        }
+    results["short_median_speedup"] = (results["arrival_order"]["short_job_median_seconds"]
+                                       / results["cost_lanes"]["short_job_median_seconds"])
+    return results
+
+
+def _lanes_arguments(parser):
+    parser.add_argument("--jobs", type=int, default=40, help="Cheap jobs queued behind the expensive one.")
+    parser.add_argument("--long-iterations", type=int, default=2500)
+    parser.add_argument("--short-iterations", type=int, default=250)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def bench_stream(args):
+    """Peak memory and upload overlap: encoding the finished frame vs streaming bands into the store."""
+    params = params_from_args(args)
+
+    def whole(store):
+        mu, _ = render_progressive(params, max_time=None)
+        return store.put("whole.png", encode_png(colourise(mu, params.max_iterations, params.colour_scheme)))
+
+    def streamed(store):
+        return store.put_stream("streamed.png", StreamedRender(params))
+
+    results = {}
+    for name, upload in [("whole_frame", whole), ("streamed", streamed)]:
+        store = MemoryStore(latency=args.latency, part_size=args.part_size)
+        _, seconds = timed(upload, store)
+        tracemalloc.start()
+        upload(MemoryStore(part_size=args.part_size))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        png = next(iter(store.objects.values()))[0]
+        results[name] = {
+            "seconds": seconds,
+            "peak_bytes": peak,
+            "png_bytes": len(png),
+            "parts": next(iter(store.parts.values()), None),
+            "image": decode_png(png),
+        }
+    results["pixel_mismatches"] = image_diff(results["whole_frame"].pop("image"),
+                                             results["streamed"].pop("image"))["mismatched"]
+    results["peak_memory_ratio"] = results["streamed"]["peak_bytes"] / results["whole_frame"]["peak_bytes"]
+    return {"params": params.as_dict(), **results}
+
+
+def _stream_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per store request.")
+    parser.add_argument("--part-size", type=int, default=PART_SIZE,
+                        help="Multipart part size; S3's minimum is 5 MiB.")
+
+
+def bench_worker(args):
+    """Jobs/minute through an in-memory queue: one message at a time vs batched and pooled."""
+    jobs = [
+        json.dumps({"options": params.to_options(), "hash": f"bench-{i}", "historyId": i, "user": {"id": "bench"}})
+        for i, params in enumerate(load_script_cases(args.jobs, args.seed, args.width, args.height))
+    ]
+    modes = {
+        # What fractal.worker.js does: receive 1, render, delete 1.
+        "one_at_a_time": {"workers": 1, "max_in_flight": 1, "receive_batch": 1, "delete_batch": 1},
+        "batched": {"workers": args.workers},
+    }
+
+    results = {}
+    for name, settings in modes.items():
+        queue = MemoryQueue(latency=args.latency)
+        for job in jobs:
+            queue.send(job)
+        queue.calls["send"] = 0
+        worker = Worker(queue, store=MemoryStore(), poll_wait=0, log=lambda message: None, **settings)
+        stats, seconds = timed(worker.run, stop_when_idle=True)
+        results[name] = {
+            "seconds": seconds,
+            "jobs_per_minute": stats["completed"] * 60 / seconds,
+            "queue_calls": dict(queue.calls),
+            "stats": stats,
+        }
+    results["speedup"] = results["batched"]["jobs_per_minute"] / results["one_at_a_time"]["jobs_per_minute"]
+    return results
+
+
+def bench_dedup(args):
+    """Renders paid for a burst of mostly identical jobs, with and without single-flight claims."""
+    rng = random.Random(args.seed)
+    preset = params_from_args(args)  # The CLI defaults unless overridden.
+    others = load_script_cases(args.jobs, args.seed, args.width, args.height)
+    jobs = []
+    for i in range(args.jobs):
+        params = preset if rng.random() < args.duplicate_fraction else others[i]
+        fractal_hash = "preset" if params is preset else f"case-{i}"
+        jobs.append(json.dumps({"options": params.to_options(), "hash": fractal_hash,
+                                "historyId": i, "user": {"id": f"user-{i}"}}))
+
+    results = {}
+    for name, single_flight in [("every_job_renders", False), ("single_flight", True)]:
+        queue = MemoryQueue(latency=args.latency)
+        for job in jobs:
+            queue.send(job)
+        reporter = MemoryReporter(leases=single_flight)
+        workers = [
+            Worker(queue, store=MemoryStore(), reporter=reporter, workers=1, poll_wait=0,
+                   recheck_seconds=0.2, coalesce=single_flight, log=lambda message: None)
+            for _ in range(args.consumers)
+        ]
+
+        def consume(worker):
+            while len(queue):
+                worker.run(stop_when_idle=True)
+                time.sleep(0.05)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=consume, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        totals = {key: sum(worker.stats[key] for worker in workers) for key in workers[0].stats}
+        results[name] = {
+            "seconds": seconds,
+            "renders": totals["rendered"],
+            "stats": totals,
+        }
+    results["jobs"] = len(jobs)
+    results["distinct_hashes"] = len({json.loads(job)["hash"] for job in jobs})
+    results["renders_saved"] = results["every_job_renders"]["renders"] - results["single_flight"]["renders"]
+    return results
+
+
+def _dedup_arguments(parser):
+    parser.add_argument("--jobs", type=int, default=30)
+    parser.add_argument("--duplicate-fraction", type=float, default=0.7,
+                        help="Share of the burst that asks for the same preset.")
+    parser.add_argument("--consumers", type=int, default=3, help="Workers sharing the queue.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Simulated seconds per queue request.")
+
+
+def _worker_arguments(parser):
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Simulated seconds per queue request.")
+
+
+def _default_worker_counts():
+    counts = [1]
+    while counts[-1] * 2 <= os.cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count())
+    return counts
+
+
+def _tiled_arguments(parser):
+    parser.add_argument("--workers", help="Comma-separated worker counts (default: 1, 2, 4, ... cores).")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    parser.add_argument("--bands", action="store_true", help="Use full-width row bands instead of square tiles.")
+    parser.add_argument("--cases", type=int, default=2, help="Extra load-script parameter sets to render.")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def _vectorized_arguments(parser):
+    parser.add_argument("--sample", type=int, default=16, help="Column stride for the per-pixel baseline.")
+
+
+def _no_arguments(parser):
+    pass
+
+
+BENCHMARKS = {
+    "adaptive": (bench_adaptive, _adaptive_arguments),
+    "colour": (bench_colour, _no_arguments),
+    "cost": (bench_cost, _cost_arguments),
+    "dedup": (bench_dedup, _dedup_arguments),
+    "deepzoom": (bench_deepzoom, _deepzoom_arguments),
+    "encode": (bench_encode, _encode_arguments),
+    "recolour": (bench_recolour, _no_arguments),
+    "stream": (bench_stream, _stream_arguments),
+    "sweep": (bench_sweep, _sweep_arguments),
+    "interior": (bench_interior, _no_arguments),
+    "kernels": (bench_kernels, _kernels_arguments),
+    "lanes": (bench_lanes, _lanes_arguments),
+    "tiled": (bench_tiled, _tiled_arguments),
+    "vectorized": (bench_vectorized, _vectorized_arguments),
+    "worker": (bench_worker, _worker_arguments),
+    "zoompan": (bench_zoompan, _zoompan_arguments),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fractal_engine.bench")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    for name, (fn, configure) in sorted(BENCHMARKS.items()):
+        sub = benchmarks.add_parser(name, help=fn.__doc__.splitlines()[0])
+        add_param_arguments(sub)
+        configure(sub)
+        sub.set_defaults(run=fn)
+    args = parser.parse_args(argv)
+
+    result = args.run(args)
+    print(json.dumps(result, indent=2, default=float))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
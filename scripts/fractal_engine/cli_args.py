@@ -0,0 +1,32 @@
+from .colour import COLOUR_SCHEMES
+from .params import FractalParams
+
+
+def add_param_arguments(parser):
+    """Adds the `GET /fractal` query parameters to an argparse parser."""
+    defaults = FractalParams()
+    parser.add_argument("--width", type=int, default=defaults.width)
+    parser.add_argument("--height", type=int, default=defaults.height)
+    parser.add_argument("--iterations", type=int, default=defaults.max_iterations)
+    parser.add_argument("--power", type=float, default=defaults.power)
+    parser.add_argument("--real", type=float, default=defaults.c_real)
+    parser.add_argument("--imag", type=float, default=defaults.c_imag)
+    parser.add_argument("--scale", type=float, default=defaults.scale)
+    parser.add_argument("--offsetX", type=float, default=defaults.offset_x)
+    parser.add_argument("--offsetY", type=float, default=defaults.offset_y)
+    parser.add_argument("--color", choices=COLOUR_SCHEMES, default=defaults.colour_scheme)
+
+
+def params_from_args(args):
+    return FractalParams(
+        width=args.width,
+        height=args.height,
+        max_iterations=args.iterations,
+        power=args.power,
+        c_real=args.real,
+        c_imag=args.imag,
+        scale=args.scale,
+        offset_x=args.offsetX,
+        offset_y=args.offsetY,
+        colour_scheme=args.color,
+    )
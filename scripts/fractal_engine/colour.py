@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+import numpy as np
+
+COLOUR_SCHEMES = ["rainbow", "greyscale", "fire", "hsl"]
+
+# Colour tables hold this many entries per iteration of `mu`, capped at
+# `COLOUR_TABLE_MAX_STEPS` + 1 entries overall. Must match COLOUR_TABLE_* in
+# fractalGenerationService.js for the two to produce the same pixels.
+COLOUR_TABLE_STEPS_PER_ITERATION = 16
+COLOUR_TABLE_MAX_STEPS = 1 << 16
+
+
+def map_range(value, start1, stop1, start2, stop2):
+    """Same arithmetic, in the same order, as `map` in fractalGenerationService.js."""
+    return start2 + (stop2 - start2) * ((value - start1) / (stop1 - start1))
+
+
+def js_round(value):
+    """`Math.round`: halves round up, unlike numpy's round-half-to-even."""
+    return np.floor(value + 0.5)
+
+
+def _hue_to_rgb(p, q, t):
+    t = np.where(t < 0, t + 1, t)
+    t = np.where(t > 1, t - 1, t)
+    return np.select(
+        [t < 1 / 6, t < 1 / 2, t < 2 / 3],
+        [p + (q - p) * 6 * t, q, p + (q - p) * (2 / 3 - t) * 6],
+        default=p,
+    )
+
+
+def hsl_to_rgb(h, s, l):
+    """Vectorised `hslToRgb`. Returns an (..., 3) float array of 0-255 values."""
+    h = np.asarray(h, dtype=np.float64) / 360
+    s = s / 100
+    l = np.asarray(l, dtype=np.float64) / 100
+    if s == 0:
+        r = g = b = l
+    else:
+        q = np.where(l < 0.5, l * (1 + s), l + s - l * s)
+        p = 2 * l - q
+        r = _hue_to_rgb(p, q, h + 1 / 3)
+        g = _hue_to_rgb(p, q, h)
+        b = _hue_to_rgb(p, q, h - 1 / 3)
+    h, r, g, b = np.broadcast_arrays(h, r, g, b)
+    return np.stack([js_round(r * 255), js_round(g * 255), js_round(b * 255)], axis=-1)
+
+
+def scheme_rgb(t, scheme):
+    """RGB for `t = sqrt(mu / maxIterations)` under one of the `getColour` schemes."""
+    if scheme == "greyscale":
+        gray = np.floor(t * 255)
+        return np.stack([gray, gray, gray], axis=-1)
+    if scheme == "rainbow":
+        return hsl_to_rgb(map_range(t, 0, 1, 0, 360), 100, 50)
+    if scheme == "fire":
+        red = np.floor(map_range(t, 0, 1, 0, 255))
+        green = np.floor(map_range(t, 0, 1, 0, 150))
+        return np.stack([red, green, np.zeros_like(t)], axis=-1)
+    return hsl_to_rgb(map_range(t, 0, 1, 0, 360), 100, map_range(t, 0, 1, 20, 70))
+
+
+def colour_table_steps(max_iterations):
+    return min(max_iterations * COLOUR_TABLE_STEPS_PER_ITERATION, COLOUR_TABLE_MAX_STEPS)
+
+
+@lru_cache(maxsize=32)
+def colour_table(scheme, max_iterations):
+    """(steps + 2, 4) uint8 RGBA table for `colourise`.
+
+    Entry `i <= steps` is the colour of `mu = i / steps * max_iterations`;
+    the last entry is black, for points that never escaped.
+    """
+    steps = colour_table_steps(max_iterations)
+    t = np.sqrt(np.arange(steps + 1) / steps)
+    table = np.zeros((steps + 2, 4), dtype=np.uint8)
+    table[:, 3] = 255
+    table[:-1, :3] = np.clip(scheme_rgb(t, scheme), 0, 255)
+    table.flags.writeable = False
+    return table
+
+
+def colourise(mu, max_iterations, scheme="rainbow"):
+    """Turns a smooth iteration buffer into RGBA with one gather from `colour_table`.
+
+    Produces the same pixels as `colourise` in fractalGenerationService.js.
+    Points with `mu >= max_iterations` are black, and so is negative `mu`
+    (possible for very fast escapes), which `getColour` used to turn into NaN
+    and `Uint8ClampedArray` then stored as 0. Any stored `mu` buffer can be
+    recoloured into another scheme this way without iterating again.
+    """
+    table = colour_table(scheme, max_iterations)
+    black = len(table) - 1
+    mu = np.asarray(mu, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        index = js_round(mu * (colour_table_steps(max_iterations) / max_iterations))
+        index[~((mu >= 0) & (mu < max_iterations))] = black
+    return table[index.astype(np.intp)]
+
+
+def colourise_exact(mu, max_iterations, scheme="rainbow"):
+    """Per-pixel colours straight from `scheme_rgb`, as the old `getColour` computed them."""
+    mu = np.asarray(mu, dtype=np.float64)
+    rgba = np.zeros(mu.shape + (4,), dtype=np.uint8)
+    rgba[..., 3] = 255
+    outside = mu < max_iterations
+    with np.errstate(invalid="ignore"):
+        t = np.sqrt(mu[outside] / max_iterations)
+        rgb = scheme_rgb(t, scheme)
+    rgba[outside, :3] = np.clip(np.nan_to_num(rgb, nan=0.0), 0, 255).astype(np.uint8)
+    return rgba
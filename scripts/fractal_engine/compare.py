@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def image_diff(expected, actual, tolerance=0):
+    """Per-pixel comparison of two images (or iteration buffers) of the same shape.
+
+    A pixel counts as mismatched when any channel differs by more than
+    `tolerance`.
+    """
+    expected = np.asarray(expected)
+    actual = np.asarray(actual)
+    if expected.shape != actual.shape:
+        raise ValueError(f"Shape mismatch: {expected.shape} vs {actual.shape}")
+
+    delta = np.abs(expected.astype(np.float64) - actual.astype(np.float64))
+    if delta.ndim == 3:
+        delta = delta.max(axis=-1)
+    mismatched = int(np.count_nonzero(delta > tolerance))
+    return {
+        "pixels": int(delta.size),
+        "mismatched": mismatched,
+        "mismatched_fraction": mismatched / delta.size if delta.size else 0.0,
+        "max_delta": float(delta.max()) if delta.size else 0.0,
+    }
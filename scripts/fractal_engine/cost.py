@@ -0,0 +1,96 @@
+"""Predicts what a render will cost before it runs, from a tiny probe render.
+
+The probe iterates the same view at about `PROBE_PIXELS` pixels and counts
+the steps each point actually takes (interior checks included). Scaled up
+to the full frame that gives two quantities the real render pays for:
+
+- `pixel_steps`: point-steps over the whole frame, the work done on live points;
+- `loop_steps`: passes of the escape-time loop, which `render_progressive`
+  runs once per 64-row chunk per pass until the chunk's slowest point is
+  done, weighted by the frame width. Each pass costs about a row of pixels
+  whatever is still live, so a frame with a little interior pays
+  `max_iterations` of them per chunk.
+
+`CostModel` turns those into seconds, per progressive pass, so a scheduler
+can tell how fine a render will get within its deadline.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from .progressive import PROGRESSIVE_STRIDES, ROWS_PER_CHUNK
+from .render import point_sampler
+
+PROBE_PIXELS = 4096
+
+
+@dataclass(frozen=True)
+class CostEstimate:
+    pixels: int
+    pixel_steps: float
+    loop_steps: float
+    probe_seconds: float
+
+
+def probe_cost(params, pixels=PROBE_PIXELS, kernel="polar"):
+    """Renders `params` at about `pixels` pixels and extrapolates its cost to full size."""
+    start = time.perf_counter()
+    factor = min(1.0, math.sqrt(pixels / (params.width * params.height)))
+    probe = params.with_changes(width=max(1, round(params.width * factor)),
+                                height=max(1, round(params.height * factor)))
+    grid, escape = point_sampler(probe, kernel)
+    _, steps = escape(*grid(probe), probe, return_steps=True)
+
+    chunks = math.ceil(params.height / ROWS_PER_CHUNK)
+    bands = np.array_split(steps, min(chunks, probe.height))
+    loop_steps = sum(int(band.max()) for band in bands) * chunks / len(bands)
+    return CostEstimate(
+        pixels=params.width * params.height,
+        pixel_steps=float(steps.mean()) * params.width * params.height,
+        loop_steps=loop_steps * len(PROGRESSIVE_STRIDES) * params.width,
+        probe_seconds=time.perf_counter() - start,
+    )
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """Seconds per unit of each cost, fitted with `python -m fractal_engine.bench cost`.
+
+    The defaults were fitted on a single core with the polar kernel, from
+    full-HD renders of the load-script ranges; refit them on other hardware.
+    """
+
+    seconds_per_step: float = 2.8e-8
+    seconds_per_loop: float = 1.0e-7
+    seconds_per_pixel: float = 1.3e-7  # colouring and PNG encoding
+
+    def seconds(self, estimate):
+        """Predicted wall time of a full-resolution render, start to PNG."""
+        return (estimate.pixel_steps * self.seconds_per_step
+                + estimate.loop_steps * self.seconds_per_loop
+                + estimate.pixels * self.seconds_per_pixel)
+
+    def pass_seconds(self, estimate, strides=PROGRESSIVE_STRIDES):
+        """Predicted time at which each progressive pass finishes, as `[(stride, seconds)]`.
+
+        Each pass computes the pixels the coarser ones skipped, so the pass at
+        stride `s` adds `1/s^2 - 1/previous^2` of the frame's point-steps.
+        """
+        elapsed = estimate.pixels * self.seconds_per_pixel
+        covered = 0.0
+        finishes = []
+        for stride in strides:
+            share = 1 / stride ** 2 - covered
+            covered = 1 / stride ** 2
+            elapsed += (share * estimate.pixel_steps * self.seconds_per_step
+                        + estimate.loop_steps / len(strides) * self.seconds_per_loop)
+            finishes.append((stride, elapsed))
+        return finishes
+
+    def finest_stride(self, estimate, max_time, strides=PROGRESSIVE_STRIDES):
+        """The finest pass predicted to finish within `max_time`, or None if none is."""
+        finished = [stride for stride, seconds in self.pass_seconds(estimate, strides) if seconds <= max_time]
+        return finished[-1] if finished else None
@@ -0,0 +1,177 @@
+"""Perturbation rendering for zooms past what doubles can resolve.
+
+Rounding errors grow along an orbit, so by the time neighbouring pixels are
+about 1e-9 apart (`scale` near 1e-6 at full-HD width) long orbits near the
+set's boundary already come out wrong in doubles, and past 1e-16 the frame
+falls apart into blocks. For such views one reference orbit `Z` is
+iterated in decimal arithmetic with enough digits for the view, from its
+centre, and every pixel only tracks its small offset `delta` from that
+orbit, in doubles:
+
+    z = Z + delta,   delta' = (Z + delta)^p - Z^p
+                            = delta * sum(C(p, k) * Z^(p - k) * delta^(k - 1) for k = 1..p)
+
+Where `|Z + delta|` drops far below `|Z|` the offset has lost its
+precision (Pauldelbrot's glitch criterion); such pixels, and pixels still
+iterating when the reference escapes, are rendered again against a new
+reference orbit started at one of them, up to `MAX_REFERENCES` orbits.
+
+The expansion needs an integer `power`; other powers are always rendered
+with doubles. The view centre (`offset_x`, `offset_y`) is taken as exact, so
+zooms can go as deep as doubles represent `scale`.
+"""
+
+import math
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+from .colour import map_range
+
+# Views whose pixel spacing is below this are rendered by perturbation. Near
+# the boundary, 1000-iteration double orbits start to disagree with exact
+# arithmetic at about this spacing (`python -m fractal_engine.bench deepzoom`).
+DEEP_ZOOM_SPACING = 2.0 ** -30
+
+# A pixel is glitched once |Z + delta| < GLITCH_TOLERANCE * |Z|.
+GLITCH_TOLERANCE = 1e-3
+
+# Reference orbits tried per render before glitched pixels are left as they are.
+MAX_REFERENCES = 32
+
+# Decimal digits kept beyond those needed to tell neighbouring pixels apart.
+GUARD_DIGITS = 12
+
+
+def pixel_spacing(params):
+    return 2 * params.scale / max(params.width, params.height)
+
+
+def is_deep_zoom(params):
+    """True if `params` should be rendered by perturbation rather than with doubles."""
+    return float(params.power).is_integer() and params.power >= 2 and pixel_spacing(params) < DEEP_ZOOM_SPACING
+
+
+def reference_digits(params):
+    return max(17, math.ceil(-math.log10(pixel_spacing(params)))) + GUARD_DIGITS
+
+
+def delta_grid(params, x0=0, x1=None, y0=0, y1=None):
+    """Offsets of pixel centres from the view centre, laid out like `complex_grid`.
+
+    Unlike absolute coordinates these stay distinct in doubles however small
+    `scale` is.
+    """
+    x1 = params.width if x1 is None else x1
+    y1 = params.height if y1 is None else y1
+    xs = np.arange(x0, x1, dtype=np.float64)
+    ys = np.arange(y0, y1, dtype=np.float64)
+    real = map_range(xs, 0, params.width, -params.scale, params.scale)
+    imag = map_range(ys, 0, params.height, -params.scale, params.scale)
+    return np.broadcast_arrays(real[np.newaxis, :], imag[:, np.newaxis])
+
+
+def _decimal_power(zr, zi, power):
+    rr, ri = Decimal(1), Decimal(0)
+    while power:
+        if power & 1:
+            rr, ri = rr * zr - ri * zi, rr * zi + ri * zr
+        zr, zi = zr * zr - zi * zi, 2 * zr * zi
+        power >>= 1
+    return rr, ri
+
+
+def reference_orbit(params, start, digits):
+    """`Z_0 .. Z_m` from `start`, an offset from the view centre, rounded to complex128.
+
+    Stops after `max_iterations` steps, or at the first value past the
+    escape radius.
+    """
+    power = int(params.power)
+    orbit = np.empty(params.max_iterations + 1, dtype=np.complex128)
+    with localcontext() as context:
+        context.prec = digits
+        zr = Decimal(params.offset_x) + Decimal(start.real)
+        zi = Decimal(params.offset_y) + Decimal(start.imag)
+        cr, ci = Decimal(params.c_real), Decimal(params.c_imag)
+        orbit[0] = complex(float(zr), float(zi))
+        for n in range(1, params.max_iterations + 1):
+            zr, zi = _decimal_power(zr, zi, power)
+            zr, zi = zr + cr, zi + ci
+            orbit[n] = complex(float(zr), float(zi))
+            if zr * zr + zi * zi > 4:
+                return orbit[:n + 1]
+    return orbit
+
+
+def _perturb(orbit, delta, params, mu, counts, steps):
+    """Iterates offsets against one reference orbit, writing finished points into the outputs.
+
+    Returns the indices (into `delta`) of the points that glitched.
+    """
+    power = int(params.power)
+    binomials = [math.comb(power, k) for k in range(power + 1)]
+    log_power = np.log(power)
+    active = np.arange(delta.size)
+    glitched = []
+    with np.errstate(all="ignore"):
+        for n in range(params.max_iterations):
+            if active.size == 0:
+                break
+            if n + 1 >= orbit.size:
+                # The reference escaped; these points need a longer one.
+                glitched.append(active)
+                break
+            reference = orbit[n]
+            factor = binomials[power]
+            for k in range(power - 1, 0, -1):
+                factor = factor * delta + binomials[k] * reference ** (power - k)
+            delta = delta * factor
+
+            z = orbit[n + 1] + delta
+            modulus = z.real * z.real + z.imag * z.imag
+            escaped = modulus > 4
+            if escaped.any():
+                mu[active[escaped]] = n + 1 - np.log(np.log(np.sqrt(modulus[escaped]))) / log_power
+                counts[active[escaped]] = n
+                steps[active[escaped]] = n + 1
+            lost = ~escaped & (modulus < GLITCH_TOLERANCE ** 2 * abs(orbit[n + 1]) ** 2)
+            if lost.any():
+                glitched.append(active[lost])
+            still = ~(escaped | lost)
+            delta, active = delta[still], active[still]
+    return np.concatenate(glitched) if glitched else active[:0]
+
+
+def escape_time_perturbed(dr, di, params, return_counts=False, return_steps=False):
+    """`escape_time` for the pixels at offsets `dr + i*di` from the view centre.
+
+    Returns what `escape_time` would with exact arithmetic; `counts` and
+    `steps` (the same here, as there are no interior checks) are added like
+    its `return_counts` and `return_steps` extras.
+    """
+    shape = np.shape(dr)
+    offsets = (np.asarray(dr, dtype=np.float64) + 1j * np.asarray(di, dtype=np.float64)).ravel()
+    mu = np.full(offsets.size, float(params.max_iterations))
+    counts = np.full(offsets.size, params.max_iterations, dtype=np.int32)
+    steps = np.full(offsets.size, params.max_iterations, dtype=np.int32)
+
+    digits = reference_digits(params)
+    centre = 0j
+    todo = np.arange(offsets.size)
+    for _ in range(MAX_REFERENCES):
+        if todo.size == 0:
+            break
+        orbit = reference_orbit(params, centre, digits)
+        results = [a[todo] for a in (mu, counts, steps)]
+        glitched = _perturb(orbit, offsets[todo] - centre, params, *results)
+        for out, result in zip((mu, counts, steps), results):
+            out[todo] = result
+        todo = todo[glitched]
+        if todo.size:
+            # The glitched point nearest their middle, so one orbit can serve most of them.
+            middle = offsets[todo].mean()
+            centre = offsets[todo[np.argmin(np.abs(offsets[todo] - middle))]]
+
+    extras = [a.reshape(shape) for a, wanted in ((counts, return_counts), (steps, return_steps)) if wanted]
+    return (mu.reshape(shape), *extras) if extras else mu.reshape(shape)
@@ -0,0 +1,86 @@
+"""Image encodings for stored fractals, smaller than the RGBA PNG the Node worker uploads.
+
+Every frame is opaque, so alpha is never needed:
+
+- `rgb`: PNG without the alpha channel;
+- `grey`: 8-bit greyscale PNG, for the `greyscale` scheme (other schemes
+  get `rgb`);
+- `palette`: indexed PNG, for frames with at most 256 distinct colours
+  (falls back to `rgb` otherwise);
+- `webp`: lossless WebP, through Pillow, which is only needed for it;
+- `rgba`: the original format.
+
+`auto` picks per scheme: `grey` for `greyscale`, `rgb` for the rest. No
+other scheme's colour table fits a palette, so `palette` only pays off for
+frames that use few of its colours.
+"""
+
+import io
+
+import numpy as np
+
+from .png import encode_png
+
+ENCODINGS = ["auto", "rgba", "rgb", "grey", "palette", "webp"]
+
+CONTENT_TYPES = {"rgba": "image/png", "rgb": "image/png", "grey": "image/png", "palette": "image/png",
+                 "webp": "image/webp"}
+
+# Encodings whose rows can be compressed band by band (see `streaming.py`).
+STREAMABLE = {"rgba": 4, "rgb": 3, "grey": 1}
+
+DEFAULT_COMPRESS_LEVEL = 6
+
+
+def resolve_encoding(encoding, scheme):
+    """The concrete encoding `encoding` means for a frame in `scheme`."""
+    if encoding == "auto":
+        return "grey" if scheme == "greyscale" else "rgb"
+    if encoding == "grey" and scheme != "greyscale":
+        return "rgb"
+    return encoding
+
+
+def extension(encoding):
+    return "webp" if encoding == "webp" else "png"
+
+
+def channels_for(rgba, encoding):
+    """The channels of an RGBA frame (or band) that `encoding` keeps."""
+    return rgba[..., :STREAMABLE[encoding]] if encoding != "grey" else rgba[..., 0]
+
+
+def encode_image(rgba, encoding, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """Encodes an opaque (height, width, 4) uint8 frame; `encoding` must be resolved.
+
+    `compress_level` is zlib's 0-9 for PNG, and picks WebP's `method`
+    (effort) on the same scale.
+    """
+    if encoding in STREAMABLE:
+        return encode_png(channels_for(rgba, encoding), compress_level)
+    if encoding == "palette":
+        return encode_palette(rgba, compress_level)
+    if encoding == "webp":
+        return encode_webp(rgba, compress_level)
+    raise ValueError(f"Unknown encoding '{encoding}'")
+
+
+def encode_palette(rgba, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """Indexed PNG of the frame, or RGB PNG if it has more than 256 colours."""
+    packed = (rgba[..., 0].astype(np.uint32) << 16) | (rgba[..., 1].astype(np.uint32) << 8) | rgba[..., 2]
+    colours, indices = np.unique(packed, return_inverse=True)
+    if colours.size > 256:
+        return encode_png(rgba[..., :3], compress_level)
+    palette = np.stack([colours >> 16, colours >> 8, colours], axis=-1).astype(np.uint8)
+    return encode_png(indices.reshape(packed.shape).astype(np.uint8), compress_level, palette=palette)
+
+
+def encode_webp(rgba, compress_level=DEFAULT_COMPRESS_LEVEL):
+    try:
+        from PIL import Image
+    except ImportError as error:
+        raise RuntimeError("WebP encoding needs Pillow: pip install Pillow") from error
+    out = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(rgba[..., :3])).save(
+        out, "WEBP", lossless=True, quality=100, method=round(compress_level * 6 / 9))
+    return out.getvalue()
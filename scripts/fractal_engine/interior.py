@@ -0,0 +1,85 @@
+"""Analytic interior tests for `z^2 + c`.
+
+When `c` lies in the main cardioid (or the period-2 bulb) of the Mandelbrot
+set, the Julia map has an attracting fixed point (or 2-cycle). Around each
+attracting point there is a disk the map sends into itself, so any orbit
+that lands in one of these disks is bounded forever and can be stopped
+early with `mu = max_iterations`.
+"""
+
+import cmath
+import math
+
+
+def in_main_cardioid(c):
+    """True when `z^2 + c` has an attracting fixed point."""
+    return abs(1 - cmath.sqrt(1 - 4 * c)) < 1
+
+
+def in_period2_bulb(c):
+    """True when `z^2 + c` has an attracting 2-cycle."""
+    return abs(c + 1) < 0.25
+
+
+def _largest_radius(contraction, limit=1.0):
+    """Largest r in (0, limit) with contraction(r) < 1, by bisection."""
+    lo, hi = 0.0, limit
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if contraction(mid) < 1:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def trap_disks(c_real, c_imag, power):
+    """`(centre, radius)` disks that only bounded orbits can enter.
+
+    Only `power == 2` is handled; other powers get no disks. Radii are halved
+    from the analytic bound so rounding error cannot carry an orbit out.
+    """
+    if power != 2:
+        return []
+    c = complex(c_real, c_imag)
+
+    if in_main_cardioid(c):
+        # f(z* + d) - z* = 2 z* d + d^2, so the disk maps into itself while |2 z*| + r < 1.
+        fixed = (1 - cmath.sqrt(1 - 4 * c)) / 2
+        return [(fixed, (1 - abs(2 * fixed)) / 2)]
+
+    if in_period2_bulb(c):
+        # With g = f o f: g(z1 + d) - z1 = lambda d + (6 z1^2 + 2c) d^2 + 4 z1 d^3 + d^4,
+        # where lambda = 4 (c + 1) is the cycle's multiplier.
+        multiplier = abs(4 * (c + 1))
+        disks = []
+        for sign in (1, -1):
+            z1 = (-1 + sign * cmath.sqrt(-3 - 4 * c)) / 2
+            a, b = abs(6 * z1 * z1 + 2 * c), abs(4 * z1)
+            radius = _largest_radius(lambda r: multiplier + a * r + b * r * r + r ** 3)
+            disks.append((z1, radius / 2))
+        return disks
+
+    return []
+
+
+# Orbits are compared against a reference point that is refreshed at
+# iterations 2^k (Brent's scheme), starting here. Points that escape at all
+# mostly do so well before this, so they never pay for the check.
+PERIODICITY_START = 64
+
+# Squared distance under which an orbit is considered to have closed a cycle.
+PERIODICITY_EPSILON_SQUARED = 1e-26
+
+
+def is_reference_iteration(n):
+    return n >= PERIODICITY_START and n & (n - 1) == 0
+
+
+def disk_tests(c_real, c_imag, power):
+    """`(centre_real, centre_imag, radius_squared)` for each trap disk."""
+    return [
+        (centre.real, centre.imag, radius * radius)
+        for centre, radius in trap_disks(c_real, c_imag, power)
+        if radius > 0 and math.isfinite(radius)
+    ]
@@ -0,0 +1,88 @@
+"""Stored smooth-iteration buffers, in the format `iterationStoreService.js` uses.
+
+A buffer is the frame's `mu` as little-endian float32, split into byte
+planes (every value's first byte, then every second byte, ...) and
+zlib-deflated. It is keyed by a hash of every job option except
+`colourScheme`. Recolouring one with `colourise` gives any scheme of the
+same fractal without iterating.
+"""
+
+import hashlib
+import json
+import math
+import zlib
+from decimal import Decimal
+
+import numpy as np
+
+FOLDER = "iterations"
+
+# Where a render cut short by its deadline keeps its buffer until it is refined.
+PARTIAL_FOLDER = f"{FOLDER}/partial"
+
+
+def geometry_hash(options):
+    """sha256 of the job `options` minus `colourScheme`, as the Node side computes it.
+
+    Takes the raw options dict from a job (not `FractalParams`), since the
+    hash depends on the exact JSON the route produced, e.g. `2` vs `2.0`.
+    """
+    geometry = {key: value for key, value in options.items() if key != "colourScheme"}
+    return hashlib.sha256(_js_json(geometry).encode()).hexdigest()
+
+
+def _js_json(value):
+    """`JSON.stringify(value)` for JSON-decoded values, numbers written as JavaScript writes them."""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{_js_json(str(key))}:{_js_json(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_js_json(item) for item in value) + "]"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _js_number(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _js_number(value):
+    """ECMAScript Number::toString: `1e-7`, `100000000000000000000`, `1e+21`, never `2.0`."""
+    if isinstance(value, int) and abs(value) <= 2 ** 53:
+        return str(value)
+    value = float(value)
+    if not math.isfinite(value):
+        return "null"
+    if value == 0:
+        return "0"
+    # repr is the shortest round-tripping decimal, as JavaScript's is.
+    _, digit_tuple, exponent = Decimal(repr(abs(value))).normalize().as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    k, n = len(digits), exponent + len(digits)
+    sign = "-" if value < 0 else ""
+    if k <= n <= 21:
+        return sign + digits + "0" * (n - k)
+    if 0 < n <= 21:
+        return sign + digits[:n] + "." + digits[n:]
+    if -6 < n <= 0:
+        return sign + "0." + "0" * -n + digits
+    mantissa = digits if k == 1 else digits[0] + "." + digits[1:]
+    return f"{sign}{mantissa}e{'+' if n > 0 else '-'}{abs(n - 1)}"
+
+
+def iterations_key(options):
+    return f"{FOLDER}/{geometry_hash(options)}.f32.z"
+
+
+def partial_iterations_key(options):
+    return f"{PARTIAL_FOLDER}/{geometry_hash(options)}.f32.z"
+
+
+def encode_iterations(mu, level=6):
+    planes = np.asarray(mu, dtype="<f4").reshape(-1).view(np.uint8).reshape(-1, 4).T
+    return zlib.compress(np.ascontiguousarray(planes).tobytes(), level)
+
+
+def decode_iterations(data, width, height):
+    """Inverse of `encode_iterations`; returns a (height, width) float64 frame."""
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    if planes.size != width * height * 4:
+        raise ValueError(f"Stored iterations hold {planes.size // 4} values, expected {width * height}")
+    values = np.ascontiguousarray(planes.reshape(4, -1).T).view("<f4")
+    return values.astype(np.float64).reshape(height, width)
@@ -0,0 +1,99 @@
+"""One step of `z -> z^power + c`, applied in place to a batch of points.
+
+`polar` is the form `iterate()` in fractalGenerationService.js uses and works
+for any power, at the cost of sqrt, atan2, pow, cos and sin per step. For
+integer powers the `algebraic` kernels get the same map from a few complex
+multiplications. They agree with `polar` to rounding error, not bit for bit,
+so `polar` stays the default wherever the output must match the JS worker.
+"""
+
+import numpy as np
+
+KERNELS = ["polar", "algebraic", "auto"]
+
+# Above this, power - 1 complex multiplications cost as much as the polar
+# form's transcendentals (see `bench kernels`), so `auto` stays polar.
+MAX_AUTO_ALGEBRAIC_POWER = 5
+
+
+def polar_step(zr, zi, cr, ci, power, buffers):
+    modulus, angle, scratch = buffers
+    np.multiply(zr, zr, out=modulus)
+    np.multiply(zi, zi, out=scratch)
+    modulus += scratch
+    np.sqrt(modulus, out=modulus)
+    np.arctan2(zi, zr, out=angle)
+    angle *= power
+    np.power(modulus, power, out=modulus)
+    np.cos(angle, out=zr)
+    zr *= modulus
+    zr += cr
+    np.sin(angle, out=zi)
+    zi *= modulus
+    zi += ci
+
+
+def square_step(zr, zi, cr, ci, power, buffers):
+    cross, real_sq, _ = buffers
+    np.multiply(zr, zi, out=cross)
+    np.multiply(zr, zr, out=real_sq)
+    np.multiply(zi, zi, out=zi)
+    np.subtract(real_sq, zi, out=zr)
+    zr += cr
+    np.add(cross, cross, out=zi)
+    zi += ci
+
+
+def cube_step(zr, zi, cr, ci, power, buffers):
+    # z^3 = zr (zr^2 - 3 zi^2) + i zi (3 zr^2 - zi^2)
+    real_sq, imag_sq, scratch = buffers
+    np.multiply(zr, zr, out=real_sq)
+    np.multiply(zi, zi, out=imag_sq)
+    np.multiply(imag_sq, 3, out=scratch)
+    np.subtract(real_sq, scratch, out=scratch)
+    zr *= scratch
+    zr += cr
+    real_sq *= 3
+    real_sq -= imag_sq
+    zi *= real_sq
+    zi += ci
+
+
+def integer_step(zr, zi, cr, ci, power, buffers):
+    # z^power by repeated multiplication: acc <- acc * z, power - 1 times.
+    acc_r, acc_i, scratch = buffers
+    np.copyto(acc_r, zr)
+    np.copyto(acc_i, zi)
+    for _ in range(int(power) - 1):
+        np.multiply(acc_r, zi, out=scratch)
+        acc_r *= zr
+        acc_r -= acc_i * zi
+        acc_i *= zr
+        acc_i += scratch
+    np.add(acc_r, cr, out=zr)
+    np.add(acc_i, ci, out=zi)
+
+
+def is_integer_power(power):
+    return float(power).is_integer() and power >= 1
+
+
+def select_step(power, kernel="polar"):
+    """The step function for `power` under the requested kernel.
+
+    `auto` uses an algebraic kernel for integer powers up to
+    `MAX_AUTO_ALGEBRAIC_POWER` and `polar` otherwise. Asking for `algebraic`
+    with a fractional power also falls back to `polar`, since there is no
+    algebraic form to use.
+    """
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown kernel {kernel!r}; expected one of {KERNELS}")
+    if kernel == "polar" or not is_integer_power(power):
+        return polar_step
+    if kernel == "auto" and power > MAX_AUTO_ALGEBRAIC_POWER:
+        return polar_step
+    if power == 2:
+        return square_step
+    if power == 3:
+        return cube_step
+    return integer_step
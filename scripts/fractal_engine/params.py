@@ -0,0 +1,58 @@
+from dataclasses import asdict, dataclass, replace
+
+
+@dataclass(frozen=True)
+class FractalParams:
+    """The parameters of a single Julia render.
+
+    Field defaults match the ones `fractal.route.js` fills in before a job is
+    queued, so a render from `FractalParams()` matches a bare `GET /fractal`.
+    """
+
+    width: int = 1920
+    height: int = 1080
+    max_iterations: int = 500
+    power: float = 2
+    c_real: float = 0.285
+    c_imag: float = 0.01
+    scale: float = 1
+    offset_x: float = 0
+    offset_y: float = 0
+    colour_scheme: str = "rainbow"
+
+    @classmethod
+    def from_options(cls, options):
+        """Builds params from the `options` object carried in an SQS job."""
+        c = options.get("c") or {}
+        return cls(
+            width=int(options.get("width", cls.width)),
+            height=int(options.get("height", cls.height)),
+            max_iterations=int(options.get("maxIterations", cls.max_iterations)),
+            power=float(options.get("power", cls.power)),
+            c_real=float(c.get("real", cls.c_real)),
+            c_imag=float(c.get("imag", cls.c_imag)),
+            scale=float(options.get("scale", cls.scale)),
+            offset_x=float(options.get("offsetX", cls.offset_x)),
+            offset_y=float(options.get("offsetY", cls.offset_y)),
+            colour_scheme=options.get("colourScheme", cls.colour_scheme),
+        )
+
+    def to_options(self):
+        """Inverse of `from_options`."""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "maxIterations": self.max_iterations,
+            "power": self.power,
+            "c": {"real": self.c_real, "imag": self.c_imag},
+            "scale": self.scale,
+            "offsetX": self.offset_x,
+            "offsetY": self.offset_y,
+            "colourScheme": self.colour_scheme,
+        }
+
+    def with_changes(self, **changes):
+        return replace(self, **changes)
+
+    def as_dict(self):
+        return asdict(self)
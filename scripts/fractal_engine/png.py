@@ -0,0 +1,147 @@
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG colour type -> samples per pixel (8-bit only).
+_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+_COLOUR_TYPES = {channels: colour_type for colour_type, channels in _CHANNELS.items()}
+_INDEXED = 3
+
+
+def _chunk(tag, data):
+    body = tag + data
+    return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+
+def encode_png(pixels, compress_level=6, palette=None):
+    """Encodes an (height, width[, channels]) uint8 array as PNG bytes.
+
+    With a `palette` of up to 256 RGB entries, `pixels` is a (height, width)
+    array of indices into it, written as an indexed-colour PNG. Rows are
+    written unfiltered; zlib does the rest.
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    height, width, channels = pixels.shape
+    colour_type = _COLOUR_TYPES[channels] if palette is None else _INDEXED
+    header = struct.pack(">IIBBBBB", width, height, 8, colour_type, 0, 0, 0)
+
+    raw = np.zeros((height, 1 + width * channels), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, width * channels)
+
+    chunks = [PNG_SIGNATURE, _chunk(b"IHDR", header)]
+    if palette is not None:
+        chunks.append(_chunk(b"PLTE", np.ascontiguousarray(palette, dtype=np.uint8).tobytes()))
+    return b"".join(chunks + [
+        _chunk(b"IDAT", zlib.compress(raw.tobytes(), compress_level)),
+        _chunk(b"IEND", b""),
+    ])
+
+
+# Compressed bytes gathered before `encode_png_stream` emits an IDAT chunk.
+IDAT_CHUNK_SIZE = 1 << 16
+
+
+def encode_png_stream(bands, width, height, channels=4, compress_level=6):
+    """Encodes PNG from an iterable of row bands, yielding bytes as they compress.
+
+    Each band is a (rows, width[, channels]) uint8 array, top to bottom, and
+    together they must cover `height` rows. Only one band's raw rows are held
+    at a time. The zlib stream is the one `encode_png` writes, just split
+    over several IDAT chunks.
+    """
+    header = struct.pack(">IIBBBBB", width, height, 8, _COLOUR_TYPES[channels], 0, 0, 0)
+    yield PNG_SIGNATURE + _chunk(b"IHDR", header)
+
+    compressor = zlib.compressobj(compress_level)
+    pending, size, rows = [], 0, 0
+    for band in bands:
+        band = np.asarray(band, dtype=np.uint8).reshape(-1, width * channels)
+        raw = np.zeros((band.shape[0], 1 + width * channels), dtype=np.uint8)
+        raw[:, 1:] = band
+        rows += band.shape[0]
+        data = compressor.compress(raw)
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= IDAT_CHUNK_SIZE:
+            yield _chunk(b"IDAT", b"".join(pending))
+            pending, size = [], 0
+    if rows != height:
+        raise ValueError(f"Bands cover {rows} rows, expected {height}")
+    pending.append(compressor.flush())
+    yield _chunk(b"IDAT", b"".join(pending)) + _chunk(b"IEND", b"")
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def _unfilter(filter_type, line, prior, bpp):
+    if filter_type == 0:
+        return line
+    if filter_type == 1:
+        cumulative = np.cumsum(line.reshape(-1, bpp).astype(np.int64), axis=0)
+        return (cumulative & 0xFF).astype(np.uint8).ravel()
+    if filter_type == 2:
+        return line + prior
+    out = line.astype(np.int32)
+    prior = prior.astype(np.int32)
+    for i in range(out.size):
+        left = out[i - bpp] if i >= bpp else 0
+        if filter_type == 3:
+            out[i] = (out[i] + ((left + prior[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            upper_left = prior[i - bpp] if i >= bpp else 0
+            out[i] = (out[i] + _paeth(left, prior[i], upper_left)) & 0xFF
+        else:
+            raise ValueError(f"Unknown PNG filter type {filter_type}")
+    return out.astype(np.uint8)
+
+
+def decode_png(data):
+    """Decodes an 8-bit, non-interlaced PNG (e.g. a worker upload) to a uint8 array.
+
+    Indexed-colour images come back as RGB.
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    pos = 8
+    idat = []
+    header = palette = None
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos:pos + 4])
+        tag = data[pos + 4:pos + 8]
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif tag == b"PLTE":
+            palette = np.frombuffer(body, dtype=np.uint8).reshape(-1, 3)
+        elif tag == b"IDAT":
+            idat.append(body)
+        elif tag == b"IEND":
+            break
+
+    width, height, depth, colour_type, _, _, interlace = header
+    if depth != 8 or interlace != 0 or colour_type not in _CHANNELS and colour_type != _INDEXED:
+        raise ValueError("Only 8-bit, non-interlaced greyscale/RGB(A)/indexed PNGs are supported")
+    channels = 1 if colour_type == _INDEXED else _CHANNELS[colour_type]
+    stride = width * channels
+
+    raw = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(height, stride + 1)
+    pixels = np.empty((height, stride), dtype=np.uint8)
+    prior = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        prior = pixels[y] = _unfilter(raw[y, 0], raw[y, 1:], prior, channels)
+    if colour_type == _INDEXED:
+        return palette[pixels]
+    return pixels.reshape(height, width, channels)
@@ -0,0 +1,77 @@
+"""Deadline-aware progressive rendering, mirroring `generateFractal`'s passes.
+
+Each pass samples every `stride`-th pixel and paints it as a stride x stride
+block anchored at its top-left corner, so a full-size (if blocky) frame is
+available after the first pass and each later pass only computes the pixels
+the coarser ones skipped. When the deadline hits, the frame as refined so far
+is returned instead of nothing.
+"""
+
+import time
+
+import numpy as np
+
+from .render import point_sampler
+
+PROGRESSIVE_STRIDES = (8, 4, 2, 1)
+
+# Pixel rows computed between deadline checks.
+ROWS_PER_CHUNK = 64
+
+
+def progressive_passes(params, deadline=None, strides=PROGRESSIVE_STRIDES, kernel="polar", resume=None):
+    """Yields `(stride, mu)` after every completed pass.
+
+    `mu` is the same full-size buffer each time, refined in place. Stops
+    early, without yielding the unfinished pass, once `time.monotonic()`
+    passes `deadline`. With `resume`, an earlier `(mu, stride)` cut short by
+    its deadline, only the passes finer than its stride are run.
+    """
+    if resume is None:
+        mu = np.full((params.height, params.width), np.nan)
+        previous = None
+    else:
+        mu, previous = np.array(resume[0], dtype=np.float64), resume[1]
+        strides = [stride for stride in strides if stride < previous]
+    for stride in strides:
+        rows_per_chunk = max(stride, ROWS_PER_CHUNK // stride * stride)
+        for y0 in range(0, params.height, rows_per_chunk):
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            y1 = min(y0 + rows_per_chunk, params.height)
+            _refine_rows(params, mu, stride, previous, y0, y1, kernel)
+        previous = stride
+        yield stride, mu
+
+
+def _refine_rows(params, mu, stride, previous, y0, y1, kernel):
+    grid, escape = point_sampler(params, kernel)
+    zr, zi = grid(params, y0=y0, y1=y1)
+    zr, zi = zr[::stride, ::stride], zi[::stride, ::stride]
+    samples = mu[y0:y1:stride, ::stride].copy()
+
+    todo = np.ones(samples.shape, dtype=bool)
+    if previous is not None:
+        ys = np.arange(y0, y1, stride)[:, np.newaxis]
+        xs = np.arange(0, params.width, stride)[np.newaxis, :]
+        todo = (ys % previous != 0) | (xs % previous != 0)
+    samples[todo] = escape(zr[todo], zi[todo], params)
+
+    blocks = np.repeat(np.repeat(samples, stride, axis=0), stride, axis=1)
+    mu[y0:y1] = blocks[:y1 - y0, :params.width]
+
+
+def render_progressive(params, max_time=120, strides=PROGRESSIVE_STRIDES, kernel="polar", resume=None):
+    """Best `mu` frame reachable within `max_time` seconds.
+
+    Returns `(mu, stride)`, where `stride` is the finest completed pass (1
+    means full resolution; parts of the frame may already be finer), or
+    `(None, None)` if even the coarsest pass did not finish - the case the
+    worker reports as `too_complex`. With `resume` (see
+    `progressive_passes`), the result is at least as fine as it.
+    """
+    deadline = time.monotonic() + max_time if max_time is not None else None
+    best = (None, None) if resume is None else tuple(resume)
+    for stride, mu in progressive_passes(params, deadline, strides, kernel, resume):
+        best = (mu, stride)
+    return best
@@ -0,0 +1,113 @@
+"""Thumbnails and Deep Zoom (DZI) tile pyramids of rendered frames.
+
+The gallery shows a thumbnail of each fractal and fetches the full image
+only when it is opened; a viewer can instead zoom through the tiles.
+Objects sit next to the full image, in the layout Deep Zoom viewers expect:
+
+- `thumbnails/<hash>.<ext>`: the frame at most `THUMBNAIL_SIZE` pixels on
+  its long side (the pyramid level that fits);
+- `fractals/<hash>.dzi`: the descriptor, with the size, tile size and format;
+- `fractals/<hash>_files/<level>/<column>_<row>.<ext>`: the tiles. Level 0
+  is a single pixel and each level doubles the one below, up to the full
+  frame at level `ceil(log2(max(width, height)))`.
+
+Levels are made by averaging 2x2 blocks of the level above, so they are
+downsampled colours rather than subsampled iterations. `pyramidService.js`
+writes the same layout for the Node worker.
+"""
+
+import math
+
+import numpy as np
+
+from .encodings import CONTENT_TYPES, DEFAULT_COMPRESS_LEVEL, encode_image, extension
+
+# Longest side of a gallery thumbnail.
+THUMBNAIL_SIZE = 480
+
+# Deep Zoom's defaults: 254-pixel tiles plus a pixel of overlap on each inner edge.
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+
+DZI_TEMPLATE = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{format}" '
+                'Overlap="{overlap}" TileSize="{tile_size}"><Size Width="{width}" Height="{height}"/></Image>\n')
+
+
+def thumbnail_key(fractal_hash, encoding="rgba"):
+    return f"thumbnails/{fractal_hash}.{extension(encoding)}"
+
+
+def tiles_key(fractal_hash):
+    """Key of the DZI descriptor; its tiles are under the same name with `_files/`."""
+    return f"fractals/{fractal_hash}.dzi"
+
+
+def tile_key(fractal_hash, level, column, row, encoding="rgba"):
+    return f"fractals/{fractal_hash}_files/{level}/{column}_{row}.{extension(encoding)}"
+
+
+def halve(rgba):
+    """The frame at half size (rounded up), each pixel the mean of a 2x2 block."""
+    height, width = rgba.shape[:2]
+    padded = np.pad(rgba, ((0, height % 2), (0, width % 2), (0, 0)), mode="edge").astype(np.uint16)
+    blocks = padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+    return ((blocks + 2) // 4).astype(np.uint8)
+
+
+def levels(rgba):
+    """Every pyramid level of the frame, as `[(level, rgba)]` from the full frame down to 1x1."""
+    height, width = rgba.shape[:2]
+    level = math.ceil(math.log2(max(width, height, 1)))
+    out = [(level, rgba)]
+    while level > 0:
+        level -= 1
+        rgba = halve(rgba)
+        out.append((level, rgba))
+    return out
+
+
+def tiles(rgba, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """The tiles of one level, as `[(column, row, rgba)]`."""
+    height, width = rgba.shape[:2]
+    out = []
+    for row, y in enumerate(range(0, height, tile_size)):
+        for column, x in enumerate(range(0, width, tile_size)):
+            tile = rgba[max(0, y - overlap):y + tile_size + overlap, max(0, x - overlap):x + tile_size + overlap]
+            out.append((column, row, tile))
+    return out
+
+
+def build_pyramid(rgba, encoding, compress_level=DEFAULT_COMPRESS_LEVEL, tiled=True,
+                  thumbnail_size=THUMBNAIL_SIZE, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Encodes the thumbnail and (with `tiled`) every tile of an opaque RGBA frame.
+
+    Returns `{"thumbnail", "descriptor", "tiles"}`: the thumbnail and
+    descriptor bytes, and `{(level, column, row): bytes}`. `encoding` must
+    be resolved; the thumbnail and tiles are in it, like the full image.
+    """
+    thumbnail = None
+    encoded = {}
+    for level, image in levels(rgba):
+        if thumbnail is None and max(image.shape[:2]) <= thumbnail_size:
+            thumbnail = encode_image(image, encoding, compress_level)
+        if not tiled:
+            if thumbnail is not None:
+                break
+            continue
+        for column, row, tile in tiles(image, tile_size, overlap):
+            encoded[level, column, row] = encode_image(tile, encoding, compress_level)
+    descriptor = DZI_TEMPLATE.format(format=extension(encoding), overlap=overlap, tile_size=tile_size,
+                                     width=rgba.shape[1], height=rgba.shape[0]).encode() if tiled else None
+    return {"thumbnail": thumbnail, "descriptor": descriptor, "tiles": encoded}
+
+
+def pyramid_objects(fractal_hash, pyramid, encoding):
+    """The store objects of a `build_pyramid` result, as `[(key, data, content_type)]`."""
+    content_type = CONTENT_TYPES[encoding]
+    objects = [(thumbnail_key(fractal_hash, encoding), pyramid["thumbnail"], content_type)]
+    if pyramid["descriptor"] is not None:
+        objects.append((tiles_key(fractal_hash), pyramid["descriptor"], "application/xml"))
+        objects.extend((tile_key(fractal_hash, level, column, row, encoding), data, content_type)
+                       for (level, column, row), data in pyramid["tiles"].items())
+    return objects
@@ -0,0 +1,169 @@
+"""Job queues the Python worker can consume: SQS, or an in-memory stand-in.
+
+Both expose the same batch operations the worker needs: `receive` up to
+`RECEIVE_BATCH` messages, `delete` and `extend` (change visibility) by
+receipt handle. `MemoryQueue` follows SQS's visibility semantics, so
+messages that are not deleted in time are delivered again.
+"""
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+
+# SQS caps ReceiveMessage, DeleteMessageBatch and ChangeMessageVisibilityBatch at 10.
+RECEIVE_BATCH = 10
+
+
+@dataclass(frozen=True)
+class Message:
+    message_id: str
+    receipt_handle: str
+    body: str
+    receive_count: int = 1
+
+
+def _chunks(items, size=RECEIVE_BATCH):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class MemoryQueue:
+    """Thread-safe in-process queue with SQS-style visibility timeouts.
+
+    `latency` seconds are slept on every call, to stand in for the network
+    round trip each SQS request costs. `calls` counts requests by kind.
+    """
+
+    def __init__(self, visibility_timeout=30, latency=0.0):
+        self.visibility_timeout = visibility_timeout
+        self.latency = latency
+        self.calls = {"send": 0, "receive": 0, "delete": 0, "extend": 0}
+        self._ids = itertools.count(1)
+        self._messages = {}  # message_id -> [body, visible_at, receipt_handle, receive_count]
+        self._order = []
+        self._lock = threading.Condition()
+
+    def _call(self, kind):
+        self.calls[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def send(self, body):
+        self._call("send")
+        with self._lock:
+            message_id = str(next(self._ids))
+            self._messages[message_id] = [body, 0.0, None, 0]
+            self._order.append(message_id)
+            self._lock.notify_all()
+        return message_id
+
+    def receive(self, max_messages=RECEIVE_BATCH, wait_seconds=0):
+        self._call("receive")
+        deadline = time.monotonic() + wait_seconds
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                batch = []
+                for message_id in self._order:
+                    if len(batch) == min(max_messages, RECEIVE_BATCH):
+                        break
+                    entry = self._messages[message_id]
+                    if entry[1] <= now:
+                        entry[1] = now + self.visibility_timeout
+                        entry[2] = f"{message_id}-{next(self._ids)}"
+                        entry[3] += 1
+                        batch.append(Message(message_id, entry[2], entry[0], entry[3]))
+                if batch or now >= deadline:
+                    return batch
+                self._lock.wait(min(deadline - now, 0.05))
+
+    def _entry(self, receipt_handle):
+        message_id = receipt_handle.split("-", 1)[0]
+        entry = self._messages.get(message_id)
+        # A stale handle (the message was redelivered since) no longer applies.
+        return (message_id, entry) if entry and entry[2] == receipt_handle else (message_id, None)
+
+    def delete(self, receipt_handles):
+        """Deletes messages, in batches of 10. Returns the handles that failed."""
+        failed = []
+        for chunk in _chunks(receipt_handles):
+            self._call("delete")
+            with self._lock:
+                for handle in chunk:
+                    message_id, entry = self._entry(handle)
+                    if entry is None:
+                        failed.append(handle)
+                        continue
+                    del self._messages[message_id]
+                    self._order.remove(message_id)
+        return failed
+
+    def extend(self, receipt_handles, timeout):
+        """Makes messages invisible for another `timeout` seconds, in batches of 10."""
+        for chunk in _chunks(receipt_handles):
+            self._call("extend")
+            with self._lock:
+                for handle in chunk:
+                    _, entry = self._entry(handle)
+                    if entry is not None:
+                        entry[1] = time.monotonic() + timeout
+
+    def __len__(self):
+        """Messages not yet deleted, visible or not."""
+        with self._lock:
+            return len(self._messages)
+
+
+class SqsQueue:
+    """An SQS queue through boto3, which is only needed for this class."""
+
+    def __init__(self, queue_url, region=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as error:
+                raise RuntimeError("SqsQueue needs boto3: pip install boto3") from error
+            client = boto3.client("sqs", region_name=region)
+        self.client = client
+        self.queue_url = queue_url
+
+    def send(self, body):
+        return self.client.send_message(QueueUrl=self.queue_url, MessageBody=body)["MessageId"]
+
+    def receive(self, max_messages=RECEIVE_BATCH, wait_seconds=0):
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, RECEIVE_BATCH),
+            WaitTimeSeconds=wait_seconds,
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            Message(
+                message["MessageId"],
+                message["ReceiptHandle"],
+                message["Body"],
+                int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1)),
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def delete(self, receipt_handles):
+        failed = []
+        for chunk in _chunks(receipt_handles):
+            response = self.client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(chunk)],
+            )
+            failed += [chunk[int(entry["Id"])] for entry in response.get("Failed", [])]
+        return failed
+
+    def extend(self, receipt_handles, timeout):
+        for chunk in _chunks(receipt_handles):
+            self.client.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": int(timeout)}
+                    for i, handle in enumerate(chunk)
+                ],
+            )
@@ -0,0 +1,93 @@
+"""Straight per-pixel port of `generateFractal`, kept as the baseline to beat.
+
+`render_mu_exact` is the same loop in decimal arithmetic, the ground truth
+for deep zooms.
+"""
+
+import math
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+
+def _map(value, start1, stop1, start2, stop2):
+    return start2 + (stop2 - start2) * ((value - start1) / (stop1 - start1))
+
+
+def _iterate(z, c, power):
+    r = math.sqrt(z["real"] * z["real"] + z["imag"] * z["imag"])
+    theta = math.atan2(z["imag"], z["real"])
+    r_p = math.pow(r, power)
+    return {
+        "real": r_p * math.cos(power * theta) + c["real"],
+        "imag": r_p * math.sin(power * theta) + c["imag"],
+    }
+
+
+def pixel_mu(params, x, y):
+    """`mu` for one pixel, computed exactly like the inner loop of `generateFractal`."""
+    c = {"real": params.c_real, "imag": params.c_imag}
+    z = {
+        "real": _map(x, 0, params.width, -params.scale + params.offset_x, params.scale + params.offset_x),
+        "imag": _map(y, 0, params.height, -params.scale + params.offset_y, params.scale + params.offset_y),
+    }
+    n = 0
+    while n < params.max_iterations:
+        try:
+            z = _iterate(z, c, params.power)
+        except OverflowError:
+            z = {"real": math.inf, "imag": math.inf}
+        if (z["real"] * z["real"] + z["imag"] * z["imag"]) > 4:
+            break
+        n += 1
+
+    mu = n
+    if n < params.max_iterations:
+        try:
+            modulus = math.sqrt(z["real"] * z["real"] + z["imag"] * z["imag"])
+            mu = n + 1 - math.log(math.log(modulus)) / math.log(params.power)
+        except (ValueError, ZeroDivisionError, OverflowError):
+            mu = math.nan
+    return mu
+
+
+def render_mu_scalar(params, columns=None):
+    """Per-pixel `mu` buffer. `columns` restricts the walk to a subset of x values."""
+    columns = range(params.width) if columns is None else columns
+    mu = np.full((params.height, params.width), np.nan)
+    for x in columns:
+        for y in range(params.height):
+            mu[y, x] = pixel_mu(params, x, y)
+    return mu
+
+
+def pixel_mu_exact(params, x, y, digits):
+    """`mu` for one pixel with every step in `digits`-digit decimal arithmetic.
+
+    Slow but free of rounding at any zoom, so it is the ground truth for
+    `deepzoom.py`. Needs an integer `power`.
+    """
+    with localcontext() as context:
+        context.prec = digits
+        scale = Decimal(params.scale)
+        zr = Decimal(params.offset_x) - scale + 2 * scale * Decimal(x) / params.width
+        zi = Decimal(params.offset_y) - scale + 2 * scale * Decimal(y) / params.height
+        cr, ci = Decimal(params.c_real), Decimal(params.c_imag)
+        for n in range(params.max_iterations):
+            rr, ri = zr, zi
+            for _ in range(int(params.power) - 1):
+                rr, ri = rr * zr - ri * zi, rr * zi + ri * zr
+            zr, zi = rr + cr, ri + ci
+            modulus = zr * zr + zi * zi
+            if modulus > 4:
+                return n + 1 - math.log(math.log(math.sqrt(float(modulus)))) / math.log(params.power)
+    return float(params.max_iterations)
+
+
+def render_mu_exact(params, digits):
+    """Per-pixel `mu` buffer from `pixel_mu_exact`; only practical for small frames."""
+    mu = np.empty((params.height, params.width))
+    for y in range(params.height):
+        for x in range(params.width):
+            mu[y, x] = pixel_mu_exact(params, x, y, digits)
+    return mu
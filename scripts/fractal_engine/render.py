@@ -0,0 +1,176 @@
+from functools import partial
+
+import numpy as np
+
+from .colour import colourise, map_range
+from .deepzoom import delta_grid, escape_time_perturbed, is_deep_zoom
+from .interior import PERIODICITY_EPSILON_SQUARED, disk_tests, is_reference_iteration
+from .kernels import select_step
+from .png import encode_png
+
+
+def complex_grid(params, x0=0, x1=None, y0=0, y1=None):
+    """Pixel centres of the region [x0, x1) x [y0, y1) as (real, imag) arrays.
+
+    Uses the same `map` transform as `generateFractal`, so any sub-region
+    lines up exactly with the matching pixels of a full-frame render.
+    """
+    x1 = params.width if x1 is None else x1
+    y1 = params.height if y1 is None else y1
+    xs = np.arange(x0, x1, dtype=np.float64)
+    ys = np.arange(y0, y1, dtype=np.float64)
+    real = map_range(xs, 0, params.width, -params.scale + params.offset_x, params.scale + params.offset_x)
+    imag = map_range(ys, 0, params.height, -params.scale + params.offset_y, params.scale + params.offset_y)
+    return np.broadcast_arrays(real[np.newaxis, :], imag[:, np.newaxis])
+
+
+def escape_time(zr, zi, params, interior_checks=True, kernel="polar", return_counts=False,
+                return_steps=False):
+    """Smooth escape-time (`mu`) for every starting point in `zr + i*zi`.
+
+    The whole batch is iterated together. Points drop out of the working set
+    as soon as they escape, so each step only costs the points that are still
+    bounded. Points that never escape get `mu = max_iterations`.
+
+    With `interior_checks`, points are also dropped (as never escaping) once
+    their orbit closes a cycle or, for `power == 2`, enters a disk around an
+    attracting cycle - see `interior.py`. This doesn't change the result, it
+    just stops paying for iterations whose outcome is already known.
+
+    `kernel` picks how each step is computed; see `kernels.py`. With
+    `return_counts`, the integer iteration count `n` of each point is
+    returned too, as `(mu, counts)`. With `return_steps`, so is the number
+    of steps actually iterated per point, which is less than `n` for points
+    dropped by the interior checks; the result is then `(mu, [counts,]
+    steps)`.
+    """
+    iteration = EscapeIteration(zr, zi, params, interior_checks, kernel, return_counts, return_steps)
+    iteration.advance(params.max_iterations)
+    return iteration.result(params.max_iterations, return_counts, return_steps)
+
+
+class EscapeIteration:
+    """The state of `escape_time`'s loop, which can be continued to a higher limit.
+
+    `advance(n)` iterates the points still bounded until `n` iterations in
+    all, and `result(n)` reads what `escape_time` would return with
+    `max_iterations = n`. So frames of one view at rising `max_iterations`
+    cost what the last frame alone would; see `sweep.py`. Points dropped by
+    the interior checks never escape, at any limit. `counts` and `steps`
+    are only kept if asked for at construction.
+    """
+
+    def __init__(self, zr, zi, params, interior_checks=True, kernel="polar", counts=False, steps=False):
+        self.shape = np.shape(zr)
+        self.zr = np.array(zr, dtype=np.float64).ravel()
+        self.zi = np.array(zi, dtype=np.float64).ravel()
+        size = self.zr.size
+        # Infinity (or -1) until the point escapes, or for steps, is dropped.
+        self.mu = np.full(size, np.inf)
+        self.counts = np.full(size, -1, dtype=np.int32) if counts else None
+        self.steps = np.full(size, -1, dtype=np.int32) if steps else None
+        self.active = np.arange(size)
+        self.iterations = 0
+        self.params = params
+        self.interior_checks = interior_checks
+        self.step = select_step(params.power, kernel)
+        self.disks = disk_tests(params.c_real, params.c_imag, params.power) if interior_checks else []
+        self.ref_r = self.ref_i = None
+        # Scratch space, sliced down to the size of the working set each step.
+        self.buffers = [np.empty_like(self.zr) for _ in range(3)]
+
+    def advance(self, max_iterations):
+        zr, zi, active, ref_r, ref_i = self.zr, self.zi, self.active, self.ref_r, self.ref_i
+        mu, counts, steps, buffers, disks = self.mu, self.counts, self.steps, self.buffers, self.disks
+        cr, ci, power = self.params.c_real, self.params.c_imag, self.params.power
+        step = self.step
+
+        with np.errstate(all="ignore"):
+            log_power = np.log(power)
+            for n in range(self.iterations, max_iterations):
+                count = active.size
+                if count == 0:
+                    break
+                scratch = [buf[:count] for buf in buffers]
+                step(zr, zi, cr, ci, power, scratch)
+                modulus, scratch = scratch[0], scratch[1]
+
+                np.multiply(zr, zr, out=modulus)
+                np.multiply(zi, zi, out=scratch)
+                modulus += scratch
+                escaped = modulus > 4
+                if escaped.any():
+                    mu[active[escaped]] = n + 1 - np.log(np.log(np.sqrt(modulus[escaped]))) / log_power
+                    if counts is not None:
+                        counts[active[escaped]] = n
+                done = escaped
+
+                for disk_r, disk_i, radius_squared in disks:
+                    done = done | (((zr - disk_r) ** 2 + (zi - disk_i) ** 2) < radius_squared)
+                if ref_r is not None:
+                    done = done | (((zr - ref_r) ** 2 + (zi - ref_i) ** 2) < PERIODICITY_EPSILON_SQUARED)
+                if self.interior_checks and is_reference_iteration(n):
+                    ref_r, ref_i = zr.copy(), zi.copy()
+
+                if done.any():
+                    if steps is not None:
+                        steps[active[done]] = n + 1
+                    still = ~done
+                    zr, zi, active = zr[still], zi[still], active[still]
+                    if ref_r is not None:
+                        ref_r, ref_i = ref_r[still], ref_i[still]
+
+        self.zr, self.zi, self.active, self.ref_r, self.ref_i = zr, zi, active, ref_r, ref_i
+        self.iterations = max(self.iterations, max_iterations)
+
+    def result(self, max_iterations, return_counts=False, return_steps=False):
+        """`escape_time`'s result for `max_iterations`.
+
+        That is at most the iterations advanced, and below them only if
+        `counts` are kept, since they tell which points escaped too late.
+        """
+        unescaped = self.mu == np.inf
+        if max_iterations < self.iterations:
+            unescaped |= self.counts >= max_iterations
+        mu = np.where(unescaped, float(max_iterations), self.mu).reshape(self.shape)
+        extras = []
+        if return_counts:
+            extras.append(np.where(unescaped, max_iterations, self.counts).astype(np.int32).reshape(self.shape))
+        if return_steps:
+            unfinished = (self.steps < 0) | (self.steps > max_iterations)
+            extras.append(np.where(unfinished, max_iterations, self.steps).astype(np.int32).reshape(self.shape))
+        return (mu, *extras) if extras else mu
+
+    @property
+    def pending(self):
+        """Points still being iterated."""
+        return self.active.size
+
+
+def point_sampler(params, kernel="polar"):
+    """`(grid, escape)` functions for the view: `complex_grid` and `escape_time`.
+
+    For deep zooms (see `deepzoom.py`) they are `delta_grid` and
+    `escape_time_perturbed` instead, which work on offsets from the view
+    centre. Either way `escape(*grid(params, ...), params, **extras)` gives
+    the points' `mu` (with `return_counts`/`return_steps` extras).
+    """
+    if is_deep_zoom(params):
+        return delta_grid, escape_time_perturbed
+    return complex_grid, partial(escape_time, kernel=kernel)
+
+
+def render_mu(params, x0=0, x1=None, y0=0, y1=None, kernel="polar"):
+    """Smooth iteration buffer for a region of the frame, shaped (rows, cols)."""
+    grid, escape = point_sampler(params, kernel)
+    return escape(*grid(params, x0, x1, y0, y1), params)
+
+
+def render_rgba(params, kernel="polar"):
+    """Full frame as an (height, width, 4) uint8 array."""
+    return colourise(render_mu(params, kernel=kernel), params.max_iterations, params.colour_scheme)
+
+
+def render_png(params, kernel="polar"):
+    """Full frame encoded as PNG bytes, the same artefact the worker uploads."""
+    return encode_png(render_rgba(params, kernel=kernel))
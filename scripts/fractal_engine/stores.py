@@ -0,0 +1,136 @@
+"""Object stores for rendered images and iteration buffers: S3, or in memory.
+
+Both take an object whole (`put`) or as an iterable of byte pieces
+(`put_stream`), which is uploaded in parts while the pieces are still being
+produced. `MemoryStore` applies S3's multipart rules, so it stands in for a
+bucket in benchmarks; `S3Store` also takes an `endpoint_url` for a local S3
+stand-in such as MinIO.
+"""
+
+import threading
+import time
+
+# S3's minimum size for every part of a multipart upload but the last.
+PART_SIZE = 5 * 1024 * 1024
+
+
+def _parts(pieces, part_size=PART_SIZE):
+    """Regroups byte pieces into parts of at least `part_size` bytes (the last may be smaller)."""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= part_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class MemoryStore:
+    """Thread-safe in-process store.
+
+    `latency` seconds are slept on every request S3 would get, to stand in
+    for its round trips. `parts` records the part sizes each streamed key
+    was uploaded in; `part_size` can be lowered to exercise multipart
+    uploads with small objects.
+    """
+
+    def __init__(self, latency=0.0, part_size=PART_SIZE):
+        self.latency = latency
+        self.part_size = part_size
+        self.objects = {}
+        self.parts = {}
+        self._lock = threading.Lock()
+
+    def _request(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        self._request()
+        with self._lock:
+            self.objects[key] = (bytes(data), content_type)
+        return key
+
+    def put_stream(self, key, pieces, content_type="application/octet-stream"):
+        """Stores the pieces as one object, visible only once all of them arrived.
+
+        Makes the requests `S3Store.put_stream` would: one `put` for an object
+        smaller than a part, else create, one per part, and complete.
+        """
+        parts = _parts(pieces, self.part_size)
+        uploaded = [next(parts, b"")]
+        if len(uploaded[0]) >= self.part_size:
+            self._request()
+            for part in parts:
+                self._request()
+                uploaded.append(part)
+            self._request()
+        self._request()
+        with self._lock:
+            self.objects[key] = (b"".join(uploaded), content_type)
+            self.parts[key] = [len(part) for part in uploaded]
+        return key
+
+    def get(self, key):
+        """The object's bytes, or None if there is no such key."""
+        with self._lock:
+            entry = self.objects.get(key)
+        return entry[0] if entry else None
+
+
+class S3Store:
+    """An S3 bucket through boto3, which is only needed for this class.
+
+    Keys and content types match `s3Service.js`, so objects written here are
+    served by the API like any other.
+    """
+
+    def __init__(self, bucket, region=None, client=None, endpoint_url=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as error:
+                raise RuntimeError("S3Store needs boto3: pip install boto3") from error
+            client = boto3.client("s3", region_name=region, endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type, ACL="private")
+        return key
+
+    def put_stream(self, key, pieces, content_type="application/octet-stream"):
+        """Multipart upload of the pieces; anything that fits in one part is a plain `put`.
+
+        If producing the pieces fails, the upload is aborted and the error re-raised.
+        """
+        parts = _parts(pieces)
+        first = next(parts, b"")
+        if len(first) < PART_SIZE:
+            return self.put(key, first, content_type)
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType=content_type, ACL="private")["UploadId"]
+        try:
+            uploaded = [self._upload_part(key, upload_id, 1, first)]
+            for number, part in enumerate(parts, start=2):
+                uploaded.append(self._upload_part(key, upload_id, number, part))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": uploaded})
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return key
+
+    def _upload_part(self, key, upload_id, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
@@ -0,0 +1,73 @@
+"""Renders a frame straight to PNG bytes, one band of rows at a time.
+
+Each band is iterated, coloured and handed to `encode_png_stream`, so the
+compressed image is produced while later bands are still being computed and
+neither the RGBA frame nor its filtered copy is ever held whole.
+
+Past the deadline, the remaining bands are sampled at the coarsest
+progressive stride, as the first pass of `render_progressive` would, so a
+slow render still yields a complete (partly blocky) image.
+"""
+
+import time
+
+import numpy as np
+
+from .colour import colourise
+from .encodings import STREAMABLE, channels_for
+from .png import encode_png_stream
+from .progressive import PROGRESSIVE_STRIDES, ROWS_PER_CHUNK
+from .render import point_sampler, render_mu
+
+
+class StreamedRender:
+    """Iterates the PNG bytes of `params`' frame as each band is encoded.
+
+    Once iterated, `stride` is 1 if every band was rendered at full
+    resolution and the coarse stride otherwise. With `keep_mu`, `mu` holds
+    the frame as float32 (the precision iteration buffers are stored at).
+    `encoding` is one of the `STREAMABLE` encodings.
+    """
+
+    def __init__(self, params, deadline=None, kernel="polar", keep_mu=False,
+                 rows_per_band=ROWS_PER_CHUNK, compress_level=6, encoding="rgba"):
+        self.params = params
+        self.encoding = encoding
+        self.deadline = deadline
+        self.kernel = kernel
+        self.rows_per_band = rows_per_band
+        self.compress_level = compress_level
+        self.mu = np.empty((params.height, params.width), dtype=np.float32) if keep_mu else None
+        self.stride = None
+
+    def __iter__(self):
+        params = self.params
+        return encode_png_stream(self._bands(), params.width, params.height, STREAMABLE[self.encoding],
+                                 self.compress_level)
+
+    def _bands(self):
+        params = self.params
+        self.stride = 1
+        for y0 in range(0, params.height, self.rows_per_band):
+            y1 = min(y0 + self.rows_per_band, params.height)
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                self.stride = PROGRESSIVE_STRIDES[0]
+                mu = _coarse_rows(params, y0, y1, self.stride, self.kernel)
+            else:
+                mu = render_mu(params, y0=y0, y1=y1, kernel=self.kernel)
+            if self.mu is not None:
+                self.mu[y0:y1] = mu
+            yield channels_for(colourise(mu, params.max_iterations, params.colour_scheme), self.encoding)
+
+
+def _coarse_rows(params, y0, y1, stride, kernel):
+    """Rows y0..y1 sampled every `stride` pixels and painted as blocks.
+
+    `y0` must be a multiple of `stride` for the blocks to sit where
+    `progressive_passes` puts them.
+    """
+    grid, escape = point_sampler(params, kernel)
+    zr, zi = grid(params, y0=y0, y1=y1)
+    samples = escape(zr[::stride, ::stride], zi[::stride, ::stride], params)
+    blocks = np.repeat(np.repeat(samples, stride, axis=0), stride, axis=1)
+    return blocks[:y1 - y0, :params.width]
@@ -0,0 +1,283 @@
+"""Frame sequences over a range of parameters, for zoom and morph animations.
+
+`sweep_params` interpolates `frames` parameter sets between two views:
+`c_real`, `c_imag`, the offsets and `max_iterations` linearly, `scale`
+geometrically so a zoom runs at constant speed. `Sweep` renders them in
+order and shares work between frames instead of rendering each one cold:
+
+* Frames that differ only in `max_iterations` continue one `EscapeIteration`
+  per band of rows from frame to frame, so the whole sequence costs what
+  its highest-limit frame does.
+* Frames with the same `c` (pans and zooms, with or without rising
+  iterations) are rendered one by one by default. Given `keyframe_pixels`
+  (`--approximate` on the command line) they are instead sampled from
+  keyframes: one grid that covers a run of frames at the finest pitch among
+  them, iterated once up to their highest limit, up to `keyframe_pixels`
+  frames' worth of points. Each frame takes the nearest keyframe point to
+  each of its pixels, so pixels can move by up to half a pixel, which shows
+  as differences on chaotic boundary pixels (`python -m fractal_engine.bench
+  sweep --approximate` measures how many).
+* Anything else (a sweep over `c`, or a deep zoom, which is rendered by
+  perturbation) is rendered frame by frame, exactly as `render_mu` would.
+
+Keyframes and frames are split into bands of rows that a process pool
+renders a few keyframes ahead of the frame being yielded.
+"""
+
+import io
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+import numpy as np
+
+from .deepzoom import is_deep_zoom
+from .render import EscapeIteration, complex_grid, render_mu
+
+# Keyframe size for approximate sweeps, in frames' worth of points. A zoom by
+# sqrt(KEYFRAME_PIXELS) fits in one keyframe; 4 keeps the total near the
+# optimum of e for zooms. Sweeps are exact (no keyframes) unless asked.
+KEYFRAME_PIXELS = 4
+
+# Keyframes rendered ahead of the frame being yielded.
+KEYFRAMES_AHEAD = 3
+
+# Rows per pool task.
+ROWS_PER_BAND = 64
+
+COUNTERS = [
+    "frames",
+    "keyframes",
+    "frames_continued",
+    "pixels_computed",
+    "pixels_sampled",
+]
+
+
+def sweep_params(start, end, frames):
+    """`frames` parameter sets from `start` to `end`, both included.
+
+    Size, power and colour scheme are `start`'s throughout.
+    """
+    if frames < 1:
+        raise ValueError("a sweep needs at least one frame")
+    if (start.scale <= 0) != (end.scale <= 0):
+        raise ValueError("scale must keep its sign over a sweep")
+    out = []
+    for k in range(frames):
+        t = k / (frames - 1) if frames > 1 else 0.0
+        out.append(start.with_changes(
+            c_real=start.c_real + t * (end.c_real - start.c_real),
+            c_imag=start.c_imag + t * (end.c_imag - start.c_imag),
+            offset_x=start.offset_x + t * (end.offset_x - start.offset_x),
+            offset_y=start.offset_y + t * (end.offset_y - start.offset_y),
+            scale=start.scale * (end.scale / start.scale) ** t,
+            max_iterations=round(start.max_iterations + t * (end.max_iterations - start.max_iterations)),
+        ))
+    return out
+
+
+def _pitch(params):
+    return 2 * params.scale / params.width, 2 * params.scale / params.height
+
+
+def _extent(params):
+    """Real and imaginary coordinates of the view's first and last pixels."""
+    px, py = _pitch(params)
+    left, top = params.offset_x - params.scale, params.offset_y - params.scale
+    return left, left + (params.width - 1) * px, top, top + (params.height - 1) * py
+
+
+def _same_orbits(a, b):
+    return (a.power, a.c_real, a.c_imag) == (b.power, b.c_real, b.c_imag)
+
+
+def _only_iterations_change(frames):
+    first = frames[0]
+    return len(frames) > 1 and not is_deep_zoom(first) and all(
+        frame.with_changes(max_iterations=first.max_iterations, colour_scheme=first.colour_scheme) == first
+        for frame in frames)
+
+
+class Keyframe:
+    """A grid of points from which `frames` (indices into the sweep) are sampled.
+
+    `grid` is `(left, px, columns, top, py, rows)`, or None when the keyframe
+    is a single frame rendered as is. `params` carries the orbit settings
+    and the highest `max_iterations` among the frames.
+    """
+
+    def __init__(self, params, grid, frames):
+        self.params = params
+        self.grid = grid
+        self.frames = frames
+
+    @property
+    def shape(self):
+        if self.grid is None:
+            return self.params.height, self.params.width
+        return self.grid[5], self.grid[2]
+
+
+def _lattice(frames):
+    left = min(_extent(f)[0] for f in frames)
+    right = max(_extent(f)[1] for f in frames)
+    top = min(_extent(f)[2] for f in frames)
+    bottom = max(_extent(f)[3] for f in frames)
+    px = min(_pitch(f)[0] for f in frames)
+    py = min(_pitch(f)[1] for f in frames)
+    return left, px, math.ceil((right - left) / px) + 1, top, py, math.ceil((bottom - top) / py) + 1
+
+
+def plan_keyframes(frames, keyframe_pixels=0):
+    """Groups consecutive frames into `Keyframe`s, each as large as `keyframe_pixels` allows."""
+    keyframes = []
+    k = 0
+    while k < len(frames):
+        first = frames[k]
+        budget = keyframe_pixels * first.width * first.height
+        end = k + 1
+        if keyframe_pixels and not is_deep_zoom(first):
+            while end < len(frames) and _same_orbits(first, frames[end]) and not is_deep_zoom(frames[end]):
+                grid = _lattice(frames[k:end + 1])
+                if grid[2] * grid[5] > budget:
+                    break
+                end += 1
+        if end == k + 1:
+            keyframes.append(Keyframe(first, None, [k]))
+        else:
+            limit = max(frame.max_iterations for frame in frames[k:end])
+            keyframes.append(Keyframe(first.with_changes(max_iterations=limit), _lattice(frames[k:end]),
+                                      list(range(k, end))))
+        k = end
+    return keyframes
+
+
+def _render_rows(task):
+    """`(mu, counts)` for rows [y0, y1) of a keyframe; counts are None for single frames."""
+    params, grid, y0, y1, kernel = task
+    if grid is None:
+        return render_mu(params, 0, None, y0, y1, kernel=kernel), None
+    left, px, columns, top, py, _ = grid
+    real = left + np.arange(columns) * px
+    imag = top + np.arange(y0, y1) * py
+    zr, zi = np.broadcast_arrays(real[np.newaxis, :], imag[:, np.newaxis])
+    iteration = EscapeIteration(zr, zi, params, kernel=kernel, counts=True)
+    iteration.advance(params.max_iterations)
+    return iteration.result(params.max_iterations, return_counts=True)
+
+
+def sample_keyframe(keyframe, mu, counts, frame):
+    """The `mu` frame for `frame`: the nearest keyframe point to each pixel, cut to its limit."""
+    left, px, columns, top, py, rows = keyframe.grid
+    real, imag = complex_grid(frame)
+    xs = np.clip(np.rint((real[0] - left) / px), 0, columns - 1).astype(np.intp)
+    ys = np.clip(np.rint((imag[:, 0] - top) / py), 0, rows - 1).astype(np.intp)
+    index = np.ix_(ys, xs)
+    out = mu[index]
+    if frame.max_iterations < keyframe.params.max_iterations:
+        out = np.where(counts[index] >= frame.max_iterations, float(frame.max_iterations), out)
+    return out
+
+
+class Sweep:
+    """Iterates the `mu` frame of each of `frames` (a list of `FractalParams`), in order.
+
+    Pass an existing `multiprocessing.Pool` to reuse it; otherwise a pool of
+    `workers` processes (default: one per core) is started while iterating.
+    `stats()` reports the counters in `COUNTERS` and the points computed per
+    frame pixel, against 1 for rendering every frame cold.
+    """
+
+    def __init__(self, frames, pool=None, workers=None, keyframe_pixels=0, kernel="polar"):
+        self.frames = list(frames)
+        self.pool = pool
+        self.workers = workers or os.cpu_count()
+        self.keyframe_pixels = keyframe_pixels
+        self.kernel = kernel
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def stats(self):
+        stats = dict(self.counters)
+        pixels = sum(frame.width * frame.height for frame in self.frames[:stats["frames"]])
+        stats["computed_per_pixel"] = stats["pixels_computed"] / pixels if pixels else 0.0
+        return stats
+
+    def __iter__(self):
+        if not self.frames:
+            return iter(())
+        if _only_iterations_change(self.frames):
+            return self._continued()
+        return self._keyframed()
+
+    def _continued(self):
+        """One `EscapeIteration` per band, each advanced to every frame's limit in turn."""
+        first = self.frames[0]
+        edges = np.linspace(0, first.height, min(self.workers, first.height) + 1).astype(int)
+        bands = [EscapeIteration(*complex_grid(first, 0, None, y0, y1), first, kernel=self.kernel, counts=True)
+                 for y0, y1 in zip(edges[:-1], edges[1:])]
+        self.counters["pixels_computed"] += first.width * first.height
+        # NumPy releases the GIL on whole-band array operations, so threads keep the state in place.
+        with ThreadPoolExecutor(len(bands)) as threads:
+            advanced = 0
+            for frame in self.frames:
+                limit = frame.max_iterations
+                list(threads.map(lambda band: band.advance(limit), bands))
+                if advanced:
+                    self.counters["frames_continued"] += 1
+                advanced = max(advanced, limit)
+                self.counters["frames"] += 1
+                yield np.vstack([band.result(limit) for band in bands])
+
+    def _keyframed(self):
+        if self.pool is not None:
+            yield from self._keyframed_on(self.pool)
+            return
+        with Pool(self.workers) as pool:
+            yield from self._keyframed_on(pool)
+
+    def _submit(self, pool, keyframe):
+        rows = keyframe.shape[0]
+        return [pool.apply_async(_render_rows, ((keyframe.params, keyframe.grid, y0, min(y0 + ROWS_PER_BAND, rows),
+                                                 self.kernel),))
+                for y0 in range(0, rows, ROWS_PER_BAND)]
+
+    def _keyframed_on(self, pool):
+        keyframes = deque(plan_keyframes(self.frames, self.keyframe_pixels))
+        pending = deque()
+        while keyframes or pending:
+            while keyframes and len(pending) < KEYFRAMES_AHEAD:
+                keyframe = keyframes.popleft()
+                pending.append((keyframe, self._submit(pool, keyframe)))
+            keyframe, bands = pending.popleft()
+            parts = [band.get() for band in bands]
+            mu = np.vstack([part[0] for part in parts])
+            self.counters["keyframes"] += 1
+            self.counters["pixels_computed"] += mu.size
+            if keyframe.grid is None:
+                self.counters["frames"] += 1
+                yield mu
+                continue
+            counts = np.vstack([part[1] for part in parts])
+            for index in keyframe.frames:
+                self.counters["frames"] += 1
+                self.counters["pixels_sampled"] += self.frames[index].width * self.frames[index].height
+                yield sample_keyframe(keyframe, mu, counts, self.frames[index])
+
+
+def encode_animation(rgba_frames, fmt="gif", fps=25):
+    """The frames as an animated GIF or WebP, looping forever."""
+    try:
+        from PIL import Image
+    except ImportError as error:
+        raise RuntimeError("Animations need Pillow: pip install Pillow") from error
+    images = [Image.fromarray(np.ascontiguousarray(rgba[..., :3])) for rgba in rgba_frames]
+    if not images:
+        raise ValueError("an animation needs at least one frame")
+    out = io.BytesIO()
+    options = {"lossless": True} if fmt == "webp" else {"optimize": False}
+    images[0].save(out, fmt.upper(), save_all=True, append_images=images[1:], duration=round(1000 / fps),
+                   loop=0, **options)
+    return out.getvalue()
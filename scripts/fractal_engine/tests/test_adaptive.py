@@ -0,0 +1,17 @@
+import pytest
+
+from fractal_engine.adaptive import render_mu_adaptive, within_error_budget
+from fractal_engine.bench import ADAPTIVE_CASES
+from fractal_engine.params import FractalParams
+from fractal_engine.render import render_mu
+
+VIEWS = [{}] + ADAPTIVE_CASES
+
+
+@pytest.mark.parametrize("view", VIEWS)
+def test_adaptive_render_is_within_error_budget(view):
+    params = FractalParams(width=320, height=180).with_changes(**view)
+    mu, evaluated = render_mu_adaptive(params)
+    check = within_error_budget(params, mu, render_mu(params))
+    assert check["within_budget"], check
+    assert evaluated <= mu.size
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from fractal_engine.bench import DEEP_ZOOM_CASES
+from fractal_engine.deepzoom import is_deep_zoom, reference_digits
+from fractal_engine.params import FractalParams
+from fractal_engine.reference import render_mu_exact
+from fractal_engine.render import complex_grid, escape_time, render_mu
+
+# Share of pixels whose escape iteration may differ from the decimal
+# brute force: at most one pixel of a 24x14 frame.
+ESCAPE_COUNT_TOLERANCE = 1 / 336
+
+
+def escape_counts(mu):
+    return np.floor(mu).astype(int)
+
+
+def deep_frame(case):
+    return FractalParams(width=24, height=14, max_iterations=2000).with_changes(scale=1e-12, **case)
+
+
+@pytest.mark.parametrize("case", DEEP_ZOOM_CASES)
+def test_render_mu_matches_exact_escape_counts(case):
+    params = deep_frame(case)
+    assert is_deep_zoom(params)
+    exact = render_mu_exact(params, reference_digits(params))
+    mismatched = (escape_counts(render_mu(params)) != escape_counts(exact)).mean()
+    assert mismatched <= ESCAPE_COUNT_TOLERANCE
+
+
+def test_plain_doubles_miss_the_tolerance():
+    # Without perturbation the same frames are visibly wrong, so the test above means something.
+    worst = 0.0
+    for case in DEEP_ZOOM_CASES:
+        params = deep_frame(case)
+        exact = render_mu_exact(params, reference_digits(params))
+        doubles = escape_time(*complex_grid(params), params)
+        worst = max(worst, (escape_counts(doubles) != escape_counts(exact)).mean())
+    assert worst > ESCAPE_COUNT_TOLERANCE
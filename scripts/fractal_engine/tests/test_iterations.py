@@ -0,0 +1,17 @@
+import json
+
+from fractal_engine.iterations import _js_json, geometry_hash
+
+
+def test_numbers_serialise_as_javascript_does():
+    # Expected strings are JSON.stringify's output for the same values.
+    values = json.loads("[1e-7, 1e20, 1e21, -2.5e-9, 0.1, 1.5e300, -0.0, 2, 1e-6, 1234567.125]")
+    assert _js_json(values) == "[1e-7,100000000000000000000,1e+21,-2.5e-9,0.1,1.5e+300,0,2,0.000001,1234567.125]"
+
+
+def test_geometry_hash_matches_node_for_exponent_values():
+    options = json.loads('{"width": 1920, "height": 1080, "maxIterations": 500, "power": 2,'
+                         ' "c": {"real": -0.8, "imag": 1e-7}, "scale": 1e-12,'
+                         ' "offsetX": -0.743643887037151, "offsetY": 1e20, "colourScheme": "rainbow"}')
+    # iterationStoreService.geometryHash(options) for the same options.
+    assert geometry_hash(options) == "c3548cf22f2fc613c13caa2f11600d0be7ef833d800701c389ef37efc4f544c9"
@@ -0,0 +1,207 @@
+"""Reuse of computed `mu` across panned and zoomed views.
+
+Tiles live on a lattice of complex-plane points: lattice point `(k, m)` at
+pitch `(px, py)` is `k * px + i * m * py`, where the pitch is the view's
+size in the plane per pixel (`2 * scale / width`, `2 * scale / height`).
+Tiles are keyed by pitch, lattice position and the iteration settings, not
+by resolution or offset, so:
+
+* a view panned by whole pixels lines up with the same lattice and only the
+  tiles it newly exposes are computed;
+* a view zoomed by 2x shares every other lattice point with the previous
+  one, so those points are copied from the finer or coarser tiles instead of
+  being iterated.
+
+A view whose origin does not fall on its lattice (an offset that is not a
+whole number of pixels) is rendered directly and counted as `unaligned`.
+Lattice points are computed as `k * px` rather than through the view's own
+`map`, so cached frames can differ from `render_mu` in the last bits of a
+coordinate, which occasionally shows on chaotic boundary pixels.
+
+With a deadline, missing tiles are iterated a batch at a time and the render
+gives up (returning None) once the rest would not be done in time at the
+rate so far; tiles finished by then stay cached for the next view.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .deepzoom import is_deep_zoom
+from .progressive import progressive_passes
+from .render import escape_time, render_mu
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_MAX_TILES = 1024
+
+# Incomplete tiles iterated between deadline checks.
+TILES_PER_CHUNK = 16
+
+# How far a view's origin may sit from a lattice point, in pixels, and still
+# be treated as lying on it.
+ALIGNMENT_TOLERANCE = 1e-6
+
+COUNTERS = [
+    "views",
+    "unaligned",
+    "tile_lookups",
+    "tile_hits",
+    "tiles_derived",
+    "pixels_reused",
+    "pixels_computed",
+]
+
+
+class TileCache:
+    """LRU cache of `tile_size` x `tile_size` lattice tiles of `mu`.
+
+    `stats()` reports the counters in `COUNTERS` plus the tile hit ratio.
+    `tile_hits` counts tiles found as-is; `tiles_derived` counts tiles filled
+    entirely from the neighbouring zoom levels. `pixels_reused` counts view
+    pixels that did not have to be iterated.
+    """
+
+    def __init__(self, max_tiles=DEFAULT_MAX_TILES, tile_size=DEFAULT_TILE_SIZE):
+        if tile_size % 2:
+            raise ValueError("tile_size must be even")
+        self.max_tiles = max_tiles
+        self.tile_size = tile_size
+        self._tiles = OrderedDict()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def stats(self):
+        stats = dict(self.counters)
+        lookups = stats["tile_lookups"]
+        stats["hit_ratio"] = stats["tile_hits"] / lookups if lookups else 0.0
+        stats["tiles_cached"] = len(self._tiles)
+        return stats
+
+    def reset_stats(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def clear(self):
+        self._tiles.clear()
+
+    def _get(self, key):
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def _put(self, key, tile):
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    def _lookup(self, settings, pitch, i, j):
+        """`(mu, known)` for one tile; `known` is None when the whole tile was cached."""
+        self.counters["tile_lookups"] += 1
+        mu = self._get((settings, pitch, i, j))
+        if mu is not None:
+            self.counters["tile_hits"] += 1
+            return mu, None
+
+        size, half = self.tile_size, self.tile_size // 2
+        px, py = pitch
+        mu = np.full((size, size), np.nan)
+        known = np.zeros((size, size), dtype=bool)
+
+        # Zoomed out: lattice point k here is point 2k at half the pitch.
+        for dj in (0, 1):
+            for di in (0, 1):
+                finer = self._get((settings, (px / 2, py / 2), 2 * i + di, 2 * j + dj))
+                if finer is not None:
+                    block = np.s_[dj * half:(dj + 1) * half, di * half:(di + 1) * half]
+                    mu[block] = finer[::2, ::2]
+                    known[block] = True
+
+        # Zoomed in: even lattice points here are the points of the coarser lattice.
+        coarser = self._get((settings, (px * 2, py * 2), i // 2, j // 2))
+        if coarser is not None:
+            block = coarser[(j % 2) * half:(j % 2 + 1) * half, (i % 2) * half:(i % 2 + 1) * half]
+            missing = ~known[::2, ::2]
+            mu[::2, ::2][missing] = block[missing]
+            known[::2, ::2] = True
+
+        if known.all():
+            self.counters["tiles_derived"] += 1
+        return mu, known
+
+
+def lattice_origin(params):
+    """Lattice indices of the view's top-left pixel, or None if it is off the lattice."""
+    px, py = 2 * params.scale / params.width, 2 * params.scale / params.height
+    kx = (-params.scale + params.offset_x) / px
+    ky = (-params.scale + params.offset_y) / py
+    if abs(kx - round(kx)) > ALIGNMENT_TOLERANCE or abs(ky - round(ky)) > ALIGNMENT_TOLERANCE:
+        return None
+    return (px, py), round(kx), round(ky)
+
+
+def render_mu_cached(params, cache, kernel="polar", deadline=None):
+    """The `mu` frame for `params`, reusing and filling `cache`.
+
+    Returns None if it cannot be finished by `deadline` (a
+    `time.monotonic()` value).
+    """
+    cache.counters["views"] += 1
+    # Deep zooms have no lattice of absolute coordinates doubles can tell apart.
+    origin = None if is_deep_zoom(params) else lattice_origin(params)
+    if origin is None:
+        cache.counters["unaligned"] += 1
+        cache.counters["pixels_computed"] += params.width * params.height
+        if deadline is None:
+            return render_mu(params, kernel=kernel)
+        return next(progressive_passes(params, deadline, strides=(1,), kernel=kernel), (None, None))[1]
+
+    pitch, kx0, ky0 = origin
+    px, py = pitch
+    size = cache.tile_size
+    settings = (params.power, params.c_real, params.c_imag, params.max_iterations, kernel)
+    columns = range(kx0 // size, (kx0 + params.width - 1) // size + 1)
+    rows = range(ky0 // size, (ky0 + params.height - 1) // size + 1)
+
+    tiles = {(i, j): cache._lookup(settings, pitch, i, j) for j in rows for i in columns}
+
+    # Iterate the missing lattice points of many tiles per batch.
+    incomplete = [(i, j) for (i, j), (_, known) in tiles.items() if known is not None and not known.all()]
+    chunk = TILES_PER_CHUNK if deadline is not None else max(1, len(incomplete))
+    started, missing = time.monotonic(), sum(int((~tiles[key][1]).sum()) for key in incomplete)
+    computed = 0
+    for first in range(0, len(incomplete), chunk):
+        if deadline is not None and computed:
+            now = time.monotonic()
+            if now + (now - started) * (missing - computed) / computed > deadline:
+                for i, j in incomplete[:first]:
+                    cache._put((settings, pitch, i, j), tiles[(i, j)][0])
+                return None
+        points_r, points_i, owners = [], [], []
+        for i, j in incomplete[first:first + chunk]:
+            m, k = np.nonzero(~tiles[(i, j)][1])
+            points_r.append((i * size + k) * px)
+            points_i.append((j * size + m) * py)
+            owners.append((m, k))
+        mu = escape_time(np.concatenate(points_r), np.concatenate(points_i), params, kernel=kernel)
+        cache.counters["pixels_computed"] += mu.size
+        computed += mu.size
+        start = 0
+        for (i, j), (m, k) in zip(incomplete[first:first + chunk], owners):
+            tiles[(i, j)][0][m, k] = mu[start:start + m.size]
+            start += m.size
+
+    frame = np.empty((params.height, params.width))
+    reused = 0
+    for (i, j), (tile, known) in tiles.items():
+        cache._put((settings, pitch, i, j), tile)
+        x0, x1 = max(i * size, kx0), min((i + 1) * size, kx0 + params.width)
+        y0, y1 = max(j * size, ky0), min((j + 1) * size, ky0 + params.height)
+        inside = np.s_[y0 - j * size:y1 - j * size, x0 - i * size:x1 - i * size]
+        frame[y0 - ky0:y1 - ky0, x0 - kx0:x1 - kx0] = tile[inside]
+        reused += (y1 - y0) * (x1 - x0) if known is None else int(known[inside].sum())
+    cache.counters["pixels_reused"] += reused
+    return frame
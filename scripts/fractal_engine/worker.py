@@ -0,0 +1,771 @@
+"""Queue worker that renders jobs across a process pool.
+
+Does the job of `fractal.worker.js`, but keeps every core busy: messages are
+received up to 10 at a time, rendered by a pool with one process per core,
+and deleted in batches once their image is stored. Messages still waiting
+or rendering have their visibility extended so long renders are not handed
+to another worker.
+
+Status changes are sent to the API's `/api/fractal/worker-status` endpoint,
+which makes the database and cache updates the Node worker makes itself.
+Reporting `generating` when a render starts also claims a lease on the
+job's hash, so a job whose fractal another worker is already rendering goes
+back on the queue and later picks up that result. Held jobs claim nothing
+until they start, and a started render renews its lease (and the fractal's
+`last_updated`) each time its messages' visibility is extended. Duplicates
+within one worker share a render.
+
+Renders are scheduled by predicted cost rather than in arrival order. A
+probe render (see `cost.py`) puts each job in the short or long lane; short
+jobs are started first and long ones never take more than `long_slots`
+processes, so a burst of cheap jobs is not stuck behind one expensive one
+(a long job held over `LONG_LANE_MAX_WAIT` jumps the short lane instead).
+Jobs predicted to miss the deadline by a wide margin are reported
+`too_complex` without being rendered. Predicted and actual render times are
+logged and kept in `Worker.cost_log`.
+
+A render its deadline cut short of full resolution is queued again, like
+the Node worker's `requeueRefinement`: its buffer is stored under
+`partial_iterations_key` and the new message's `resumeStride` makes the
+next attempt carry on from it, up to `MAX_REFINEMENTS` times. Whatever is
+reported `complete` carries the stride it reached.
+
+Renders predicted to finish at full resolution are streamed: the pool
+process encodes the PNG band by band (see `streaming.py`) and sends each
+piece to the main process, where `store.put_stream` uploads it in parts
+while the rest of the frame is still being computed.
+
+Alongside each image, a thumbnail and (with `pyramid="tiles"`) a Deep Zoom
+tile pyramid are stored (see `pyramid.py`), so the gallery can show
+thumbnails and fetch the full image only when it is opened. Their keys are
+reported with the image's.
+
+With `tile_cache_tiles`, each pool process keeps a `TileCache` for its
+lifetime (see `tilecache.py`), so a user panning or zooming by whole pixels
+has only the newly exposed tiles iterated. Renders use it when they are
+predicted to reach full resolution and their view lies on the cache's
+lattice. Such renders are not streamed, and their lattice-assembled buffers
+are not stored as the geometry's iterations; one that would overrun the
+deadline falls back to a progressive render in the time left. The caches'
+counters are summed into `Worker.tile_cache_stats()` and sent with each
+status report.
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import Pool
+
+from .colour import colourise
+from .cost import CostModel, probe_cost
+from .deepzoom import is_deep_zoom
+from .encodings import CONTENT_TYPES, DEFAULT_COMPRESS_LEVEL, STREAMABLE, encode_image, extension, resolve_encoding
+from .iterations import decode_iterations, encode_iterations, iterations_key, partial_iterations_key
+from .params import FractalParams
+from .progressive import render_progressive
+from .pyramid import build_pyramid, pyramid_objects, thumbnail_key, tiles_key
+from .queues import RECEIVE_BATCH
+from .streaming import StreamedRender
+from .tilecache import COUNTERS as TILE_CACHE_COUNTERS
+from .tilecache import TileCache, lattice_origin, render_mu_cached
+
+# Seconds a received message stays invisible; extended while the job is held.
+VISIBILITY_TIMEOUT = 60
+
+# Extend a message's visibility once less than this fraction of it is left.
+EXTEND_WHEN_REMAINING = 1 / 3
+
+# Completed messages are deleted once a batch is pending, or after this many seconds.
+DELETE_FLUSH_SECONDS = 1.0
+
+# How long to wait for a render to finish before checking the queue again.
+IDLE_WAIT_SECONDS = 0.5
+
+# Matches the route's `maxTime` for a job.
+MAX_RENDER_SECONDS = 120
+
+# How long a render claim lasts: a full render plus storing the result.
+LEASE_SECONDS = 180
+
+# A job whose hash another worker holds goes back on the queue for at most
+# this long before checking for the result again.
+DUPLICATE_RECHECK_SECONDS = 30
+
+# Jobs predicted to take longer than this go in the long lane.
+SHORT_LANE_SECONDS = 10
+
+# A long-lane job held this long is started ahead of short ones, so a steady
+# stream of cheap jobs cannot starve it.
+LONG_LANE_MAX_WAIT = 60
+
+# A job is rejected up front only if even its coarsest progressive pass is
+# predicted to take this many times the deadline; probes can underestimate.
+REJECT_MARGIN = 2
+
+# Times a render cut short by its deadline is queued again to refine it,
+# matching the Node worker's.
+MAX_REFINEMENTS = 3
+
+# Predicted-vs-actual entries kept in `Worker.cost_log`.
+COST_LOG_SIZE = 1000
+
+STATS = ["received", "rendered", "coalesced", "completed", "too_complex", "rejected", "skipped",
+         "deferred", "refined", "failed", "deleted", "extended", "short", "long"]
+FINISHED = ["completed", "too_complex", "skipped", "refined", "failed"]
+
+# Concurrent puts of thumbnails and tiles, shared by every render's previews.
+PREVIEW_UPLOAD_THREADS = 16
+
+# What `Worker` stores next to each image: thumbnails and DZI tiles, only thumbnails, or neither.
+PYRAMIDS = ["tiles", "thumbnail", "none"]
+
+# Sent in place of a PNG piece when a streamed render fails part-way.
+STREAM_ABORTED = "aborted"
+
+# Where a pool process sends streamed PNG pieces, as (token, piece); set by `_init_pool`.
+_pieces = None
+
+# The pool process's `TileCache`, or None when the worker runs without one; set by `_init_pool`.
+_tile_cache = None
+
+
+def _init_pool(pieces, tile_cache_tiles=0):
+    global _pieces, _tile_cache
+    _pieces = pieces
+    _tile_cache = TileCache(tile_cache_tiles) if tile_cache_tiles else None
+
+
+def image_key(fractal_hash, encoding="rgba"):
+    """Same key `s3Service.uploadFile` uses for a fractal image, with the encoding's extension."""
+    return f"fractals/{fractal_hash}.{extension(encoding)}"
+
+
+def render_job(options, stored=None, max_time=MAX_RENDER_SECONDS, stream_token=None, encoding="rgba",
+               compress_level=DEFAULT_COMPRESS_LEVEL, pyramid="none", cached=False, resume=None):
+    """Renders one job's options in a pool process.
+
+    Returns `{"status", "image", "iterations", "partial", "stride",
+    "pyramid", "seconds"}`, with the image in `encoding` (already resolved).
+    `stored` is a previously stored iteration buffer for the same geometry,
+    which is recoloured instead of rendering; `iterations` is the buffer to
+    store, if any, `stride` the finest progressive pass completed, `partial`
+    the encoded buffer of a render that stopped short of stride 1, and
+    `pyramid` the `build_pyramid` result for one of `PYRAMIDS`, or None.
+    `resume`, a `(partial, stride)` pair from an earlier attempt, is carried
+    on from instead of starting over.
+
+    With a `stream_token`, the image is sent piece by piece through the
+    pool's queue instead, followed by None (or `STREAM_ABORTED` on failure),
+    and `image` is None.
+
+    With `cached`, the frame is rendered through the process's tile cache,
+    or progressively in whatever is left of `max_time` if the cache cannot
+    finish it in time, and `tile_cache` holds the render's additions to the
+    cache's counters. A frame from the cache is not returned as
+    `iterations`, which must match an uncached render.
+    """
+    if stream_token is not None:
+        try:
+            result = _stream_job(options, max_time, stream_token, encoding, compress_level, pyramid)
+        except BaseException:
+            _pieces.put((stream_token, STREAM_ABORTED))
+            raise
+        _pieces.put((stream_token, None))
+        return result
+
+    start = time.perf_counter()
+    params = FractalParams.from_options(options)
+    tile_cache = None
+    mu = iterations = None
+    deadline = time.monotonic() + max_time
+    if stored is not None:
+        mu, stride = decode_iterations(stored, params.width, params.height), 1
+    elif cached and _tile_cache is not None:
+        before = dict(_tile_cache.counters)
+        mu, stride = render_mu_cached(params, _tile_cache, deadline=deadline), 1
+        tile_cache = {name: _tile_cache.counters[name] - before[name] for name in TILE_CACHE_COUNTERS}
+    if mu is None:
+        if resume is not None:
+            resume = (decode_iterations(resume[0], params.width, params.height), resume[1])
+        mu, stride = render_progressive(params, max_time=max(0.0, deadline - time.monotonic()), resume=resume)
+        if mu is None:
+            return {"status": "too_complex", "image": None, "iterations": None, "partial": None, "stride": None,
+                    "pyramid": None, "seconds": time.perf_counter() - start, "tile_cache": tile_cache}
+        iterations = encode_iterations(mu) if stride == 1 else None
+    rgba = colourise(mu, params.max_iterations, params.colour_scheme)
+    image = encode_image(rgba, encoding, compress_level)
+    return {"status": "complete", "image": image, "iterations": iterations,
+            "partial": encode_iterations(mu) if stride > 1 else None, "stride": stride,
+            "pyramid": _pyramid(rgba, encoding, compress_level, pyramid), "seconds": time.perf_counter() - start,
+            "tile_cache": tile_cache}
+
+
+def _pyramid(rgba, encoding, compress_level, pyramid):
+    if pyramid == "none":
+        return None
+    return build_pyramid(rgba, encoding, compress_level, tiled=pyramid == "tiles")
+
+
+def _stream_job(options, max_time, stream_token, encoding, compress_level, pyramid):
+    start = time.perf_counter()
+    params = FractalParams.from_options(options)
+    streamed = StreamedRender(params, deadline=time.monotonic() + max_time, keep_mu=True,
+                              compress_level=compress_level, encoding=encoding)
+    for piece in streamed:
+        _pieces.put((stream_token, piece))
+    iterations = encode_iterations(streamed.mu) if streamed.stride == 1 else None
+    partial = encode_iterations(streamed.mu) if streamed.stride > 1 else None
+    rgba = None if pyramid == "none" else colourise(streamed.mu, params.max_iterations, params.colour_scheme)
+    return {"status": "complete", "image": None, "iterations": iterations, "partial": partial,
+            "stride": streamed.stride,
+            "pyramid": _pyramid(rgba, encoding, compress_level, pyramid), "seconds": time.perf_counter() - start,
+            "tile_cache": None}
+
+
+def _on_lattice(options):
+    """Whether a job's view can be rendered through a `TileCache`."""
+    params = FractalParams.from_options(options)
+    return not is_deep_zoom(params) and lattice_origin(params) is not None
+
+
+def _drain(pieces):
+    """The pieces of one streamed image, until its end marker."""
+    for piece in iter(pieces.get, None):
+        if isinstance(piece, str):
+            raise RuntimeError("The render failed while its image was streaming.")
+        yield piece
+
+
+class ApiReporter:
+    """Reports job status to the API with the `x-api-key` the DLQ handler also uses."""
+
+    def __init__(self, api_url, api_key, timeout=10):
+        self.url = api_url.rstrip("/") + "/api/fractal/worker-status"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def update(self, job, status, worker_id, s3_key=None, thumbnail_key=None, tiles_key=None, tile_cache=None,
+               stride=None):
+        """Returns the API's reply; `tile_cache` is the worker's `tile_cache_stats()`.
+
+        `stride` is the finest pass a `complete` render reached (1 for full
+        resolution). `requeued` releases the lease of a render queued again
+        to be refined.
+
+        For `generating`, `{"skip": true}` means the fractal is already done
+        and `{"wait": seconds}` that another worker holds its lease. For
+        `renew`, `{"renewed": false}` means the lease was lost.
+        """
+        body = json.dumps({
+            "hash": job["hash"],
+            "historyId": job.get("historyId"),
+            "user": job.get("user"),
+            "options": job["options"],
+            "status": status,
+            "s3Key": s3_key,
+            "thumbnailKey": thumbnail_key,
+            "tilesKey": tiles_key,
+            "workerId": worker_id,
+            "leaseSeconds": LEASE_SECONDS,
+            "tileCache": tile_cache,
+            "stride": stride,
+        }).encode()
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+
+class MemoryReporter:
+    """Records status updates and keeps render leases in memory, like the API does.
+
+    Share one between several `Worker`s to have them coordinate. With
+    `leases=False` every claim succeeds, as before leases existed.
+    """
+
+    def __init__(self, leases=True):
+        self.leases = leases
+        self.updates = []
+        self.done = set()
+        self.tile_caches = {}
+        self.strides = {}
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def update(self, job, status, worker_id, s3_key=None, thumbnail_key=None, tiles_key=None, tile_cache=None,
+               stride=None):
+        fractal_hash = job["hash"]
+        with self._lock:
+            if tile_cache is not None:
+                self.tile_caches[worker_id] = tile_cache
+            self.updates.append((fractal_hash, status, worker_id, s3_key))
+            if stride is not None:
+                self.strides[fractal_hash] = stride
+            if status == "renew":
+                if self._claims.get(fractal_hash, (None,))[0] != worker_id:
+                    return {"renewed": False}
+                self._claims[fractal_hash] = (worker_id, time.monotonic() + LEASE_SECONDS)
+                return {"renewed": True}
+            if status != "generating":
+                if status in ("complete", "too_complex"):
+                    self.done.add(fractal_hash)
+                if self._claims.get(fractal_hash, (None,))[0] == worker_id:
+                    del self._claims[fractal_hash]
+                return {}
+            if fractal_hash in self.done:
+                return {"skip": True}
+            holder, expires = self._claims.get(fractal_hash, (None, 0))
+            remaining = expires - time.monotonic()
+            if self.leases and holder not in (None, worker_id) and remaining > 0:
+                return {"wait": remaining}
+            self._claims[fractal_hash] = (worker_id, time.monotonic() + LEASE_SECONDS)
+            return {}
+
+
+_worker_numbers = itertools.count(1)
+
+
+@dataclass(eq=False)
+class _Render:
+    """One render, shared by every held duplicate of its job; `result` is set once started.
+
+    `claimed` is set once its lease is taken, just before it starts.
+    `resume` is the `(partial, stride)` an earlier attempt left, if any.
+
+    A streamed render's image is uploaded by `upload`, a future of its key;
+    `previews` is a future of its thumbnail and tiles keys once they are
+    being stored.
+    """
+
+    fractal_hash: str
+    options: dict
+    stored: object
+    encoding: str
+    lane: str
+    predicted: object = None
+    result: object = None
+    held_since: float = 0.0
+    stream: bool = False
+    cached: bool = False
+    upload: object = None
+    previews: object = None
+    claimed: bool = False
+    resume: object = None
+
+
+@dataclass
+class _InFlight:
+    message: object
+    job: dict
+    render: _Render
+    visible_until: float
+
+
+class Worker:
+    """Consumes `queue` with a pool of `workers` processes (default: one per core).
+
+    At most `max_in_flight` messages (default: twice the pool, and at least
+    one full receive) are held at a time, so jobs are ready to start the
+    moment a process frees up. The queue is asked for more once half a
+    receive's worth of room has opened, so receives stay close to full.
+    `store` receives images and iteration buffers and `reporter` status
+    updates; either may be None. With `coalesce`, duplicates of a job
+    already held share its render.
+
+    With `schedule`, renders are costed by `cost_model` and laned as the
+    module describes; at most `long_slots` processes (default: half the
+    pool, at least one) render long jobs at a time. Without it, held jobs
+    start in arrival order. With `stream` and a `store`, renders expected to
+    reach full resolution stream their image into the store as they go.
+
+    Images are stored in `encoding` (see `encodings.py`; `auto` picks per
+    colour scheme) at zlib level `compress_level`, with the previews
+    `pyramid` names (one of `PYRAMIDS`).
+
+    With `tile_cache_tiles`, each pool process holds a `TileCache` of that
+    many tiles; by default there is none.
+    """
+
+    def __init__(self, queue, store=None, reporter=None, workers=None, max_in_flight=None,
+                 receive_batch=RECEIVE_BATCH, delete_batch=RECEIVE_BATCH, poll_wait=20,
+                 visibility_timeout=VISIBILITY_TIMEOUT, max_time=MAX_RENDER_SECONDS,
+                 recheck_seconds=DUPLICATE_RECHECK_SECONDS, coalesce=True, schedule=True,
+                 cost_model=None, short_lane_seconds=SHORT_LANE_SECONDS, long_slots=None, stream=True,
+                 encoding="auto", compress_level=DEFAULT_COMPRESS_LEVEL, pyramid="tiles",
+                 tile_cache_tiles=0, log=print):
+        self.queue = queue
+        self.store = store
+        self.reporter = reporter
+        self.workers = workers or os.cpu_count()
+        self.max_in_flight = max_in_flight or max(2 * self.workers, receive_batch)
+        self.receive_batch = receive_batch
+        self.delete_batch = delete_batch
+        self.poll_wait = poll_wait
+        self.visibility_timeout = visibility_timeout
+        self.max_time = max_time
+        self.recheck_seconds = recheck_seconds
+        self.coalesce = coalesce
+        self.schedule = schedule
+        self.cost_model = cost_model or CostModel()
+        self.short_lane_seconds = short_lane_seconds
+        self.long_slots = long_slots or max(1, self.workers // 2)
+        self.stream = stream and store is not None
+        self.encoding = encoding
+        self.compress_level = compress_level
+        self.pyramid = pyramid if store is not None else "none"
+        self.tile_cache_tiles = tile_cache_tiles
+        self.tile_cache = dict.fromkeys(TILE_CACHE_COUNTERS, 0)
+        self.log = log
+        self.cost_log = deque(maxlen=COST_LOG_SIZE)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{next(_worker_numbers)}"
+        self.stats = dict.fromkeys(STATS, 0)
+        self._in_flight = {}
+        self._pending_deletes = []
+        self._flush_by = None
+        self._streams = {}
+        self._stream_tokens = itertools.count(1)
+        self._done = threading.Event()
+        self._stopping = False
+
+    def tile_cache_stats(self):
+        """The pool's tile cache counters, summed over its processes, with the tile hit ratio."""
+        stats = dict(self.tile_cache)
+        lookups = stats["tile_lookups"]
+        stats["hit_ratio"] = stats["tile_hits"] / lookups if lookups else 0.0
+        return stats
+
+    def stop(self):
+        self._stopping = True
+        self._done.set()
+
+    def run(self, max_jobs=None, stop_when_idle=False):
+        """Processes messages until `stop()`, `max_jobs` finished, or (optionally) an empty queue."""
+        pieces = multiprocessing.Queue() if self.stream else None
+        with Pool(self.workers, initializer=_init_pool, initargs=(pieces, self.tile_cache_tiles)) as pool, \
+                ThreadPoolExecutor(2 * self.workers) as uploads, \
+                ThreadPoolExecutor(PREVIEW_UPLOAD_THREADS) as tile_uploads:
+            router = None
+            if pieces is not None:
+                router = threading.Thread(target=self._route_pieces, args=(pieces,), daemon=True)
+                router.start()
+            self._uploads = uploads
+            self._tile_uploads = tile_uploads
+            while not self._stopping:
+                self._done.clear()
+                self._harvest()
+                self._dispatch(pool)
+                self._extend_visibility()
+                self._flush_deletes()
+                finished = sum(self.stats[outcome] for outcome in FINISHED)
+                if max_jobs is not None and finished >= max_jobs and not self._in_flight:
+                    break
+
+                free = self.max_in_flight - len(self._in_flight)
+                if free > 0 and (not self._in_flight or free >= min(self.receive_batch, self.max_in_flight) // 2):
+                    wait = 0 if self._in_flight or stop_when_idle else self.poll_wait
+                    received_at = time.monotonic()
+                    messages = self.queue.receive(min(self.receive_batch, free), wait)
+                    for message in messages:
+                        self._start(message, received_at)
+                    if messages:
+                        continue
+                    if stop_when_idle and not self._in_flight:
+                        break
+                if self._in_flight:
+                    self._done.wait(min(IDLE_WAIT_SECONDS, self.visibility_timeout * EXTEND_WHEN_REMAINING / 2))
+            self._harvest()
+            if router is not None:
+                pieces.put((None, None))
+                router.join()
+        self._flush_deletes(force=True)
+        return self.stats
+
+    def _route_pieces(self, pieces):
+        for token, piece in iter(pieces.get, (None, None)):
+            self._streams[token].put(piece)
+
+    def _report(self, job, status, s3_key=None, previews=(None, None), stride=None):
+        if self.reporter is None:
+            return {}
+        try:
+            return self.reporter.update(job, status, self.worker_id, s3_key, *previews,
+                                        tile_cache=self.tile_cache_stats(), stride=stride) or {}
+        except Exception as error:
+            self.log(f"Could not report status {status} for hash {job['hash']}: {error}")
+            return {}
+
+    def _start(self, message, received_at):
+        self.stats["received"] += 1
+        try:
+            job = json.loads(message.body)
+            options, fractal_hash = job["options"], job["hash"]
+        except (ValueError, KeyError, TypeError) as error:
+            # Left on the queue, so it ends up in the dead-letter queue like the Node worker's.
+            self.log(f"Failed to parse message {message.message_id}: {error}")
+            self.stats["failed"] += 1
+            return
+
+        leader = None
+        if self.coalesce:
+            leader = next((held for held in self._in_flight.values() if held.job["hash"] == fractal_hash), None)
+        if leader is not None:
+            # A duplicate of a job this worker already holds: share its render.
+            render = leader.render
+            self.stats["coalesced"] += 1
+            if render.claimed:
+                # Already rendering under this worker's lease; marks this job's history too.
+                self._report(job, "generating")
+        else:
+            stored = None
+            if self.store is not None:
+                try:
+                    stored = self.store.get(iterations_key(options))
+                except Exception as error:
+                    self.log(f"Could not load stored iterations for hash {fractal_hash}; rendering instead: {error}")
+            render = self._plan(job, stored)
+            if render is None:
+                self._delete(message, received_at + self.visibility_timeout)
+                return
+            if stored is None and job.get("resumeStride") and self.store is not None:
+                try:
+                    partial = self.store.get(partial_iterations_key(options))
+                except Exception as error:
+                    partial = None
+                    self.log(f"Could not load partial iterations for hash {fractal_hash}; rendering from scratch: {error}")
+                if partial is not None:
+                    # Refined in place of the streamed or cached render planned for a fresh one.
+                    render.resume = (partial, job["resumeStride"])
+                    render.stream = render.cached = False
+        self._in_flight[message.receipt_handle] = _InFlight(
+            message, job, render, received_at + self.visibility_timeout)
+
+    def _plan(self, job, stored):
+        """A render for the job in its lane, or None if it was rejected as too complex."""
+        encoding = resolve_encoding(self.encoding, job["options"].get("colourScheme", FractalParams.colour_scheme))
+        streamable = self.stream and encoding in STREAMABLE
+        # Recolouring a stored buffer is cheap whatever the render cost.
+        if stored is not None or not self.schedule:
+            return _Render(job["hash"], job["options"], stored, encoding, "short", held_since=time.monotonic(),
+                           stream=stored is None and streamable)
+        try:
+            estimate = probe_cost(FractalParams.from_options(job["options"]))
+        except Exception as error:
+            # The render fails the same way and is handled there.
+            self.log(f"Could not estimate the cost of hash {job['hash']}: {error}")
+            return _Render(job["hash"], job["options"], stored, encoding, "long", held_since=time.monotonic())
+        predicted = self.cost_model.seconds(estimate)
+        if self.cost_model.finest_stride(estimate, self.max_time * REJECT_MARGIN) is None:
+            self.log(f"Fractal with hash {job['hash']} predicted to take {predicted:.0f}s. Rejecting as too complex.")
+            self.cost_log.append({"hash": job["hash"], "lane": None, "predicted_seconds": predicted,
+                                  "actual_seconds": None, "stride": None})
+            self.stats["rejected"] += 1
+            self.stats["too_complex"] += 1
+            self._report(job, "too_complex")
+            return None
+        lane = "short" if predicted <= self.short_lane_seconds else "long"
+        # Only a render expected to finish can be cached or streamed; the progressive one degrades evenly.
+        full = self.cost_model.finest_stride(estimate, self.max_time) == 1
+        cached = full and self.tile_cache_tiles > 0 and _on_lattice(job["options"])
+        return _Render(job["hash"], job["options"], stored, encoding, lane, predicted, held_since=time.monotonic(),
+                       stream=streamable and full and not cached, cached=cached)
+
+    def _dispatch(self, pool):
+        """Starts held renders while processes are free: short lane first, long within `long_slots`."""
+        renders = list({id(held.render): held.render for held in self._in_flight.values()}.values())
+        running = [render for render in renders if render.result is not None and not render.result.ready()]
+        free = self.workers - len(running)
+        long_free = self.long_slots - sum(render.lane == "long" for render in running)
+        waiting = [render for render in renders if render.result is None]
+        if self.schedule:
+            overdue = time.monotonic() - LONG_LANE_MAX_WAIT
+            waiting.sort(key=lambda render: render.lane != "short" and render.held_since > overdue)
+        for render in waiting:
+            if free <= 0:
+                break
+            if self.schedule and render.lane == "long" and long_free <= 0:
+                continue
+            if not self._claim(render):
+                continue
+            if self.schedule and render.lane == "long":
+                long_free -= 1
+            self.stats["rendered"] += 1
+            self.stats[render.lane] += 1
+            token = None
+            if render.stream:
+                token = next(self._stream_tokens)
+                self._streams[token] = queue.SimpleQueue()
+                render.upload = self._uploads.submit(
+                    self.store.put_stream, image_key(render.fractal_hash, render.encoding),
+                    _drain(self._streams[token]), CONTENT_TYPES[render.encoding])
+                render.upload.add_done_callback(self._wake)
+                render.upload.add_done_callback(lambda _, token=token: self._streams.pop(token))
+            render.result = pool.apply_async(
+                render_job, (render.options, render.stored, self.max_time, token, render.encoding, self.compress_level,
+                             self.pyramid, render.cached, render.resume),
+                callback=self._wake, error_callback=self._wake)
+            free -= 1
+
+    def _claim(self, render):
+        """Claims the render's lease as it starts; False if its jobs were skipped or deferred instead."""
+        held = [(handle, entry) for handle, entry in self._in_flight.items() if entry.render is render]
+        reply = self._report(held[0][1].job, "generating")
+        if not reply.get("skip") and not reply.get("wait"):
+            render.claimed = True
+            for _, entry in held[1:]:
+                self._report(entry.job, "generating")
+            return True
+        for handle, _ in held:
+            del self._in_flight[handle]
+        if reply.get("skip"):
+            self.log(f"Fractal with hash {render.fractal_hash} already done. Skipping generation.")
+            self.stats["skipped"] += len(held)
+            for _, entry in held:
+                self._delete(entry.message, entry.visible_until)
+        else:
+            # Another worker is rendering it; come back for the result.
+            delay = max(1, min(int(reply["wait"]), self.recheck_seconds))
+            self.queue.extend([handle for handle, _ in held], delay)
+            self.stats["deferred"] += len(held)
+        return False
+
+    def _wake(self, _):
+        self._done.set()
+
+    def _harvest(self):
+        stored_keys = {}
+        logged = set()
+        for handle, held in list(self._in_flight.items()):
+            render = held.render
+            if render.result is None or not render.result.ready():
+                continue
+            if render.upload is not None and not render.upload.done():
+                continue  # The last part is still uploading.
+            if render.previews is None and render.result.successful() and render.result.get()["pyramid"]:
+                render.previews = self._uploads.submit(self._store_previews, render, render.result.get()["pyramid"])
+                render.previews.add_done_callback(self._wake)
+            if render.previews is not None and not render.previews.done():
+                continue
+            del self._in_flight[handle]
+            job = held.job
+            try:
+                outcome = render.result.get()
+                if render not in logged:
+                    logged.add(render)
+                    self._log_cost(job, render, outcome)
+                    for name, count in (outcome["tile_cache"] or {}).items():
+                        self.tile_cache[name] += count
+                if self._refine(held, outcome):
+                    continue
+                s3_key = stored_keys.get(job["hash"])
+                if outcome["status"] == "complete" and self.store is not None and s3_key is None:
+                    if render.upload is not None:
+                        s3_key = render.upload.result()
+                    else:
+                        s3_key = self.store.put(image_key(job["hash"], render.encoding), outcome["image"],
+                                                CONTENT_TYPES[render.encoding])
+                    if outcome["iterations"] is not None:
+                        self.store.put(iterations_key(job["options"]), outcome["iterations"])
+                    stored_keys[job["hash"]] = s3_key
+            except Exception as error:
+                # Not deleted: SQS hands it out again, then to the dead-letter queue.
+                self.log(f"Failed during fractal generation or storage for hash {job['hash']}: {error}")
+                self.stats["failed"] += 1
+                self._report(job, "failed")
+                continue
+            self.stats["completed" if outcome["status"] == "complete" else "too_complex"] += 1
+            self._report(job, outcome["status"], s3_key, self._preview_keys(job, render, s3_key), outcome["stride"])
+            self._delete(held.message, held.visible_until)
+
+    def _refine(self, held, outcome):
+        """Queues a render its deadline cut short again, like `requeueRefinement`; False to store it as it is."""
+        job = held.job
+        refinements = job.get("refinements", 0)
+        if (outcome["status"] != "complete" or outcome["partial"] is None or self.store is None
+                or refinements >= MAX_REFINEMENTS):
+            return False
+        self.store.put(partial_iterations_key(job["options"]), outcome["partial"])
+        self.queue.send(json.dumps({**job, "refinements": refinements + 1, "resumeStride": outcome["stride"]}))
+        self.stats["refined"] += 1
+        self._report(job, "requeued")
+        self._delete(held.message, held.visible_until)
+        self.log(f"Hash {job['hash']} reached 1/{outcome['stride']} resolution before its deadline; "
+                 f"queued refinement {refinements + 1} of {MAX_REFINEMENTS}.")
+        return True
+
+    def _store_previews(self, render, pyramid):
+        """Stores the render's thumbnail and tiles; returns their keys as `(thumbnail, tiles)`."""
+        objects = pyramid_objects(render.fractal_hash, pyramid, render.encoding)
+        for future in [self._tile_uploads.submit(self.store.put, *entry) for entry in objects]:
+            future.result()
+        return (thumbnail_key(render.fractal_hash, render.encoding),
+                tiles_key(render.fractal_hash) if pyramid["descriptor"] is not None else None)
+
+    def _preview_keys(self, job, render, s3_key):
+        if s3_key is None or render.previews is None:
+            return None, None
+        try:
+            return render.previews.result()
+        except Exception as error:
+            # The gallery falls back to the full image.
+            self.log(f"Could not store previews for hash {job['hash']}: {error}")
+            return None, None
+
+    def _log_cost(self, job, render, outcome):
+        if render.predicted is None:
+            return
+        self.cost_log.append({"hash": job["hash"], "lane": render.lane, "predicted_seconds": render.predicted,
+                              "actual_seconds": outcome["seconds"], "stride": outcome["stride"]})
+        if outcome["stride"] is None:
+            result = "ran out of time"
+        elif outcome["stride"] == 1:
+            result = "rendered"
+        else:
+            result = f"reached 1/{outcome['stride']} resolution"
+        self.log(f"Hash {job['hash']} {result} in {outcome['seconds']:.2f}s "
+                 f"(predicted {render.predicted:.2f}s, {render.lane} lane).")
+
+    def _delete(self, message, visible_until):
+        # Flushed within DELETE_FLUSH_SECONDS, and before the message could be handed out again.
+        flush_by = min(time.monotonic() + DELETE_FLUSH_SECONDS,
+                       visible_until - self.visibility_timeout * EXTEND_WHEN_REMAINING)
+        self._flush_by = flush_by if self._flush_by is None else min(self._flush_by, flush_by)
+        self._pending_deletes.append(message.receipt_handle)
+
+    def _flush_deletes(self, force=False):
+        if not self._pending_deletes:
+            return
+        due = time.monotonic() >= self._flush_by
+        if not (force or due or len(self._pending_deletes) >= self.delete_batch):
+            return
+        handles, self._pending_deletes, self._flush_by = self._pending_deletes, [], None
+        failed = self.queue.delete(handles)
+        self.stats["deleted"] += len(handles) - len(failed)
+        if failed:
+            self.log(f"Could not delete {len(failed)} messages; they will be delivered again.")
+
+    def _extend_visibility(self):
+        now = time.monotonic()
+        threshold = self.visibility_timeout * EXTEND_WHEN_REMAINING
+        expiring = [held for held in self._in_flight.values() if held.visible_until - now < threshold]
+        if not expiring:
+            return
+        self.queue.extend([held.message.receipt_handle for held in expiring], self.visibility_timeout)
+        for held in expiring:
+            held.visible_until = now + self.visibility_timeout
+        self.stats["extended"] += len(expiring)
+        # Started renders keep their lease, and their fractal's last_updated, as long as their messages.
+        renewing = {id(held.render): held for held in expiring if held.render.claimed}
+        for held in renewing.values():
+            if not self._report(held.job, "renew").get("renewed", True):
+                self.log(f"Lost the lease on hash {held.job['hash']}; another worker may render it too.")
@@ -0,0 +1,352 @@
+"""Load test for the fractal API: submit jobs at a set rate or concurrency and measure them.
+
+Open-loop (`--rate`): jobs arrive as a Poisson process at `rate` per
+second whether or not earlier ones have finished, the way independent users
+would, so a saturated service shows up as growing latency instead of a
+quietly lower request rate. Latency is measured from each job's scheduled
+arrival, so a stalled client doesn't hide the delay either.
+
+Closed-loop (`--concurrency`): that many jobs are in flight at all times;
+each worker submits its next job as soon as the last one is final.
+
+Every user logs in once and reuses its token and pooled connections for
+the whole run. Each job is timed from arrival to the `GET /fractal` answer
+(`submit`) and to its final status (`complete`), which is followed through
+the status endpoint (`AsyncFractalClient.wait_for`). The summary gives
+p50/p95/p99, a latency histogram and throughput as JSON; `--csv` writes
+one row per job. Ctrl-C stops arrivals early and still drains and reports.
+
+    python load_test.py --base-url http://localhost:3000/api --user user:Testtest123! \\
+        --rate 2 --duration 120 --json run.json --csv run.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+from fractal_client import FINAL_STATUSES, ApiError, AsyncFractalClient
+from fractal_engine.colour import COLOUR_SCHEMES
+
+DEFAULT_BASE_URL = "http://localhost:3000/api"
+
+# The ranges `load_script.py` has always drawn from.
+DEFAULT_ITERATIONS = (250, 2500)
+DEFAULT_POWERS = (2, 3)
+
+# Upper bounds of the latency histogram buckets, in seconds: 10ms doubling to about 20 minutes.
+HISTOGRAM_BOUNDS = [0.01 * 2 ** k for k in range(18)]
+
+PERCENTILES = (50, 95, 99)
+
+# Seconds to wait for jobs still in flight once arrivals stop.
+DEFAULT_DRAIN_SECONDS = 300
+
+# How often a closed-loop run checks whether its window is over.
+CHECK_SECONDS = 0.5
+
+CSV_FIELDS = ["job", "user", "arrival", "submit_seconds", "complete_seconds", "outcome", "hash", "iterations",
+              "error"]
+
+
+class ParameterMix:
+    """Draws `GET /fractal` query parameters from the load script's ranges.
+
+    With `distinct`, jobs cycle through that many parameter sets, so the
+    service's dedupe and caches are exercised; otherwise practically every
+    job is new.
+    """
+
+    def __init__(self, rng, width=1920, height=1080, iterations=DEFAULT_ITERATIONS, powers=DEFAULT_POWERS,
+                 schemes=COLOUR_SCHEMES, distinct=0):
+        self.rng = rng
+        self.width = width
+        self.height = height
+        self.iterations = iterations
+        self.powers = powers
+        self.schemes = list(schemes)
+        self.pool = [self._draw() for _ in range(distinct)]
+
+    def _draw(self):
+        rng = self.rng
+        return {
+            "width": self.width,
+            "height": self.height,
+            "iterations": rng.randint(*self.iterations),
+            "power": rng.choice(self.powers),
+            "scale": round(rng.uniform(0.5, 1.5), 3),
+            "offsetX": round(rng.uniform(-1, 1), 3),
+            "offsetY": round(rng.uniform(-1, 1), 3),
+            "color": rng.choice(self.schemes),
+            "real": round(rng.uniform(-2, 2), 3),
+            "imag": round(rng.uniform(-2, 2), 3),
+        }
+
+    def next(self):
+        return self.rng.choice(self.pool) if self.pool else self._draw()
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def histogram(values):
+    """`[{"le": bound, "count": n}]`, cumulative like Prometheus buckets, ending with `"+Inf"`."""
+    ordered = sorted(values)
+    buckets, index = [], 0
+    for bound in HISTOGRAM_BOUNDS:
+        while index < len(ordered) and ordered[index] <= bound:
+            index += 1
+        buckets.append({"le": round(bound, 3), "count": index})
+    buckets.append({"le": "+Inf", "count": len(ordered)})
+    return buckets
+
+
+def latency_summary(values):
+    ordered = sorted(values)
+    summary = {"count": len(ordered)}
+    if ordered:
+        summary.update({f"p{p}": percentile(ordered, p) for p in PERCENTILES})
+        summary.update({"mean": sum(ordered) / len(ordered), "max": ordered[-1]})
+    summary["histogram"] = histogram(ordered)
+    return summary
+
+
+class LoadTest:
+    """One run against `base_url` as `users` (`(username, password)` pairs).
+
+    Give `rate` for open-loop arrivals or `concurrency` for a closed loop.
+    `run()` returns the summary; `jobs` holds one record per job.
+    """
+
+    def __init__(self, base_url, users, mix, rate=None, concurrency=None, duration=60, max_jobs=None,
+                 wait=True, drain_seconds=DEFAULT_DRAIN_SECONDS, rng=None):
+        if (rate is None) == (concurrency is None):
+            raise ValueError("give either rate or concurrency")
+        self.base_url = base_url
+        self.users = users
+        self.mix = mix
+        self.rate = rate
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_jobs = max_jobs
+        self.wait = wait
+        self.drain_seconds = drain_seconds
+        self.rng = rng or random.Random()
+        self.clients = []
+        self.jobs = []
+        self.arrivals = 0
+        self.stopped = False
+
+    async def _login(self, username, password):
+        # Open-loop runs can have many jobs long-polling at once; give them a connection each.
+        client = AsyncFractalClient(self.base_url, pool_size=max(100, self.concurrency or 0))
+        try:
+            await client.login(username, password, remember_password=True)
+        except ApiError as error:
+            print(f"{username}: login failed: {error}", file=sys.stderr)
+        if client.logged_in:
+            return client
+        await client.close()
+        return None
+
+    def stop(self):
+        """Stops new arrivals; jobs in flight still drain. A second Ctrl-C interrupts as usual."""
+        self.stopped = True
+        try:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGINT)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    def _more_jobs(self, now):
+        return not self.stopped and now < self.started + self.duration and (self.max_jobs is None or self.arrivals < self.max_jobs)
+
+    async def _job(self, arrival):
+        client = self.rng.choice(self.clients)
+        params = self.mix.next()
+        job = {"job": len(self.jobs), "user": client.username, "arrival": arrival - self.started,
+               "submit_seconds": None, "complete_seconds": None, "outcome": None, "hash": None,
+               "iterations": params["iterations"], "error": None}
+        self.jobs.append(job)
+        try:
+            data = await client.generate(params)
+            job["submit_seconds"] = time.perf_counter() - arrival
+            job["hash"] = data.get("hash")
+            status = data.get("status")
+            if self.wait and status not in FINAL_STATUSES and job["hash"]:
+                data = await client.wait_for(job["hash"], status)
+                status = data.get("status")
+            if status in FINAL_STATUSES:
+                job["complete_seconds"] = time.perf_counter() - arrival
+            job["outcome"] = status or "unknown"
+        except ApiError as error:
+            job["outcome"] = "error"
+            job["error"] = str(error)
+        except asyncio.CancelledError:
+            job["outcome"] = "unfinished"
+            raise
+
+    async def _open_loop(self):
+        tasks = []
+        arrival = self.started
+        while True:
+            arrival += self.rng.expovariate(self.rate)
+            if not self._more_jobs(arrival):
+                break
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            self.arrivals += 1
+            tasks.append(asyncio.create_task(self._job(arrival)))
+        return tasks
+
+    async def _closed_loop(self):
+        async def worker():
+            while self._more_jobs(time.perf_counter()):
+                self.arrivals += 1
+                await self._job(time.perf_counter())
+        return [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+
+    async def run(self):
+        logged_in = await asyncio.gather(*[self._login(username, password) for username, password in self.users])
+        self.clients = [client for client in logged_in if client]
+        if not self.clients:
+            raise RuntimeError("No user could log in.")
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.stop)
+        except (NotImplementedError, RuntimeError):
+            pass
+        try:
+            self.started = time.perf_counter()
+            tasks = await (self._open_loop() if self.rate is not None else self._closed_loop())
+            # Closed-loop workers start their own jobs until the window ends; then everything drains.
+            while not all(task.done() for task in tasks) and self._more_jobs(time.perf_counter()):
+                await asyncio.sleep(CHECK_SECONDS)
+            self.stop()
+            if tasks:
+                _, unfinished = await asyncio.wait(tasks, timeout=self.drain_seconds)
+                for task in unfinished:
+                    task.cancel()
+                await asyncio.gather(*unfinished, return_exceptions=True)
+            finished = time.perf_counter()
+        finally:
+            await asyncio.gather(*[client.close() for client in self.clients])
+        return self.summary(finished - self.started)
+
+    def summary(self, total_seconds):
+        arrival_seconds = max((job["arrival"] for job in self.jobs), default=0.0)
+        outcomes = {}
+        for job in self.jobs:
+            outcomes[job["outcome"]] = outcomes.get(job["outcome"], 0) + 1
+        complete = [job for job in self.jobs if job["outcome"] == "complete"]
+        status_requests = sum(client.status_requests for client in self.clients)
+        return {
+            "base_url": self.base_url,
+            "mode": "open" if self.rate is not None else "closed",
+            "rate": self.rate,
+            "concurrency": self.concurrency,
+            "users": len(self.clients),
+            "jobs": len(self.jobs),
+            "outcomes": outcomes,
+            "arrival_seconds": arrival_seconds,
+            "total_seconds": total_seconds,
+            "offered_rate": len(self.jobs) / arrival_seconds if arrival_seconds else 0.0,
+            "throughput": len(complete) / total_seconds if total_seconds else 0.0,
+            "status_requests_per_job": status_requests / len(self.jobs) if self.jobs else 0.0,
+            "submit_latency": latency_summary([job["submit_seconds"] for job in self.jobs
+                                               if job["submit_seconds"] is not None]),
+            "complete_latency": latency_summary([job["complete_seconds"] for job in complete]),
+        }
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.jobs)
+
+
+def parse_user(value):
+    username, _, password = value.partition(":")
+    if not password:
+        raise argparse.ArgumentTypeError("expected username:password")
+    return username, password
+
+
+def parse_range(value):
+    low, _, high = value.partition(":")
+    try:
+        return int(low), int(high or low)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected min:max") from None
+
+
+def users_from_env():
+    """`USER_1_NAME` .. `USER_9_NAME` with `TEST_PASSWORD`, as `parallel_fractal_generator.py` reads them."""
+    password = os.environ.get("TEST_PASSWORD")
+    names = [os.environ.get(f"USER_{i}_NAME") for i in range(1, 10)]
+    return [(name, password) for name in names if name and password]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default=os.environ.get("FRACTAL_API_URL", DEFAULT_BASE_URL))
+    parser.add_argument("--user", type=parse_user, action="append", dest="users", metavar="NAME:PASSWORD",
+                        help="Repeat for more users (default: USER_n_NAME and TEST_PASSWORD).")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rate", type=float, help="Open loop: Poisson arrivals per second.")
+    mode.add_argument("--concurrency", type=int, help="Closed loop: jobs in flight at once.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of arrivals.")
+    parser.add_argument("--jobs", type=int, help="Stop arrivals after this many jobs.")
+    parser.add_argument("--no-wait", action="store_true", help="Time only the submit, not the render.")
+    parser.add_argument("--drain", type=float, default=DEFAULT_DRAIN_SECONDS,
+                        help="Seconds to wait for jobs in flight once arrivals stop.")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--iterations", type=parse_range, default=DEFAULT_ITERATIONS, metavar="MIN:MAX")
+    parser.add_argument("--colors", default=",".join(COLOUR_SCHEMES), help="Comma-separated colour schemes.")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="Cycle through this many parameter sets (default: a new one per job).")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Write the summary here as well as to stdout.")
+    parser.add_argument("--csv", help="Write one row per job here.")
+    args = parser.parse_args(argv)
+
+    schemes = args.colors.split(",")
+    unknown = [scheme for scheme in schemes if scheme not in COLOUR_SCHEMES]
+    if unknown:
+        parser.error(f"unknown colour schemes: {', '.join(unknown)}")
+    users = args.users or users_from_env()
+    if not users:
+        parser.error("no users: pass --user or set USER_1_NAME and TEST_PASSWORD")
+
+    rng = random.Random(args.seed)
+    mix = ParameterMix(rng, args.width, args.height, args.iterations, schemes=schemes, distinct=args.distinct)
+    test = LoadTest(args.base_url, users, mix, rate=args.rate, concurrency=args.concurrency,
+                    duration=args.duration, max_jobs=args.jobs, wait=not args.no_wait,
+                    drain_seconds=args.drain, rng=rng)
+    try:
+        summary = asyncio.run(test.run())
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    report = json.dumps(summary, indent=2)
+    print(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(report + "\n")
+    if args.csv:
+        test.write_csv(args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+// Page-N latency of the admin history listing, by LIMIT/OFFSET and by cursor.
+//
+//   LOCAL_STACK=1 node scripts/pagination_bench.js --rows 2000000 --pages 1,10,100,1000,10000
+//
+// Connects like the API (so use the local stack, not a shared database) and
+// first tops the history table up to --rows rows owned by a bench user;
+// --clean deletes them afterwards. For each page N it times fetching page N
+// at offset (N - 1) * limit against fetching it from page N - 1's `next`
+// cursor, the median of --repeat runs each.
+const { performance } = require('perf_hooks');
+const db = require('../src/database.js');
+const History = require('../src/models/history.model.js');
+const pagination = require('../src/models/pagination.js');
+
+const BENCH_USER = 'pagination-bench';
+
+const DEFAULTS = { rows: 2000000, limit: 20, pages: '1,10,100,1000,10000,50000', repeat: 5, clean: false };
+
+function parseArgs(argv) {
+    const options = { ...DEFAULTS };
+    for (let i = 0; i < argv.length; i++) {
+        const name = argv[i].replace(/^--/, '');
+        if (!(name in DEFAULTS)) {
+            throw new Error(`Unknown option ${argv[i]}; options are ${Object.keys(DEFAULTS).map((key) => `--${key}`).join(', ')}.`);
+        }
+        options[name] = typeof DEFAULTS[name] === 'boolean' ? true : argv[++i];
+    }
+    options.rows = parseInt(options.rows);
+    options.limit = parseInt(options.limit);
+    options.repeat = parseInt(options.repeat);
+    options.pages = String(options.pages).split(',').map((page) => parseInt(page));
+    return options;
+}
+
+async function seed(rows) {
+    const { rows: [{ count }] } = await db.query('SELECT COUNT(*) AS count FROM history');
+    const missing = rows - parseInt(count);
+    if (missing > 0) {
+        console.log(`Adding ${missing} history rows...`);
+        await db.query(`
+            INSERT INTO history (user_id, username, fractal_id, generated_at, status)
+            SELECT $1, $1, NULL, now() - i * interval '1 second', 'complete'
+            FROM generate_series(1, $2) AS i`, [BENCH_USER, missing]);
+    }
+    await db.query('ANALYZE history');
+}
+
+async function median(repeat, fn) {
+    const times = [];
+    for (let i = 0; i < repeat; i++) {
+        const start = performance.now();
+        await fn();
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+
+async function main() {
+    const options = parseArgs(process.argv.slice(2));
+    await db.initialised;
+    await seed(options.rows);
+
+    const countMs = await median(options.repeat, () => db.query('SELECT COUNT(*) FROM history h LEFT JOIN fractals f ON h.fractal_id = f.id'));
+    // The cache isn't started here, so every count reaches the database.
+    const estimateMs = await median(options.repeat, () => pagination.count('bench', 'count', 'SELECT COUNT(*) AS "totalCount" FROM history', [], 'history'));
+    console.log(`total count: COUNT(*) ${countMs.toFixed(1)} ms, estimate ${estimateMs.toFixed(1)} ms`);
+
+    const list = (offset, cursor) => History.getAllHistory({}, 'generated_at', 'DESC', options.limit, offset, cursor);
+    console.log(`\n${'page'.padStart(8)} ${'offset ms'.padStart(10)} ${'cursor ms'.padStart(10)}`);
+    for (const page of options.pages) {
+        const offset = (page - 1) * options.limit;
+        if (offset >= options.rows) break;
+        // The cursor a client would hold on reaching page N from page N - 1.
+        const cursor = page > 1 ? pagination.decodeCursor((await list(offset - options.limit)).next, History.SORT_KEYS) : null;
+        const offsetMs = await median(options.repeat, () => list(offset));
+        const cursorMs = await median(options.repeat, () => list(0, cursor));
+        console.log(`${String(page).padStart(8)} ${offsetMs.toFixed(1).padStart(10)} ${cursorMs.toFixed(1).padStart(10)}`);
+    }
+
+    if (options.clean) {
+        await db.query('DELETE FROM history WHERE user_id = $1', [BENCH_USER]);
+    }
+}
+
+main().then(() => process.exit(0), (error) => {
+    console.error(error.message);
+    process.exit(1);
+});
@@ -0,0 +1,64 @@
+// List-page URL signing: one presign per entry, as listings used to do,
+// against s3Service.signUrls (one signing pass per page) and
+// s3Service.getPresignedUrls, cold (no URL cached) and warm (the page seen
+// before, as repeated listings and status polls are).
+//
+//   node scripts/presign_bench.js --entries 50 --pages 200
+//
+// Signing is local (SigV4 needs credentials, not a round trip), so with AWS
+// credentials this measures the real cost; under LOCAL_STACK=1 it measures
+// the local stack's HMAC URLs instead.
+const { performance } = require('perf_hooks');
+const s3Service = require('../src/services/s3Service');
+
+const DEFAULTS = { entries: 50, pages: 200, expires: 300 };
+
+function parseArgs(argv) {
+    const options = { ...DEFAULTS };
+    for (let i = 0; i < argv.length; i++) {
+        const name = argv[i].replace(/^--/, '');
+        if (!(name in DEFAULTS)) {
+            throw new Error(`Unknown option ${argv[i]}; options are ${Object.keys(DEFAULTS).map((key) => `--${key}`).join(', ')}.`);
+        }
+        options[name] = parseInt(argv[++i]);
+    }
+    return options;
+}
+
+// The thumbnail keys of page `page`'s entries.
+const pageKeys = (page, entries) => Array.from({ length: entries }, (_, i) => `thumbnails/bench-${page}-${i}.webp`);
+
+async function timePages(pages, fn) {
+    const times = [];
+    for (let page = 0; page < pages; page++) {
+        const start = performance.now();
+        await fn(page);
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return { median: times[Math.floor(times.length / 2)], p95: times[Math.floor(times.length * 0.95)] };
+}
+
+async function main() {
+    const { entries, pages, expires } = parseArgs(process.argv.slice(2));
+    // Warms up credentials and configuration, which every variant shares.
+    await s3Service.signUrl('bench-warmup', expires);
+
+    const results = {
+        'per entry (before)': await timePages(pages, (page) => Promise.all(pageKeys(page, entries).map((key) => s3Service.signUrl(key, expires)))),
+        'one pass per page': await timePages(pages, (page) => s3Service.signUrls(pageKeys(page, entries), expires)),
+        'bulk, cold': await timePages(pages, (page) => s3Service.getPresignedUrls(pageKeys(pages + page, entries), expires)),
+        'bulk, warm': await timePages(pages, () => s3Service.getPresignedUrls(pageKeys(pages, entries), expires)),
+    };
+
+    console.log(`${entries} entries per page, ${pages} pages\n`);
+    console.log(`${'variant'.padEnd(20)} ${'median ms'.padStart(10)} ${'p95 ms'.padStart(10)}`);
+    for (const [name, { median, p95 }] of Object.entries(results)) {
+        console.log(`${name.padEnd(20)} ${median.toFixed(3).padStart(10)} ${p95.toFixed(3).padStart(10)}`);
+    }
+}
+
+main().then(() => process.exit(0), (error) => {
+    console.error(error.message);
+    process.exit(1);
+});
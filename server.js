@@ -1,4 +1,5 @@
 require('dotenv').config();
+const path = require('path');
 const express = require('express');
 const cors = require('cors');
 const { router: authRouter, verifyToken } = require('./src/routes/auth');
@@ -8,12 +9,17 @@ const galleryRouter = require('./src/routes/gallery');
 const s3Service = require('./src/services/s3Service');
 const awsConfigService = require('./src/services/awsConfigService');
 const cacheService = require('./src/services/cacheService');
+const jobEventService = require('./src/services/jobEventService');
+const localStack = require('./src/services/localStack');
 const app = express();
 let port;
 
 app.use(cors()); // Add this line - allows all origins
 app.use(express.json());
 app.use('/fractals', express.static('fractals'));
+if (localStack.enabled) {
+  app.use(localStack.OBJECTS_PATH, localStack.objects.serve);
+}
 app.use('/api/auth', authRouter);
 app.use('/api', fractalRouter);
 app.use('/api', historyRouter);
@@ -28,6 +34,12 @@ app.use('/api', galleryRouter);
     }
     await s3Service.ensureBucketAndTags();
     await cacheService.init();
+    jobEventService.startListening();
+    if (localStack.enabled) {
+      const workers = parseInt(process.env.LOCAL_WORKERS) || 1;
+      await localStack.startWorkers(path.join(__dirname, 'src/workers/fractal.worker.js'), workers);
+      console.log(`Local stack: ${workers} worker thread(s), data in ${localStack.STACK_DIR}`);
+    }
     app.listen(port, () => {
       console.log(`Server running on port ${port}`);
     });
@@ -1,12 +1,22 @@
-const { Pool } = require('pg');
+const { Pool, Client } = require('pg');
 const { SecretsManagerClient, GetSecretValueCommand } = require("@aws-sdk/client-secrets-manager");
 const { getAwsRegion } = require("./services/awsConfigService");
+const localStack = require("./services/localStack");
 
 const secret_name = "n11051337-A2-DB";
 
 let dbSecrets = {};
 
 async function getDbSecrets() {
+    if (localStack.enabled) {
+        try {
+            dbSecrets = await localStack.startDatabase();
+        } catch (error) {
+            console.error("Error starting the local database:", error.message);
+            process.exit(1);
+        }
+        return;
+    }
     const region = await getAwsRegion();
     const client = new SecretsManagerClient({ region: region });
     try {
@@ -46,10 +56,19 @@ async function initialiseDatabase() {
             status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'generating', 'complete', 'too_complex', 'failed')),
             created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
             last_updated TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            retry_count INTEGER NOT NULL DEFAULT 0
+            retry_count INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            lease_expires_at TIMESTAMP WITH TIME ZONE
         )`;
 
         await client.query(fractalsTable);
+        await client.query(`
+        ALTER TABLE fractals
+            ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+            ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE,
+            ADD COLUMN IF NOT EXISTS thumbnail_key TEXT,
+            ADD COLUMN IF NOT EXISTS tiles_key TEXT,
+            ADD COLUMN IF NOT EXISTS resolution_stride INTEGER NOT NULL DEFAULT 1`);
         const historyTable = `
         CREATE TABLE IF NOT EXISTS history (
             id SERIAL PRIMARY KEY,
@@ -75,6 +94,12 @@ async function initialiseDatabase() {
 
         await client.query(galleryTable);
 
+        // (sort column, id) indexes for the listings' default orders, so
+        // keyset pages are index range scans.
+        await client.query(`CREATE INDEX IF NOT EXISTS history_generated_at_id ON history (generated_at, id)`);
+        await client.query(`CREATE INDEX IF NOT EXISTS gallery_added_at_id ON gallery (added_at, id)`);
+        await client.query(`CREATE INDEX IF NOT EXISTS gallery_user_added_at_id ON gallery (user_id, added_at, id)`);
+
 
 
         client.release();
@@ -88,23 +113,61 @@ async function initialiseDatabase() {
 
 let pool;
 let initialised;
-let _resolveDbInitialised;
 
-async function initDbAndPool() {
-    await getDbSecrets();
+// Seconds between attempts to re-establish a LISTEN connection.
+const LISTEN_RETRY_SECONDS = 5;
 
-    pool = new Pool({
+function connectionConfig() {
+    return {
         host: dbSecrets.host,
         user: dbSecrets.username,
         password: dbSecrets.password,
         database: dbSecrets.dbname,
         port: dbSecrets.port,
+        ssl: localStack.enabled ? false : {
+            rejectUnauthorized: false
+        }
+    };
+}
+
+// Calls onNotification(payload) for every NOTIFY on `channel`. Uses its own
+// connection, outside the pool, and reconnects after errors; notifications
+// sent while it is down are lost, so listeners must not rely on every one.
+async function listen(channel, onNotification) {
+    await initialised;
+    const connect = async () => {
+        const client = new Client(connectionConfig());
+        let failed = false;
+        const retry = (err) => {
+            if (failed) return;
+            failed = true;
+            console.error(`LISTEN ${channel} connection failed; reconnecting in ${LISTEN_RETRY_SECONDS}s:`, err.message);
+            client.removeAllListeners();
+            client.on('error', () => {});
+            client.end().catch(() => {});
+            setTimeout(connect, LISTEN_RETRY_SECONDS * 1000);
+        };
+        client.on('notification', (message) => onNotification(message.payload));
+        client.on('error', retry);
+        try {
+            await client.connect();
+            await client.query(`LISTEN ${client.escapeIdentifier(channel)}`);
+        } catch (err) {
+            retry(err);
+        }
+    };
+    await connect();
+}
+let _resolveDbInitialised;
+
+async function initDbAndPool() {
+    await getDbSecrets();
+
+    pool = new Pool({
+        ...connectionConfig(),
         max: 5,
         idleTimeoutMillis: 30000,
         connectionTimeoutMillis: 2000,
-        ssl: {
-            rejectUnauthorized: false
-        }
     });
 
     pool.on('error', (err) => {
@@ -132,5 +195,10 @@ module.exports = {
         await initialised;
         return pool.connect();
     },
+    notify: async (channel, payload) => {
+        await initialised;
+        return pool.query('SELECT pg_notify($1, $2)', [channel, payload]);
+    },
+    listen,
     initialised: initialised
 };
\ No newline at end of file
@@ -16,7 +16,7 @@ exports.findFractalByHash = async (hash) => {
     }
 
     return new Promise((resolve, reject) => {
-        const sql = "SELECT id, hash, width, height, iterations, power, c_real, c_imag, scale, \"offsetX\", \"offsetY\", \"colourScheme\", s3_key, status, created_at, last_updated, retry_count FROM fractals WHERE hash = $1";
+        const sql = "SELECT id, hash, width, height, iterations, power, c_real, c_imag, scale, \"offsetX\", \"offsetY\", \"colourScheme\", s3_key, thumbnail_key, tiles_key, status, created_at, last_updated, retry_count, resolution_stride FROM fractals WHERE hash = $1";
         db.query(sql, [hash], (err, result) => {
             if (err) return reject(err);
             const fractal = result.rows[0];
@@ -42,6 +42,57 @@ exports.createFractal = (data) => {
     });
 };
 
+// Every fractal among `hashes`, in one query and without the cache.
+exports.findFractalsByHashes = (hashes) => {
+    return new Promise((resolve, reject) => {
+        const sql = "SELECT id, hash, width, height, iterations, power, c_real, c_imag, scale, \"offsetX\", \"offsetY\", \"colourScheme\", s3_key, thumbnail_key, tiles_key, status, created_at, last_updated, retry_count, resolution_stride FROM fractals WHERE hash = ANY($1)";
+        db.query(sql, [hashes], (err, result) => {
+            if (err) return reject(err);
+            resolve(result.rows);
+        });
+    });
+};
+
+// createFractal for many option sets in one INSERT. Hashes that already have
+// a row (a concurrent submission) are skipped; resolves to [{ id, hash }] for
+// the rows it created.
+exports.createFractals = (list) => {
+    return new Promise((resolve, reject) => {
+        if (list.length === 0) return resolve([]);
+        const params = [];
+        const rows = list.map((data) => {
+            const values = [data.hash, data.width, data.height, data.maxIterations, data.power, data.c.real, data.c.imag, data.scale, data.offsetX, data.offsetY, data.colourScheme, data.hash, 'pending', 0];
+            const placeholders = values.map((value) => {
+                params.push(value);
+                return `$${params.length}`;
+            });
+            return `(${placeholders.join(', ')})`;
+        });
+        const sql = `INSERT INTO fractals (hash, width, height, iterations, power, c_real, c_imag, scale, "offsetX", "offsetY", "colourScheme", s3_key, status, retry_count)
+                     VALUES ${rows.join(', ')} ON CONFLICT (hash) DO NOTHING RETURNING id, hash`;
+        db.query(sql, params, (err, result) => {
+            if (err) return reject(err);
+            for (const data of list) {
+                cacheService.del(`fractal:hash:${data.hash}`);
+            }
+            resolve(result.rows);
+        });
+    });
+};
+
+// Removes fractals that were created but never queued.
+exports.deleteFractalsByHashes = (hashes) => {
+    return new Promise((resolve, reject) => {
+        db.query("DELETE FROM fractals WHERE hash = ANY($1)", [hashes], (err, result) => {
+            if (err) return reject(err);
+            for (const hash of hashes) {
+                cacheService.del(`fractal:hash:${hash}`);
+            }
+            resolve(result);
+        });
+    });
+};
+
 exports.getFractalS3Key = async (id) => {
     const cacheKey = `fractal:id:${id}:s3key`;
     const cachedS3Key = await cacheService.get(cacheKey);
@@ -50,7 +101,7 @@ exports.getFractalS3Key = async (id) => {
     }
 
     return new Promise((resolve, reject) => {
-        const sql = "SELECT s3_key FROM fractals WHERE id = $1";
+        const sql = "SELECT s3_key, thumbnail_key, tiles_key FROM fractals WHERE id = $1";
         db.query(sql, [id], (err, result) => {
             if (err) return reject(err);
             const s3Key = result.rows[0];
@@ -75,7 +126,7 @@ exports.deleteFractal = async (id) => {
 
 exports.getFractalById = (id) => {
     return new Promise((resolve, reject) => {
-        const sql = "SELECT id, hash, width, height, iterations, power, c_real, c_imag, scale, \"offsetX\", \"offsetY\", \"colourScheme\", s3_key, status, created_at, last_updated, retry_count FROM fractals WHERE id = $1";
+        const sql = "SELECT id, hash, width, height, iterations, power, c_real, c_imag, scale, \"offsetX\", \"offsetY\", \"colourScheme\", s3_key, thumbnail_key, tiles_key, status, created_at, last_updated, retry_count, resolution_stride FROM fractals WHERE id = $1";
         db.query(sql, [id], (err, result) => {
             if (err) return reject(err);
             resolve(result.rows[0]);
@@ -94,6 +145,74 @@ exports.updateFractalStatus = (hash, status, retryCount) => {
     });
 };
 
+// Single-flight claim on a fractal's render. Atomically takes (or renews) the
+// lease unless the fractal is already finished or another worker holds an
+// unexpired lease. Resolves to { claimed: true }, or to { claimed: false,
+// status, retryAfterSeconds } where retryAfterSeconds is how long the current
+// lease has left (0 once the fractal is finished).
+exports.claimFractal = (hash, workerId, leaseSeconds) => {
+    return new Promise((resolve, reject) => {
+        const sql = `UPDATE fractals
+                     SET status = 'generating', last_updated = CURRENT_TIMESTAMP,
+                         claimed_by = $2, lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                     WHERE hash = $1
+                       AND status NOT IN ('complete', 'too_complex')
+                       AND (claimed_by IS NULL OR claimed_by = $2 OR lease_expires_at < CURRENT_TIMESTAMP)
+                     RETURNING id`;
+        db.query(sql, [hash, workerId, leaseSeconds], (err, result) => {
+            if (err) return reject(err);
+            cacheService.del(`fractal:hash:${hash}`);
+            if (result.rows.length > 0) {
+                return resolve({ claimed: true });
+            }
+
+            const holderSql = `SELECT status, GREATEST(EXTRACT(EPOCH FROM lease_expires_at - CURRENT_TIMESTAMP), 0) AS remaining
+                               FROM fractals WHERE hash = $1`;
+            db.query(holderSql, [hash], (err, result) => {
+                if (err) return reject(err);
+                const row = result.rows[0];
+                if (!row) {
+                    // No row to coordinate on; the worker creates it after rendering.
+                    return resolve({ claimed: true });
+                }
+                const finished = row.status === 'complete' || row.status === 'too_complex';
+                resolve({
+                    claimed: false,
+                    status: row.status,
+                    retryAfterSeconds: finished ? 0 : Math.ceil(Number(row.remaining) || 0),
+                });
+            });
+        });
+    });
+};
+
+// Extends a lease `workerId` still holds, and the fractal's last_updated so
+// status checks don't take a long render for a crashed worker. Resolves to
+// whether the lease was still held.
+exports.renewClaim = (hash, workerId, leaseSeconds) => {
+    return new Promise((resolve, reject) => {
+        const sql = `UPDATE fractals
+                     SET last_updated = CURRENT_TIMESTAMP, lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $3)
+                     WHERE hash = $1 AND claimed_by = $2 AND status = 'generating'
+                     RETURNING id`;
+        db.query(sql, [hash, workerId, leaseSeconds], (err, result) => {
+            if (err) return reject(err);
+            cacheService.del(`fractal:hash:${hash}`);
+            resolve(result.rows.length > 0);
+        });
+    });
+};
+
+exports.releaseClaim = (hash, workerId) => {
+    return new Promise((resolve, reject) => {
+        const sql = "UPDATE fractals SET claimed_by = NULL, lease_expires_at = NULL WHERE hash = $1 AND claimed_by = $2";
+        db.query(sql, [hash, workerId], (err, result) => {
+            if (err) return reject(err);
+            resolve(result);
+        });
+    });
+};
+
 exports.updateFractalS3Key = (hash, s3Key) => {
     return new Promise((resolve, reject) => {
         const sql = "UPDATE fractals SET s3_key = $2, last_updated = CURRENT_TIMESTAMP WHERE hash = $1";
@@ -103,4 +222,47 @@ exports.updateFractalS3Key = (hash, s3Key) => {
             resolve(result);
         });
     });
-};
\ No newline at end of file
+};
+
+// Thumbnail and Deep Zoom descriptor stored next to the image (see
+// pyramidService.js); either may be null, and the full image is used instead.
+exports.updateFractalPreviewKeys = (hash, thumbnailKey, tilesKey) => {
+    return new Promise((resolve, reject) => {
+        const sql = "UPDATE fractals SET thumbnail_key = $2, tiles_key = $3 WHERE hash = $1 RETURNING id";
+        db.query(sql, [hash, thumbnailKey || null, tilesKey || null], (err, result) => {
+            if (err) return reject(err);
+            cacheService.del(`fractal:hash:${hash}`);
+            if (result.rows[0]) {
+                cacheService.del(`fractal:id:${result.rows[0].id}:s3key`);
+            }
+            resolve(result);
+        });
+    });
+};
+
+// Resolution the stored image reached: 1 for full resolution, or the stride
+// of the last progressive pass of a render its deadline kept coarse.
+exports.updateFractalResolution = (hash, stride) => {
+    return new Promise((resolve, reject) => {
+        const sql = "UPDATE fractals SET resolution_stride = $2 WHERE hash = $1";
+        db.query(sql, [hash, stride], (err, result) => {
+            if (err) return reject(err);
+            cacheService.del(`fractal:hash:${hash}`);
+            resolve(result);
+        });
+    });
+};
+
+// Status changes are published on this Postgres channel, after the row (and,
+// for 'complete', its s3_key) is written, so API instances can answer clients
+// waiting on /fractal/status/:hash/wait (see jobEventService.js). A failed
+// notification is only logged: waiting clients still time out and re-read.
+exports.STATUS_CHANNEL = 'fractal_status';
+
+exports.notifyStatus = async (hash, status) => {
+    try {
+        await db.notify(exports.STATUS_CHANNEL, JSON.stringify({ hash, status }));
+    } catch (err) {
+        console.error(`Could not publish status ${status} for hash ${hash}:`, err);
+    }
+};
@@ -1,10 +1,32 @@
 const db = require('../database.js');
+const pagination = require('./pagination.js');
+const cacheService = require('../services/cacheService');
+
+const SORT_COLUMNS = {
+    id: 'g.id', hash: 'f.hash', width: 'f.width', height: 'f.height', iterations: 'f.iterations', power: 'f.power',
+    c_real: 'f.c_real', c_imag: 'f.c_imag', scale: 'f.scale', offsetX: 'f."offsetX"', offsetY: 'f."offsetY"',
+    colourScheme: 'f."colourScheme"', added_at: 'g.added_at',
+};
+const ADMIN_SORT_COLUMNS = { ...SORT_COLUMNS, user_id: 'g.user_id' };
+exports.SORT_KEYS = Object.keys(SORT_COLUMNS);
+exports.ADMIN_SORT_KEYS = Object.keys(ADMIN_SORT_COLUMNS);
+
+// Cache namespaces of a user's gallery listings and of the admin gallery.
+// Every change to gallery rows invalidates the owner's and the admin's.
+exports.userNamespace = (userId) => `gallery:${userId}`;
+exports.ADMIN_NAMESPACE = 'admin:gallery';
+
+const invalidateListings = (userId) => Promise.all([
+    cacheService.invalidate(exports.userNamespace(userId)),
+    cacheService.invalidate(exports.ADMIN_NAMESPACE),
+]);
 
 exports.addToGallery = (userId, fractalId, fractalHash) => {
     return new Promise((resolve, reject) => {
         const insertSql = "INSERT INTO gallery (user_id, fractal_id, fractal_hash) VALUES ($1, $2, $3) ON CONFLICT (user_id, fractal_hash) DO NOTHING";
-        db.query(insertSql, [userId, fractalId, fractalHash], (err) => {
+        db.query(insertSql, [userId, fractalId, fractalHash], async (err, inserted) => {
             if (err) return reject(err);
+            if (inserted.rowCount > 0) await invalidateListings(userId);
             const selectSql = "SELECT id FROM gallery WHERE user_id = $1 AND fractal_hash = $2";
             db.query(selectSql, [userId, fractalHash], (err, result) => {
                 if (err) return reject(err);
@@ -14,60 +36,84 @@ exports.addToGallery = (userId, fractalId, fractalHash) => {
     });
 };
 
-exports.getGalleryForUser = (userId, filters, sortBy, sortOrder, limit, offset) => {
+// addToGallery for many fractals in one INSERT; `entries` are { fractalId, hash }.
+exports.addManyToGallery = (userId, entries) => {
     return new Promise((resolve, reject) => {
-        let whereClauses = [`g.user_id = $1`];
-        let params = [userId];
-        let paramIndex = 2;
-
-        if (filters.colourScheme) {
-            whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
-            params.push(filters.colourScheme);
-        }
-        if (filters.power) {
-            whereClauses.push(`f.power = $${paramIndex++}`);
-            params.push(filters.power);
-        }
-        if (filters.iterations) {
-            whereClauses.push(`f.iterations = $${paramIndex++}`);
-            params.push(filters.iterations);
-        }
-        if (filters.width) {
-            whereClauses.push(`f.width = $${paramIndex++}`);
-            params.push(filters.width);
-        }
-        if (filters.height) {
-            whereClauses.push(`f.height = $${paramIndex++}`);
-            params.push(filters.height);
-        }
-
-        const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
-
-        const validSortColumns = ['id', 'hash', 'width', 'height', 'iterations', 'power', 'c_real', 'c_imag', 'scale', 'offsetX', 'offsetY', 'colourScheme', 'added_at'];
-        const sortColumn = validSortColumns.includes(sortBy) ? sortBy : 'added_at';
-        const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
+        if (entries.length === 0) return resolve();
+        const params = [userId];
+        const rows = entries.map(({ fractalId, hash }) => {
+            params.push(fractalId, hash);
+            return `($1, $${params.length - 1}, $${params.length})`;
+        });
+        const sql = `INSERT INTO gallery (user_id, fractal_id, fractal_hash) VALUES ${rows.join(', ')} ON CONFLICT (user_id, fractal_hash) DO NOTHING`;
+        db.query(sql, params, async (err, result) => {
+            if (err) return reject(err);
+            if (result.rowCount > 0) await invalidateListings(userId);
+            resolve();
+        });
+    });
+};
 
-        const countSql = `SELECT COUNT(*) as "totalCount" FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
-        db.query(countSql, params, (err, countResult) => {
+// The hashes among `hashes` already in the user's gallery, as a Set.
+exports.findGalleryHashesForUser = (userId, hashes) => {
+    return new Promise((resolve, reject) => {
+        const sql = "SELECT fractal_hash FROM gallery WHERE user_id = $1 AND fractal_hash = ANY($2)";
+        db.query(sql, [userId, hashes], (err, result) => {
             if (err) return reject(err);
-            const totalCount = parseInt(countResult.rows[0].totalCount);
-
-            const dataSql = `
-                SELECT g.id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", g.added_at, g.fractal_hash, f.s3_key, f.status
-                FROM gallery g
-                JOIN fractals f ON g.fractal_id = f.id
-                ${whereSql}
-                ORDER BY ${sortColumn} ${order}
-                LIMIT $${paramIndex++} OFFSET $${paramIndex++}
-            `;
-            db.query(dataSql, [...params, limit, offset], (err, dataResult) => {
-                if (err) return reject(err);
-                resolve({ rows: dataResult.rows, totalCount: totalCount });
-            });
+            resolve(new Set(result.rows.map((row) => row.fractal_hash)));
         });
     });
 };
 
+// A page of the user's gallery: { rows, totalCount, totalCountApproximate,
+// next, prev }. `cursor` is a decoded `next`/`prev` cursor; without one the
+// page starts at `offset`.
+exports.getGalleryForUser = async (userId, filters, sortBy, sortOrder, limit, offset, cursor) => {
+    let whereClauses = [`g.user_id = $1`];
+    let params = [userId];
+    let paramIndex = 2;
+
+    if (filters.colourScheme) {
+        whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
+        params.push(filters.colourScheme);
+    }
+    if (filters.power) {
+        whereClauses.push(`f.power = $${paramIndex++}`);
+        params.push(filters.power);
+    }
+    if (filters.iterations) {
+        whereClauses.push(`f.iterations = $${paramIndex++}`);
+        params.push(filters.iterations);
+    }
+    if (filters.width) {
+        whereClauses.push(`f.width = $${paramIndex++}`);
+        params.push(filters.width);
+    }
+    if (filters.height) {
+        whereClauses.push(`f.height = $${paramIndex++}`);
+        params.push(filters.height);
+    }
+
+    const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
+    const sort = pagination.resolveSort(SORT_COLUMNS, [], sortBy, sortOrder, 'added_at', 'g.id');
+
+    const countSql = `SELECT COUNT(*) as "totalCount" FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
+    const [page, counted] = await Promise.all([
+        pagination.page({
+            select: `g.id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", g.added_at, g.fractal_hash, f.s3_key, f.thumbnail_key, f.status`,
+            from: `gallery g JOIN fractals f ON g.fractal_id = f.id`,
+            where: whereClauses,
+            params,
+            sort,
+            limit,
+            cursor,
+            offset,
+        }),
+        pagination.count(exports.userNamespace(userId), `count:${JSON.stringify(filters)}`, countSql, params),
+    ]);
+    return { ...page, ...counted };
+};
+
 exports.getGalleryEntry = (id, userId, isAdmin) => {
     return new Promise((resolve, reject) => {
         let sql;
@@ -86,19 +132,36 @@ exports.getGalleryEntry = (id, userId, isAdmin) => {
     });
 };
 
+// Keys of an entry's full image and Deep Zoom tiles, for fetching them on demand.
+exports.getGalleryImageKeys = (id, userId, isAdmin) => {
+    return new Promise((resolve, reject) => {
+        let sql = "SELECT f.hash, f.s3_key, f.tiles_key FROM gallery g JOIN fractals f ON g.fractal_id = f.id WHERE g.id = $1";
+        let params = [id];
+        if (!isAdmin) {
+            sql += " AND g.user_id = $2";
+            params.push(userId);
+        }
+        db.query(sql, params, (err, result) => {
+            if (err) return reject(err);
+            resolve(result.rows[0]);
+        });
+    });
+};
+
 exports.deleteGalleryEntry = (id, userId, isAdmin) => {
     return new Promise((resolve, reject) => {
         let sql;
         let params;
         if (isAdmin) {
-            sql = "DELETE FROM gallery WHERE id = $1";
+            sql = "DELETE FROM gallery WHERE id = $1 RETURNING user_id";
             params = [id];
         } else {
-            sql = "DELETE FROM gallery WHERE id = $1 AND user_id = $2";
+            sql = "DELETE FROM gallery WHERE id = $1 AND user_id = $2 RETURNING user_id";
             params = [id, userId];
         }
-        db.query(sql, params, (err, result) => {
+        db.query(sql, params, async (err, result) => {
             if (err) return reject(err);
+            if (result.rowCount > 0) await invalidateListings(result.rows[0].user_id);
             resolve(result);
         });
     });
@@ -124,56 +187,49 @@ exports.findGalleryEntryByFractalHashAndUserId = (userId, fractalHash) => {
     });
 };
 
-exports.getAllGallery = (filters, sortBy, sortOrder, limit, offset) => {
-    return new Promise((resolve, reject) => {
-        let whereClauses = [];
-        let params = [];
-        let paramIndex = 1;
-
-        if (filters.colourScheme) {
-            whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
-            params.push(filters.colourScheme);
-        }
-        if (filters.power) {
-            whereClauses.push(`f.power = $${paramIndex++}`);
-            params.push(filters.power);
-        }
-        if (filters.iterations) {
-            whereClauses.push(`f.iterations = $${paramIndex++}`);
-            params.push(filters.iterations);
-        }
-        if (filters.width) {
-            whereClauses.push(`f.width = $${paramIndex++}`);
-            params.push(filters.width);
-        }
-        if (filters.height) {
-            whereClauses.push(`f.height = $${paramIndex++}`);
-            params.push(filters.height);
-        }
-
-        const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
-
-        const validSortColumns = ['id', 'user_id', 'hash', 'width', 'height', 'iterations', 'power', 'c_real', 'c_imag', 'scale', 'offsetX', 'offsetY', 'colourScheme', 'added_at'];
-        const sortColumn = validSortColumns.includes(sortBy) ? sortBy : 'added_at';
-        const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
-
-        const countSql = `SELECT COUNT(*) as "totalCount" FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
-        db.query(countSql, params, (err, countResult) => {
-            if (err) return reject(err);
-            const totalCount = parseInt(countResult.rows[0].totalCount);
-
-            const dataSql = `
-                SELECT g.id, g.user_id, (SELECT DISTINCT h_sub.username FROM history h_sub WHERE h_sub.user_id = g.user_id LIMIT 1) AS username, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", g.added_at, g.fractal_hash, f.s3_key, f.status
-                FROM gallery g
-                JOIN fractals f ON g.fractal_id = f.id
-                ${whereSql}
-                ORDER BY ${sortColumn} ${order}
-                LIMIT $${paramIndex++} OFFSET $${paramIndex++}
-            `;
-            db.query(dataSql, [...params, limit, offset], (err, dataResult) => {
-                if (err) return reject(err);
-                resolve({ rows: dataResult.rows, totalCount: totalCount });
-            });
-        });
-    });
-};
\ No newline at end of file
+// getGalleryForUser across every user, with each entry's owner.
+exports.getAllGallery = async (filters, sortBy, sortOrder, limit, offset, cursor) => {
+    let whereClauses = [];
+    let params = [];
+    let paramIndex = 1;
+
+    if (filters.colourScheme) {
+        whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
+        params.push(filters.colourScheme);
+    }
+    if (filters.power) {
+        whereClauses.push(`f.power = $${paramIndex++}`);
+        params.push(filters.power);
+    }
+    if (filters.iterations) {
+        whereClauses.push(`f.iterations = $${paramIndex++}`);
+        params.push(filters.iterations);
+    }
+    if (filters.width) {
+        whereClauses.push(`f.width = $${paramIndex++}`);
+        params.push(filters.width);
+    }
+    if (filters.height) {
+        whereClauses.push(`f.height = $${paramIndex++}`);
+        params.push(filters.height);
+    }
+
+    const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
+    const sort = pagination.resolveSort(ADMIN_SORT_COLUMNS, [], sortBy, sortOrder, 'added_at', 'g.id');
+
+    const countSql = `SELECT COUNT(*) as "totalCount" FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
+    const [page, counted] = await Promise.all([
+        pagination.page({
+            select: `g.id, g.user_id, (SELECT DISTINCT h_sub.username FROM history h_sub WHERE h_sub.user_id = g.user_id LIMIT 1) AS username, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", g.added_at, g.fractal_hash, f.s3_key, f.thumbnail_key, f.status`,
+            from: `gallery g JOIN fractals f ON g.fractal_id = f.id`,
+            where: whereClauses,
+            params,
+            sort,
+            limit,
+            cursor,
+            offset,
+        }),
+        pagination.count(exports.ADMIN_NAMESPACE, `count:${JSON.stringify(filters)}`, countSql, params, whereClauses.length === 0 ? 'gallery' : null),
+    ]);
+    return { ...page, ...counted };
+};
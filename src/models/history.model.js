@@ -1,4 +1,19 @@
 const db = require('../database.js');
+const pagination = require('./pagination.js');
+const cacheService = require('../services/cacheService');
+
+const SORT_COLUMNS = {
+    id: 'h.id', hash: 'f.hash', width: 'f.width', height: 'f.height', iterations: 'f.iterations', power: 'f.power',
+    c_real: 'f.c_real', c_imag: 'f.c_imag', scale: 'f.scale', offsetX: 'f."offsetX"', offsetY: 'f."offsetY"',
+    colourScheme: 'f."colourScheme"', generated_at: 'h.generated_at', user_id: 'h.user_id', username: 'h.username',
+};
+// Fractal columns are NULL for entries whose fractal was deleted.
+const NULLABLE_SORT_COLUMNS = ['hash', 'width', 'height', 'iterations', 'power', 'c_real', 'c_imag', 'scale', 'offsetX', 'offsetY', 'colourScheme'];
+exports.SORT_KEYS = Object.keys(SORT_COLUMNS);
+
+// Cache namespace of the admin history's counts, invalidated whenever
+// entries are added or removed.
+exports.ADMIN_NAMESPACE = 'admin:history';
 
 exports.getHistoryForUser = (userId) => {
     return new Promise((resolve, reject) => {
@@ -19,13 +34,43 @@ exports.getHistoryForUser = (userId) => {
 exports.createHistoryEntry = (userId, username, fractalId, status = 'pending') => {
     return new Promise((resolve, reject) => {
         const sql = "INSERT INTO history (user_id, username, fractal_id, status) VALUES ($1, $2, $3, $4) RETURNING id";
-        db.query(sql, [userId, username, fractalId, status], (err, result) => {
+        db.query(sql, [userId, username, fractalId, status], async (err, result) => {
             if (err) return reject(err);
+            await cacheService.invalidate(exports.ADMIN_NAMESPACE);
             resolve({ id: result.rows[0].id });
         });
     });
 };
 
+// createHistoryEntry for many fractals in one INSERT. `entries` are
+// { fractalId, status }; resolves to [{ id, fractal_id }].
+exports.createHistoryEntries = (userId, username, entries) => {
+    return new Promise((resolve, reject) => {
+        if (entries.length === 0) return resolve([]);
+        const params = [userId, username];
+        const rows = entries.map(({ fractalId, status }) => {
+            params.push(fractalId, status || 'pending');
+            return `($1, $2, $${params.length - 1}, $${params.length})`;
+        });
+        const sql = `INSERT INTO history (user_id, username, fractal_id, status) VALUES ${rows.join(', ')} RETURNING id, fractal_id`;
+        db.query(sql, params, async (err, result) => {
+            if (err) return reject(err);
+            await cacheService.invalidate(exports.ADMIN_NAMESPACE);
+            resolve(result.rows);
+        });
+    });
+};
+
+exports.deleteHistoryEntries = (ids) => {
+    return new Promise((resolve, reject) => {
+        db.query("DELETE FROM history WHERE id = ANY($1)", [ids], async (err, result) => {
+            if (err) return reject(err);
+            await cacheService.invalidate(exports.ADMIN_NAMESPACE);
+            resolve(result);
+        });
+    });
+};
+
 exports.getHistoryEntry = (id, userId) => {
     return new Promise((resolve, reject) => {
         const sql = "SELECT fractal_id FROM history WHERE id = $1 AND user_id = $2";
@@ -66,64 +111,51 @@ exports.countHistoryByFractalId = (fractalId) => {
     });
 };
 
-exports.getAllHistory = (filters, sortBy, sortOrder, limit, offset) => {
-
-    return new Promise((resolve, reject) => {
-        let whereClauses = [];
-        let params = [];
-        let paramIndex = 1;
+// A page of every user's history: { rows, totalCount, totalCountApproximate,
+// next, prev }. `cursor` is a decoded `next`/`prev` cursor; without one the
+// page starts at `offset`.
+exports.getAllHistory = async (filters, sortBy, sortOrder, limit, offset, cursor) => {
+    let whereClauses = [];
+    let params = [];
+    let paramIndex = 1;
 
-        if (filters.colourScheme) {
-            whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
-            params.push(filters.colourScheme);
-        }
-        if (filters.power) {
-            whereClauses.push(`f.power = $${paramIndex++}`);
-            params.push(filters.power);
-        }
-        if (filters.iterations) {
-            whereClauses.push(`f.iterations = $${paramIndex++}`);
-            params.push(filters.iterations);
-        }
-        if (filters.width) {
-            whereClauses.push(`f.width = $${paramIndex++}`);
-            params.push(filters.width);
-        }
-        if (filters.height) {
-            whereClauses.push(`f.height = $${paramIndex++}`);
-            params.push(filters.height);
-        }
+    if (filters.colourScheme) {
+        whereClauses.push(`f."colourScheme" = $${paramIndex++}`);
+        params.push(filters.colourScheme);
+    }
+    if (filters.power) {
+        whereClauses.push(`f.power = $${paramIndex++}`);
+        params.push(filters.power);
+    }
+    if (filters.iterations) {
+        whereClauses.push(`f.iterations = $${paramIndex++}`);
+        params.push(filters.iterations);
+    }
+    if (filters.width) {
+        whereClauses.push(`f.width = $${paramIndex++}`);
+        params.push(filters.width);
+    }
+    if (filters.height) {
+        whereClauses.push(`f.height = $${paramIndex++}`);
+        params.push(filters.height);
+    }
 
-        const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
+    const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
+    const sort = pagination.resolveSort(SORT_COLUMNS, NULLABLE_SORT_COLUMNS, sortBy, sortOrder, 'generated_at', 'h.id');
 
-        const validSortColumns = ['id', 'hash', 'width', 'height', 'iterations', 'power', 'c_real', 'c_imag', 'scale', 'offsetX', 'offsetY', 'colourScheme', 'generated_at', 'user_id', 'username'];
-        const sortColumn = validSortColumns.includes(sortBy) ? sortBy : 'generated_at';
-        const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
-
-        const countSql = `SELECT COUNT(*) as "totalCount" FROM history h LEFT JOIN fractals f ON h.fractal_id = f.id ${whereSql}`;
-
-        db.query(countSql, params, (err, countResult) => {
-            
-            if (err) {
-                return reject(err);
-            }
-            const totalCount = parseInt(countResult.rows[0].totalCount);
-
-            const dataSql = `
-                SELECT h.id, h.user_id, h.username, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", h.generated_at, h.status, f.s3_key, (f.id IS NULL) AS fractal_deleted
-                FROM history h
-                LEFT JOIN fractals f ON h.fractal_id = f.id
-                ${whereSql}
-                ORDER BY ${sortColumn} ${order}
-                LIMIT $${paramIndex++} OFFSET $${paramIndex++}
-            `;
-            const dataParams = [...params, limit, offset];
-            db.query(dataSql, dataParams, (err, dataResult) => {
-                if (err) {
-                    return reject(err);
-                }
-                resolve({ rows: dataResult.rows, totalCount: totalCount });
-            });
-        });
-    });
-};
\ No newline at end of file
+    const countSql = `SELECT COUNT(*) as "totalCount" FROM history h LEFT JOIN fractals f ON h.fractal_id = f.id ${whereSql}`;
+    const [page, counted] = await Promise.all([
+        pagination.page({
+            select: `h.id, h.user_id, h.username, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f."offsetX", f."offsetY", f."colourScheme", h.generated_at, h.status, f.s3_key, f.thumbnail_key, (f.id IS NULL) AS fractal_deleted`,
+            from: `history h LEFT JOIN fractals f ON h.fractal_id = f.id`,
+            where: whereClauses,
+            params,
+            sort,
+            limit,
+            cursor,
+            offset,
+        }),
+        pagination.count(exports.ADMIN_NAMESPACE, `count:${JSON.stringify(filters)}`, countSql, params, whereClauses.length === 0 ? 'history' : null),
+    ]);
+    return { ...page, ...counted };
+};
@@ -0,0 +1,143 @@
+const db = require('../database.js');
+const cacheService = require('../services/cacheService');
+
+// Keyset pagination for the gallery and history listings. A page is the
+// `limit` rows after (or before) a cursor in (sort column, id) order, found
+// by an index range scan however deep it is, where LIMIT/OFFSET reads and
+// discards every row before it. Cursors are opaque base64url JSON carrying
+// the sort they belong to, so a cursor keeps its listing's order.
+
+// Seconds a listing's total count is kept; changes to the listing
+// invalidate it sooner through its cache namespace.
+const COUNT_TTL_SECONDS = 600;
+// Unfiltered listings of tables with more rows than this report the
+// planner's estimate (pg_class.reltuples) instead of counting them.
+const ESTIMATE_ABOVE_ROWS = 100000;
+
+const flip = (order) => (order === 'ASC' ? 'DESC' : 'ASC');
+
+// The sort for a listing's `sortBy`/`sortOrder`. `columns` maps each sort key
+// to its SQL expression; keys in `nullable` can be NULL (LEFT JOINs).
+exports.resolveSort = (columns, nullable, sortBy, sortOrder, defaultKey, idExpr) => {
+    const key = Object.prototype.hasOwnProperty.call(columns, sortBy) ? sortBy : defaultKey;
+    return {
+        key,
+        expr: columns[key],
+        id: idExpr,
+        order: (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC',
+        nullable: nullable.includes(key),
+    };
+};
+
+exports.encodeCursor = (sort, value, id, direction) => {
+    const cursor = { s: sort.key, o: sort.order, v: value, id, d: direction };
+    return Buffer.from(JSON.stringify(cursor)).toString('base64url');
+};
+
+// { sortBy, sortOrder, value, id, direction }, or null if `token` isn't a
+// cursor of a listing sorted by one of `sortKeys` (that listing's keys).
+exports.decodeCursor = (token, sortKeys) => {
+    try {
+        const { s, o, v, id, d } = JSON.parse(Buffer.from(String(token), 'base64url').toString());
+        if (!sortKeys.includes(s) || !['ASC', 'DESC'].includes(o) || !Number.isInteger(id)
+            || !['next', 'prev'].includes(d) || (v !== null && typeof v !== 'string')) {
+            return null;
+        }
+        return { sortBy: s, sortOrder: o, value: v, id, direction: d };
+    } catch (error) {
+        return null;
+    }
+};
+
+// WHERE clause for the rows after the cursor row when scanning in `scan`
+// order, with Postgres's default NULL placement (last ascending, first
+// descending). Pushes its parameters onto `params`.
+function afterCursor(sort, scan, cursor, params) {
+    const cmp = scan === 'ASC' ? '>' : '<';
+    params.push(cursor.id);
+    const id = `$${params.length}`;
+    if (cursor.value === null) {
+        // Only reachable on nullable sorts: rows after it are the rest of the
+        // NULLs and, scanning descending, every non-NULL row.
+        const rest = `(${sort.expr} IS NULL AND ${sort.id} ${cmp} ${id})`;
+        return scan === 'ASC' ? rest : `(${rest} OR ${sort.expr} IS NOT NULL)`;
+    }
+    params.push(cursor.value);
+    const value = `$${params.length}`;
+    if (!sort.nullable) {
+        return `(${sort.expr}, ${sort.id}) ${cmp} (${value}, ${id})`;
+    }
+    const after = `(${sort.expr} ${cmp} ${value} OR (${sort.expr} = ${value} AND ${sort.id} ${cmp} ${id})`;
+    return scan === 'ASC' ? `${after} OR ${sort.expr} IS NULL)` : `${after})`;
+}
+
+// One page of `SELECT ${select} FROM ${from} WHERE ${where}` in `sort` order:
+// { rows, next, prev } with cursors to the neighbouring pages, null at
+// either end. Without a cursor the page starts at `offset`, for clients that
+// still page by offset. Rows must have an `id` column (sort.id).
+exports.page = ({ select, from, where, params, sort, limit, cursor, offset }) => {
+    return new Promise((resolve, reject) => {
+        const backwards = Boolean(cursor) && cursor.direction === 'prev';
+        const scan = backwards ? flip(sort.order) : sort.order;
+        const clauses = [...where];
+        const values = [...params];
+        if (cursor) {
+            clauses.push(afterCursor(sort, scan, cursor, values));
+        }
+        const whereSql = clauses.length > 0 ? `WHERE ` + clauses.join(` AND `) : ``;
+
+        // The sort value as text keeps timestamps' microseconds, which a JS
+        // Date would round away, and reads back as the column's type.
+        values.push(limit + 1);
+        let sql = `
+            SELECT ${select}, (${sort.expr})::text AS "sortValue"
+            FROM ${from}
+            ${whereSql}
+            ORDER BY ${sort.expr} ${scan}, ${sort.id} ${scan}
+            LIMIT $${values.length}`;
+        if (!cursor && offset > 0) {
+            values.push(offset);
+            sql += ` OFFSET $${values.length}`;
+        }
+
+        db.query(sql, values, (err, result) => {
+            if (err) return reject(err);
+            let rows = result.rows;
+            const more = rows.length > limit;
+            rows = rows.slice(0, limit);
+            if (backwards) rows.reverse();
+
+            const first = rows[0];
+            const last = rows[rows.length - 1];
+            const hasPrev = backwards ? more : Boolean(cursor) || offset > 0;
+            const hasNext = backwards || more;
+            const next = hasNext && last ? exports.encodeCursor(sort, last.sortValue, last.id, 'next') : null;
+            const prev = hasPrev && first ? exports.encodeCursor(sort, first.sortValue, first.id, 'prev') : null;
+            rows.forEach((row) => delete row.sortValue);
+            resolve({ rows, next, prev });
+        });
+    });
+};
+
+// { totalCount, totalCountApproximate } for a listing, cached as `key` in
+// the listing's cache `namespace`. With `estimateTable` (unfiltered
+// listings of that table) large tables are estimated instead of counted.
+exports.count = async (namespace, key, countSql, params, estimateTable) => {
+    const { value: cached, generation } = await cacheService.getIn(namespace, key);
+    if (cached) return cached;
+
+    let counted = null;
+    if (estimateTable) {
+        const result = await db.query("SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = to_regclass($1)", [estimateTable]);
+        const estimate = result.rows.length > 0 ? parseInt(result.rows[0].estimate) : -1;
+        if (estimate > ESTIMATE_ABOVE_ROWS) {
+            counted = { totalCount: estimate, totalCountApproximate: true };
+        }
+    }
+    if (!counted) {
+        const result = await db.query(countSql, params);
+        counted = { totalCount: parseInt(result.rows[0].totalCount), totalCountApproximate: false };
+    }
+    await cacheService.setIn(namespace, key, generation, counted, COUNT_TTL_SECONDS);
+    return counted;
+};
@@ -3,6 +3,7 @@ const { CognitoIdentityProviderClient, SignUpCommand, ConfirmSignUpCommand, Init
 const { CognitoJwtVerifier } = require("aws-jwt-verify");
 const crypto = require('crypto');
 const awsConfigService = require('../services/awsConfigService');
+const localStack = require('../services/localStack');
 
 const router = express.Router();
 
@@ -38,6 +39,9 @@ let idVerifier;
 
 async function initialiseIdVerifier() {
     await initialiseCognitoConfig();
+    if (localStack.enabled) {
+        return;
+    }
     idVerifier = CognitoJwtVerifier.create({
         userPoolId: USER_POOL_ID,
         tokenUse: "id",
@@ -56,7 +60,7 @@ async function verifyToken(req, res, next) {
     }
 
     try {
-        const payload = await idVerifier.verify(token);
+        const payload = localStack.enabled ? localStack.identity.verify(token) : await idVerifier.verify(token);
         req.user = {
             id: payload.sub,
             username: payload['cognito:username'],
@@ -69,6 +73,73 @@ async function verifyToken(req, res, next) {
     }
 }
 
+// The same flows against the local stack's user store (see localStack.js),
+// answering as the Cognito-backed routes below do. Registered first, so they
+// take over every auth route when the local stack is on.
+if (localStack.enabled) {
+    const authenticationResult = (result) => ({
+        idToken: result.IdToken,
+        accessToken: result.AccessToken,
+        expiresIn: result.ExpiresIn,
+        tokenType: result.TokenType,
+        refreshToken: result.RefreshToken,
+    });
+
+    router.post('/signup', (req, res) => {
+        const { username, email, password } = req.body;
+        if (!username || !email || !password) {
+            return res.status(400).send('Username, email, and password are required.');
+        }
+        try {
+            localStack.identity.signUp(username, email, password);
+            res.status(200).send('User registered successfully. Please check your email for a confirmation code.');
+        } catch (error) {
+            res.status(500).send(error.message);
+        }
+    });
+
+    router.post('/confirm', (req, res) => {
+        const { username, confirmationCode } = req.body;
+        if (!username || !confirmationCode) {
+            return res.status(400).send('Username and confirmation code are required.');
+        }
+        try {
+            localStack.identity.confirmSignUp(username, confirmationCode);
+            res.status(200).send('User confirmed successfully.');
+        } catch (error) {
+            res.status(500).send(error.message);
+        }
+    });
+
+    router.post('/login', (req, res) => {
+        const { username, password } = req.body;
+        if (!username || !password) {
+            return res.status(400).send('Username and password are required.');
+        }
+        try {
+            res.json(authenticationResult(localStack.identity.login(username, password)));
+        } catch (error) {
+            res.status(500).send(error.message);
+        }
+    });
+
+    router.post('/confirm-mfa', (req, res) => {
+        res.status(400).send('The local stack does not issue MFA challenges.');
+    });
+
+    router.post('/refresh', (req, res) => {
+        const { username, refreshToken } = req.body;
+        if (!username || !refreshToken) {
+            return res.status(400).send('Username and refresh token are required.');
+        }
+        try {
+            res.json(authenticationResult(localStack.identity.refresh(refreshToken)));
+        } catch (error) {
+            res.status(401).send(error.message);
+        }
+    });
+}
+
 router.post('/signup', async (req, res) => {
     const POOL_REGION = await awsConfigService.getParameter('/n11051337/aws_region');
     if (!POOL_REGION) {
@@ -173,6 +244,7 @@ router.post('/login', async (req, res) => {
             accessToken: response.AuthenticationResult.AccessToken,
             expiresIn: response.AuthenticationResult.ExpiresIn,
             tokenType: response.AuthenticationResult.TokenType,
+            refreshToken: response.AuthenticationResult.RefreshToken,
         });
     } catch (error) {
         res.status(500).send(error.message);
@@ -212,12 +284,52 @@ router.post('/confirm-mfa', async (req, res) => {
             accessToken: response.AuthenticationResult.AccessToken,
             expiresIn: response.AuthenticationResult.ExpiresIn,
             tokenType: response.AuthenticationResult.TokenType,
+            refreshToken: response.AuthenticationResult.RefreshToken,
         });
     } catch (error) {
         res.status(500).send(error.message);
     }
 });
 
+// Trades a refresh token from /login or /confirm-mfa for fresh id and access
+// tokens, so clients can keep a session going without storing the password.
+router.post('/refresh', async (req, res) => {
+    const POOL_REGION = await awsConfigService.getParameter('/n11051337/aws_region');
+    if (!POOL_REGION) {
+        console.error('Failed to retrieve POOL_REGION from Parameter Store. Exiting application.');
+        process.exit(1);
+    }
+    const cognitoClient = new CognitoIdentityProviderClient({ region: POOL_REGION });
+
+    const { username, refreshToken } = req.body;
+
+    if (!username || !refreshToken) {
+        return res.status(400).send('Username and refresh token are required.');
+    }
+
+    const params = {
+        AuthFlow: 'REFRESH_TOKEN_AUTH',
+        ClientId: CLIENT_ID,
+        AuthParameters: {
+            REFRESH_TOKEN: refreshToken,
+            SECRET_HASH: await secretHash(CLIENT_ID, username),
+        },
+    };
+
+    try {
+        const command = new InitiateAuthCommand(params);
+        const response = await cognitoClient.send(command);
+        res.json({
+            idToken: response.AuthenticationResult.IdToken,
+            accessToken: response.AuthenticationResult.AccessToken,
+            expiresIn: response.AuthenticationResult.ExpiresIn,
+            tokenType: response.AuthenticationResult.TokenType,
+        });
+    } catch (error) {
+        res.status(401).send(error.message);
+    }
+});
+
 async function verifyApiKey(req, res, next) {
     const apiKey = req.headers['x-api-key'];
     if (!apiKey) {
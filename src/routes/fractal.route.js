@@ -7,79 +7,90 @@ const History = require('../models/history.model.js');
 const Gallery = require('../models/gallery.model.js');
 const s3Service = require('../services/s3Service');
 const cacheService = require('../services/cacheService');
-const { SQSClient, SendMessageCommand } = require('@aws-sdk/client-sqs');
+const { SQSClient, SendMessageCommand, SendMessageBatchCommand } = require('@aws-sdk/client-sqs');
 const awsConfigService = require('../services/awsConfigService');
+const localStack = require('../services/localStack');
+const jobEventService = require('../services/jobEventService');
 
 let sqsClient;
 let queueUrl;
 
+// Long-polls on /fractal/status/:hash/wait last this long by default, and at
+// most MAX_WAIT_SECONDS, under the load balancer's 60 s idle timeout.
+const DEFAULT_WAIT_SECONDS = 25;
+const MAX_WAIT_SECONDS = 50;
+// Parameter sets per POST /fractal/batch (and hashes per status batch), and
+// messages per SendMessageBatch call, which SQS caps at 10.
+const MAX_BATCH_SIZE = 100;
+const SQS_BATCH_SIZE = 10;
+const FINAL_STATUSES = new Set(['complete', 'too_complex', 'failed', 'not_found']);
+// Answers for the statuses a waiting client can be given straight from a
+// notification, without reading the row again.
+const PROGRESS_MESSAGES = {
+    pending: 'Fractal generation has been queued.',
+    generating: 'Fractal is currently being generated.',
+};
+
 (async () => {
     const region = await awsConfigService.getAwsRegion();
-    sqsClient = new SQSClient({ region });
+    sqsClient = localStack.enabled ? localStack.queue : new SQSClient({ region });
     queueUrl = await awsConfigService.getParameter('/n11051337/sqs_queue_url');
 })();
 
 
-const generateCacheKey = (userId, filters, sortBy, sortOrder, limit, offset) => {
-    const filterString = JSON.stringify(filters || {});
-    const actualLimit = limit !== undefined ? limit : '';
-    const actualOffset = offset !== undefined ? offset : '';
-    return `gallery:${userId}:${filterString}:${sortBy || ''}:${sortOrder || ''}:${actualLimit}:${actualOffset}`;
-};
-
-router.get('/fractal', verifyToken, async (req, res) => {
-    const options = {
-        width: parseInt(req.query.width) || 1920,
-        height: parseInt(req.query.height) || 1080,
-        maxIterations: parseInt(req.query.iterations) || 500,
-        power: parseFloat(req.query.power) || 2,
+// Render options from GET /fractal's query parameters (or a batch entry).
+function parseOptions(query) {
+    return {
+        width: parseInt(query.width) || 1920,
+        height: parseInt(query.height) || 1080,
+        maxIterations: parseInt(query.iterations) || 500,
+        power: parseFloat(query.power) || 2,
         c: {
-            real: parseFloat(req.query.real) || 0.285,
-            imag: parseFloat(req.query.imag) || 0.01
+            real: parseFloat(query.real) || 0.285,
+            imag: parseFloat(query.imag) || 0.01
         },
-        scale: parseFloat(req.query.scale) || 1,
-        offsetX: parseFloat(req.query.offsetX) || 0,
-        offsetY: parseFloat(req.query.offsetY) || 0,
-        colourScheme: req.query.color || 'rainbow',
+        scale: parseFloat(query.scale) || 1,
+        offsetX: parseFloat(query.offsetX) || 0,
+        offsetY: parseFloat(query.offsetY) || 0,
+        colourScheme: query.color || 'rainbow',
     };
+}
+
+const optionsHash = (options) => crypto.createHash('sha256').update(JSON.stringify(options)).digest('hex');
+
+// The answer to a submission whose fractal already exists and is not complete.
+function existingAnswer(row) {
+    if (row.status === 'too_complex') {
+        return { hash: row.hash, status: row.status, message: 'Fractal is too complex to generate.' };
+    } else if (row.status === 'failed') {
+        if (row.retry_count === 1) {
+            return { hash: row.hash, status: row.status, message: 'Generation failed. Retrying soon...' };
+        }
+        return { hash: row.hash, status: row.status, message: 'Generation failed after multiple attempts. Please try again later.' };
+    }
+    return { hash: row.hash, status: row.status, message: `Fractal is ${row.status}. Check status endpoint for updates.` };
+}
+
+router.get('/fractal', verifyToken, async (req, res) => {
+    const options = parseOptions(req.query);
 
-    const hash = crypto.createHash('sha256').update(JSON.stringify(options)).digest('hex');
+    const hash = optionsHash(options);
     console.log(`Fractal generation request received for hash ${hash} from user ${req.user.username}`);
 
     try {
         let row = await Fractal.findFractalByHash(hash);
 
         if (row) {
-            const now = new Date();
-            const lastUpdated = new Date(row.last_updated);
-            const created = new Date(row.created_at);
-            const historyEntry = await History.getHistoryEntryByFractalIdAndUserId(row.id, req.user.id);
-            const historyId = historyEntry ? historyEntry.id : null;
-
             if (row.status === 'complete') {
                 const fractalUrl = await s3Service.getPresignedUrl(row.s3_key);
                 let galleryEntry = await Gallery.findGalleryEntryByFractalHashAndUserId(req.user.id, row.hash);
                 if (!galleryEntry) {
                     await History.createHistoryEntry(req.user.id, req.user.username, row.id, 'complete');
                     await Gallery.addToGallery(req.user.id, row.id, row.hash);
-                    const userCacheKey = generateCacheKey(req.user.id, {}, 'added_at', 'DESC', 5, 0);
-                    await cacheService.del(userCacheKey);
-                    const adminCacheKey = `admin:gallery:${JSON.stringify({})}:added_at:DESC:5:0`;
-                    await cacheService.del(adminCacheKey);
                 }
                 return res.json({ hash: row.hash, url: fractalUrl, status: row.status, message: 'Fractal already exists.' });
-            } else if (row.status === 'too_complex') {
-                return res.status(200).json({ hash: row.hash, status: row.status, message: 'Fractal is too complex to generate.' });
-            } else if (row.status === 'failed') {
-                if (row.retry_count === 1) {
-                    return res.status(200).json({ hash: row.hash, status: row.status, message: 'Generation failed. Retrying soon...' });
-                } else {
-                    return res.status(200).json({ hash: row.hash, status: row.status, message: 'Generation failed after multiple attempts. Please try again later.' });
-
-                }
-            } else {
-                return res.status(200).json({ hash: row.hash, status: row.status, message: `Fractal is ${row.status}. Check status endpoint for updates.` });
             }
+            return res.status(200).json(existingAnswer(row));
         } else {
             if (!queueUrl) {
                 return res.status(500).send('Service is not initialised correctly.');
@@ -112,72 +123,237 @@ router.get('/fractal', verifyToken, async (req, res) => {
     }
 });
 
-router.get('/fractal/status/:hash', verifyToken, async (req, res) => {
-    const { hash } = req.params;
+// GET /fractal for up to MAX_BATCH_SIZE parameter sets at once: body
+// { fractals: [query, ...] }, each entry taking GET /fractal's query
+// parameters. Entries are deduplicated by hash, looked up and written in
+// bulk, and new jobs queued with SendMessageBatch. Answers { results } with
+// GET /fractal's answer for each entry, in order.
+router.post('/fractal/batch', verifyToken, async (req, res) => {
+    const entries = req.body && req.body.fractals;
+    if (!Array.isArray(entries) || entries.length === 0 || entries.length > MAX_BATCH_SIZE) {
+        return res.status(400).send(`fractals must be a list of 1 to ${MAX_BATCH_SIZE} parameter sets.`);
+    }
+    if (!queueUrl) {
+        return res.status(500).send('Service is not initialised correctly.');
+    }
+
+    const hashes = [];
+    const optionsByHash = new Map();
+    for (const entry of entries) {
+        const options = parseOptions(entry || {});
+        const hash = optionsHash(options);
+        hashes.push(hash);
+        optionsByHash.set(hash, options);
+    }
+    const unique = [...optionsByHash.keys()];
+    console.log(`Batch of ${entries.length} fractals (${unique.length} distinct) received from user ${req.user.username}`);
 
     try {
-        const row = await Fractal.findFractalByHash(hash);
+        const answers = new Map();
+        const rows = new Map((await Fractal.findFractalsByHashes(unique)).map((row) => [row.hash, row]));
 
-        if (row) {
-            if (row.status === 'complete') {
-                const fractalUrl = await s3Service.getPresignedUrl(row.s3_key);
-                res.json({ status: row.status, url: fractalUrl });
+        // Finished fractals go straight into the user's gallery, as in GET /fractal.
+        const complete = [...rows.values()].filter((row) => row.status === 'complete');
+        if (complete.length > 0) {
+            const inGallery = await Gallery.findGalleryHashesForUser(req.user.id, complete.map((row) => row.hash));
+            const added = complete.filter((row) => !inGallery.has(row.hash));
+            if (added.length > 0) {
+                await History.createHistoryEntries(req.user.id, req.user.username, added.map((row) => ({ fractalId: row.id, status: 'complete' })));
+                await Gallery.addManyToGallery(req.user.id, added.map((row) => ({ fractalId: row.id, hash: row.hash })));
+            }
+            const urls = await s3Service.getPresignedUrls(complete.map((row) => row.s3_key));
+            for (const row of complete) {
+                answers.set(row.hash, { hash: row.hash, url: urls[row.s3_key], status: row.status, message: 'Fractal already exists.' });
+            }
+        }
+        for (const row of rows.values()) {
+            if (row.status !== 'complete') answers.set(row.hash, existingAnswer(row));
+        }
+
+        const missing = unique.filter((hash) => !rows.has(hash));
+        const created = await Fractal.createFractals(missing.map((hash) => ({ ...optionsByHash.get(hash), hash })));
+        for (const hash of missing) {
+            // Including any a concurrent submission created between the lookup and the insert.
+            answers.set(hash, { hash, status: 'pending', message: 'Fractal generation has been queued.' });
+        }
+        const history = await History.createHistoryEntries(req.user.id, req.user.username, created.map((row) => ({ fractalId: row.id })));
+        const historyIds = new Map(history.map((entry) => [entry.fractal_id, entry.id]));
+        const jobs = created.map((row) => ({ options: optionsByHash.get(row.hash), hash: row.hash, user: req.user, historyId: historyIds.get(row.id) }));
+
+        const unsent = await sendJobs(jobs);
+        if (unsent.length > 0) {
+            // Let the user submit them again rather than leave them pending.
+            await Fractal.deleteFractalsByHashes(unsent.map((job) => job.hash));
+            await History.deleteHistoryEntries(unsent.map((job) => job.historyId));
+            for (const job of unsent) {
+                answers.set(job.hash, { hash: job.hash, status: 'failed', message: 'Fractal could not be queued. Please try again.' });
+            }
+        }
+
+        console.log(`Batch from user ${req.user.username}: ${jobs.length - unsent.length} queued, ${unsent.length} not queued, ${rows.size} existing.`);
+        res.status(jobs.length > unsent.length ? 202 : 200).json({ results: hashes.map((hash) => answers.get(hash)) });
+    } catch (error) {
+        console.error("Error in /fractal/batch route:", error);
+        res.status(500).send("Internal server error");
+    }
+});
+
+// Sends jobs to the queue SQS_BATCH_SIZE per SendMessageBatch call, the
+// calls concurrently. Resolves to the jobs that could not be sent.
+async function sendJobs(jobs) {
+    const batches = [];
+    for (let i = 0; i < jobs.length; i += SQS_BATCH_SIZE) {
+        batches.push(jobs.slice(i, i + SQS_BATCH_SIZE));
+    }
+    const unsent = await Promise.all(batches.map(async (batch) => {
+        const command = new SendMessageBatchCommand({
+            QueueUrl: queueUrl,
+            Entries: batch.map((job, i) => ({ Id: String(i), MessageBody: JSON.stringify(job) })),
+        });
+        try {
+            const response = await sqsClient.send(command);
+            return (response.Failed || []).map((failure) => batch[Number(failure.Id)]);
+        } catch (error) {
+            console.error('Error sending job batch to queue:', error);
+            return batch;
+        }
+    }));
+    return unsent.flat();
+}
+
+// The /fractal/status/:hash answer for a fractal. Also fails jobs stuck in
+// 'pending' or 'generating' for too long, which is why it needs the user.
+async function describeStatus(hash, user) {
+    const row = await Fractal.findFractalByHash(hash);
+    return row ? describeRow(row, user) : { status: 'not_found' };
+}
+
+async function describeRow(row, user) {
+    const hash = row.hash;
+    if (row.status === 'complete') {
+        const fractalUrl = await s3Service.getPresignedUrl(row.s3_key);
+        // A render its deadline kept coarse even after its refinements.
+        if (row.resolution_stride > 1) {
+            return { status: row.status, url: fractalUrl, degraded: true, resolutionStride: row.resolution_stride };
+        }
+        return { status: row.status, url: fractalUrl };
+    }
+
+    const now = new Date();
+    const lastUpdated = new Date(row.last_updated);
+    const created = new Date(row.created_at);
+    const findHistoryId = async () => {
+        const historyEntry = await History.getHistoryEntryByFractalIdAndUserId(row.id, user.id);
+        return historyEntry ? historyEntry.id : null;
+    };
+
+    if (row.status === 'pending') {
+        if ((now.getTime() - created.getTime()) > 10 * 60 * 1000) { // 10 minutes
+            console.log(`Pending fractal ${hash} created at ${created.toISOString()} is stuck in the queue. Current time: ${now.toISOString()}`);
+            const historyId = await findHistoryId();
+            await Fractal.updateFractalStatus(hash, 'failed', row.retry_count + 1);
+            if (historyId) {
+                console.log(`Attempting to update history status for historyId: ${historyId} to 'failed'`);
+                await History.updateHistoryStatus(historyId, 'failed');
             } else {
-                const now = new Date();
-                const lastUpdated = new Date(row.last_updated);
-                const created = new Date(row.created_at);
-                const historyEntry = await History.getHistoryEntryByFractalIdAndUserId(row.id, req.user.id);
-                const historyId = historyEntry ? historyEntry.id : null;
-
-                if (row.status === 'pending') {
-                    console.log(`Checking pending status for hash: ${hash}. Created at: ${created.toISOString()}. Current time: ${now.toISOString()}`);
-                    if ((now.getTime() - created.getTime()) > 10 * 60 * 1000) { // 10 minutes
-                        await Fractal.updateFractalStatus(hash, 'failed', row.retry_count + 1);
-                        if (historyId) {
-                            console.log(`Attempting to update history status for historyId: ${historyId} to 'failed'`);
-                            await History.updateHistoryStatus(historyId, 'failed');
-                        } else {
-                            console.log(`History entry not found for fractal ID ${row.id} and user ID ${req.user.id}. Cannot update history status.`);
-                        }
-                        return res.json({ status: 'failed', message: 'Fractal generation stuck in queue. Please try again later.' });
-                    } else {
-                        return res.json({ status: row.status, message: 'Fractal generation has been queued.' });
-                    }
-                } else if (row.status === 'generating') {
-                    if ((now.getTime() - lastUpdated.getTime()) > 3 * 60 * 1000) { // 3 minutes
-                        await Fractal.updateFractalStatus(hash, 'failed', row.retry_count + 1);
-                        if (historyId) {
-                            await History.updateHistoryStatus(historyId, 'failed');
-                        }
-                        if (row.retry_count + 1 === 1) {
-                            return res.json({ status: 'failed', message: 'Worker crashed. Retrying soon...' });
-                        } else {
-                            return res.json({ status: 'failed', message: 'Worker crashed after multiple attempts. Please try again later.' });
-                        }
-                    } else {
-                        return res.json({ status: row.status, message: 'Fractal is currently being generated.' });
-                    }
-                } else if (row.status === 'failed') {
-                    if (row.retry_count === 1) {
-                        return res.json({ status: row.status, message: 'Generation failed. Retrying soon...' });
-                    } else {
-                        return res.json({ status: row.status, message: 'Generation failed after multiple attempts. Please try again later.' });
-                    }
-                } else if (row.status === 'too_complex') {
-                    return res.json({ status: row.status, message: 'Fractal is too complex to generate.' });
-                } else {
-                    res.json({ status: row.status });
-                }
+                console.log(`History entry not found for fractal ID ${row.id} and user ID ${user.id}. Cannot update history status.`);
             }
-        } else {
-            res.json({ status: 'not_found' });
+            await Fractal.notifyStatus(hash, 'failed');
+            return { status: 'failed', message: 'Fractal generation stuck in queue. Please try again later.' };
+        }
+        return { status: row.status, message: PROGRESS_MESSAGES.pending };
+    } else if (row.status === 'generating') {
+        if ((now.getTime() - lastUpdated.getTime()) > 3 * 60 * 1000) { // 3 minutes
+            const historyId = await findHistoryId();
+            await Fractal.updateFractalStatus(hash, 'failed', row.retry_count + 1);
+            if (historyId) {
+                await History.updateHistoryStatus(historyId, 'failed');
+            }
+            await Fractal.notifyStatus(hash, 'failed');
+            if (row.retry_count + 1 === 1) {
+                return { status: 'failed', message: 'Worker crashed. Retrying soon...' };
+            }
+            return { status: 'failed', message: 'Worker crashed after multiple attempts. Please try again later.' };
         }
+        return { status: row.status, message: PROGRESS_MESSAGES.generating };
+    } else if (row.status === 'failed') {
+        if (row.retry_count === 1) {
+            return { status: row.status, message: 'Generation failed. Retrying soon...' };
+        }
+        return { status: row.status, message: 'Generation failed after multiple attempts. Please try again later.' };
+    } else if (row.status === 'too_complex') {
+        return { status: row.status, message: 'Fractal is too complex to generate.' };
+    }
+    return { status: row.status };
+}
+
+router.get('/fractal/status/:hash', verifyToken, async (req, res) => {
+    const { hash } = req.params;
+
+    try {
+        res.json(await describeStatus(hash, req.user));
     } catch (error) {
         console.error(`Error checking status for hash ${hash}:`, error);
         res.status(500).send("Internal server error");
     }
 });
 
+// /fractal/status/:hash for up to MAX_BATCH_SIZE hashes in one lookup: body
+// { hashes: [...] }, answer { statuses: { hash: status answer } }.
+router.post('/fractal/status/batch', verifyToken, async (req, res) => {
+    const hashes = req.body && req.body.hashes;
+    if (!Array.isArray(hashes) || hashes.length === 0 || hashes.length > MAX_BATCH_SIZE || !hashes.every((hash) => typeof hash === 'string')) {
+        return res.status(400).send(`hashes must be a list of 1 to ${MAX_BATCH_SIZE} fractal hashes.`);
+    }
+
+    try {
+        const rows = new Map((await Fractal.findFractalsByHashes(hashes)).map((row) => [row.hash, row]));
+        const statuses = {};
+        // Signs the finished ones' URLs in one call; describeRow then finds them cached.
+        await s3Service.getPresignedUrls([...rows.values()].filter((row) => row.status === 'complete').map((row) => row.s3_key));
+        await Promise.all([...new Set(hashes)].map(async (hash) => {
+            statuses[hash] = rows.has(hash) ? await describeRow(rows.get(hash), req.user) : { status: 'not_found' };
+        }));
+        res.json({ statuses });
+    } catch (error) {
+        console.error(`Error checking status for a batch of ${hashes.length} hashes:`, error);
+        res.status(500).send("Internal server error");
+    }
+});
+
+// Long-poll for a job's next status: answers like /fractal/status/:hash as
+// soon as the status differs from `since` (at once if it already does, or
+// without `since`), or with the unchanged status after `timeout` seconds.
+// Workers publish each change, so a waiting client costs a status lookup per
+// request plus one for the final status, rather than one per poll.
+router.get('/fractal/status/:hash/wait', verifyToken, async (req, res) => {
+    const { hash } = req.params;
+    const since = req.query.since;
+    const timeout = Math.min(Math.max(parseInt(req.query.timeout) || DEFAULT_WAIT_SECONDS, 1), MAX_WAIT_SECONDS);
+
+    const waiting = jobEventService.waitForStatus(hash, timeout * 1000);
+    res.on('close', waiting.cancel); // the client gave up
+    try {
+        let body = await describeStatus(hash, req.user);
+        if (since && body.status === since && !FINAL_STATUSES.has(body.status)) {
+            const changed = await waiting.changed;
+            if (PROGRESS_MESSAGES[changed]) {
+                body = { status: changed, message: PROGRESS_MESSAGES[changed] };
+            } else if (changed) {
+                body = await describeStatus(hash, req.user);
+            }
+        }
+        waiting.cancel();
+        if (!res.destroyed) {
+            res.json(body);
+        }
+    } catch (error) {
+        waiting.cancel();
+        console.error(`Error waiting on status for hash ${hash}:`, error);
+        res.status(500).send("Internal server error");
+    }
+});
+
 router.post('/fractal/dlq-failed', verifyApiKey, async (req, res) => {
     console.log('Received DLQ notification request.');
     const { hash, historyId } = req.body;
@@ -196,6 +372,7 @@ router.post('/fractal/dlq-failed', verifyApiKey, async (req, res) => {
 
             // Update history status
             await History.updateHistoryStatus(historyId, 'failed');
+            await Fractal.notifyStatus(hash, 'failed');
 
             res.status(200).send('Fractal status updated to failed.');
         } else {
@@ -207,6 +384,132 @@ router.post('/fractal/dlq-failed', verifyApiKey, async (req, res) => {
     }
 });
 
+// The latest tile cache counters each Python worker reported, by workerId,
+// kept in memcached so every API instance sees every worker's. A worker that
+// has not reported for WORKER_TILE_CACHE_TTL_SECONDS is dropped.
+const WORKER_TILE_CACHES_KEY = 'worker-tile-caches';
+const WORKER_TILE_CACHE_TTL_SECONDS = 600;
+
+async function workerTileCaches() {
+    const caches = (await cacheService.get(WORKER_TILE_CACHES_KEY)) || {};
+    const oldest = Date.now() - WORKER_TILE_CACHE_TTL_SECONDS * 1000;
+    return Object.fromEntries(Object.entries(caches).filter(([, entry]) => Date.parse(entry.reportedAt) > oldest));
+}
+
+async function recordWorkerTileCache(workerId, tileCache) {
+    const caches = await workerTileCaches();
+    caches[workerId] = { ...tileCache, reportedAt: new Date().toISOString() };
+    await cacheService.set(WORKER_TILE_CACHES_KEY, caches, WORKER_TILE_CACHE_TTL_SECONDS);
+}
+
+// Status updates from the Python queue worker (scripts/fractal_engine/worker.py),
+// which has no database access of its own. Makes the same updates
+// fractal.worker.js makes around a render, including its render claim:
+// 'generating' answers { skip: true } when the fractal is already finished
+// (after giving this job's user the result) and { wait: seconds } while
+// another worker holds the lease. 'renew' extends a started render's lease
+// and answers { renewed: false } if it was lost. 'complete' records the
+// `stride` the render reached (1, full resolution, when absent), and
+// 'requeued' releases the lease of a render queued again to be refined,
+// leaving the fractal 'generating'.
+router.post('/fractal/worker-status', verifyApiKey, async (req, res) => {
+    const { hash, historyId, user, options, status, s3Key, thumbnailKey, tilesKey, workerId, leaseSeconds, tileCache, stride } = req.body;
+
+    if (!hash || !status || !workerId) {
+        return res.status(400).send('Fractal hash, status and workerId are required.');
+    }
+    if (tileCache) {
+        // Not awaited: the counters are best effort and must not hold up the status update.
+        recordWorkerTileCache(workerId, tileCache);
+    }
+
+    try {
+        const existingFractal = await Fractal.findFractalByHash(hash);
+        const retryCount = existingFractal && existingFractal.retry_count !== null && existingFractal.retry_count !== undefined ? existingFractal.retry_count : 0;
+
+        if (status === 'renew') {
+            const renewed = await Fractal.renewClaim(hash, workerId, leaseSeconds || 180);
+            return res.json({ renewed });
+        }
+
+        if (status === 'generating') {
+            const claim = await Fractal.claimFractal(hash, workerId, leaseSeconds || 180);
+            if (!claim.claimed && claim.retryAfterSeconds > 0) {
+                return res.json({ skip: false, wait: claim.retryAfterSeconds });
+            }
+            if (!claim.claimed) {
+                const finished = await Fractal.findFractalByHash(hash);
+                if (historyId) await History.updateHistoryStatus(historyId, finished.status);
+                if (finished.status === 'complete' && user && user.id) {
+                    await Gallery.addToGallery(user.id, finished.id, hash);
+                }
+                return res.json({ skip: true, status: finished.status });
+            }
+            if (historyId) await History.updateHistoryStatus(historyId, 'generating');
+            await Fractal.notifyStatus(hash, 'generating');
+        } else if (status === 'complete') {
+            if (!s3Key) {
+                return res.status(400).send('s3Key is required for a complete fractal.');
+            }
+            let fractalIdToUse;
+            if (existingFractal) {
+                await Fractal.updateFractalStatus(hash, 'complete', 0);
+                await Fractal.updateFractalS3Key(hash, s3Key);
+                fractalIdToUse = existingFractal.id;
+            } else {
+                const { id: newFractalId } = await Fractal.createFractal({ ...options, hash, s3Key });
+                fractalIdToUse = newFractalId;
+            }
+            await Fractal.updateFractalPreviewKeys(hash, thumbnailKey, tilesKey);
+            await Fractal.updateFractalResolution(hash, stride || 1);
+            await Fractal.releaseClaim(hash, workerId);
+            if (historyId) await History.updateHistoryStatus(historyId, 'complete');
+            if (user && user.id) {
+                await Gallery.addToGallery(user.id, fractalIdToUse, hash);
+            }
+            await Fractal.notifyStatus(hash, 'complete');
+        } else if (status === 'requeued') {
+            await Fractal.releaseClaim(hash, workerId);
+        } else if (status === 'too_complex') {
+            await Fractal.updateFractalStatus(hash, 'too_complex', retryCount);
+            await Fractal.releaseClaim(hash, workerId);
+            if (historyId) await History.updateHistoryStatus(historyId, 'too_complex');
+            await Fractal.notifyStatus(hash, 'too_complex');
+        } else if (status === 'failed') {
+            await Fractal.updateFractalStatus(hash, 'failed', retryCount + 1);
+            await Fractal.releaseClaim(hash, workerId);
+            if (historyId) await History.updateHistoryStatus(historyId, 'failed');
+            await Fractal.notifyStatus(hash, 'failed');
+        } else {
+            return res.status(400).send(`Unknown status '${status}'.`);
+        }
+
+        console.log(`[${new Date().toISOString()}] Worker ${workerId} reported ${status} for hash ${hash}.`);
+        res.json({ skip: false, status });
+    } catch (error) {
+        console.error(`Error applying worker status ${status} for hash ${hash}:`, error);
+        res.status(500).send('Internal server error.');
+    }
+});
+
+// This process's cache counters: hits, misses, stale (entries from an
+// invalidated namespace), sets, deletes, invalidations and errors.
+router.get('/admin/cache', verifyToken, (req, res) => {
+    if (req.user.role !== 'admin') {
+        return res.status(403).send('Access denied. Admin role required.');
+    }
+    res.json(cacheService.metrics());
+});
+
+// The Python workers' tile cache counters (see scripts/fractal_engine/tilecache.py),
+// as each last reported them to any API instance.
+router.get('/admin/worker-tile-caches', verifyToken, async (req, res) => {
+    if (req.user.role !== 'admin') {
+        return res.status(403).send('Access denied. Admin role required.');
+    }
+    res.json(await workerTileCaches());
+});
+
 router.get('/health', async (req, res) => {
     try {
         const db = require('../database.js');
@@ -5,50 +5,97 @@ const Gallery = require('../models/gallery.model.js');
 const Fractal = require('../models/fractal.model.js');
 const cacheService = require('../services/cacheService');
 const s3Service = require('../services/s3Service');
+const pyramidService = require('../services/pyramidService');
+const pagination = require('../models/pagination.js');
 
-const generateCacheKey = (userId, filters, sortBy, sortOrder, limit, offset) => {
+// Seconds a listing page is cached. Changes to the gallery invalidate it
+// sooner through its cache namespace (Gallery.userNamespace and
+// Gallery.ADMIN_NAMESPACE); this keeps the presigned URLs a cached page
+// carries well inside their 300 second lifetime.
+const LISTING_TTL_SECONDS = 120;
+
+// A page's key within its listing's cache namespace.
+const generateCacheKey = (filters, sortBy, sortOrder, limit, offset, cursor) => {
     const filterString = JSON.stringify(filters || {});
     const actualLimit = limit !== undefined ? limit : '';
     const actualOffset = offset !== undefined ? offset : '';
-    return `gallery:${userId}:${filterString}:${sortBy || ''}:${sortOrder || ''}:${actualLimit}:${actualOffset}`;
+    const cursorPart = cursor ? `:${cursor}` : '';
+    return `page:${filterString}:${sortBy || ''}:${sortOrder || ''}:${actualLimit}:${actualOffset}${cursorPart}`;
+};
+
+// Listings link each entry's thumbnail (or its full image, for fractals from
+// before thumbnails); the full image is only presigned with ?full=true, and
+// is otherwise fetched on demand from /gallery/:id/image. The whole page is
+// signed in one call.
+const addImageUrls = async (entries, full) => {
+    const withImages = entries.filter((entry) => entry.s3_key);
+    const urls = await s3Service.getPresignedUrls(withImages.flatMap((entry) =>
+        full ? [entry.thumbnail_key || entry.s3_key, entry.s3_key] : [entry.thumbnail_key || entry.s3_key]));
+    for (const entry of withImages) {
+        entry.thumbnailUrl = urls[entry.thumbnail_key || entry.s3_key];
+        if (full) {
+            entry.url = urls[entry.s3_key];
+        }
+    }
+    return entries;
 };
 
+const wantsFull = (full) => full === 'true' || full === '1';
+
+// A listing page as /gallery and /admin/gallery answer it; `data` is the
+// page's rows with their image URLs.
+const listingResponse = (page, data, limit, offset) => ({
+    data,
+    totalCount: page.totalCount,
+    totalCountApproximate: page.totalCountApproximate,
+    limit,
+    offset,
+    next: page.next,
+    prev: page.prev,
+});
+
 router.get('/gallery', verifyToken, async (req, res) => {
     const userId = req.user.id;
-    const { limit = 5, offset = 0, sortBy = 'added_at', sortOrder = 'DESC', ...filters } = req.query;
+    const { limit = 5, offset = 0, cursor: cursorToken, full, ...query } = req.query;
+    let { sortBy = 'added_at', sortOrder = 'DESC', ...filters } = query;
+    const withFull = wantsFull(full);
+
+    // A cursor carries the sort of the listing it came from.
+    const cursor = cursorToken ? pagination.decodeCursor(cursorToken, Gallery.SORT_KEYS) : null;
+    if (cursorToken && !cursor) {
+        return res.status(400).send('Invalid cursor.');
+    }
+    if (cursor) {
+        ({ sortBy, sortOrder } = cursor);
+    }
 
-    const cacheKey = generateCacheKey(userId, filters, sortBy, sortOrder, limit, offset);
+    const namespace = Gallery.userNamespace(userId);
+    const cacheKey = generateCacheKey(filters, sortBy, sortOrder, limit, offset, cursorToken);
 
     try {
-        let cachedData = await cacheService.get(cacheKey);
+        // Only thumbnail listings are cached; ?full=true is the uncommon case.
+        const { value: cachedData, generation } = withFull ? {} : await cacheService.getIn(namespace, cacheKey);
         if (cachedData) {
             return res.json(cachedData);
         }
 
-        const { rows, totalCount } = await Gallery.getGalleryForUser(
+        const page = await Gallery.getGalleryForUser(
             userId,
             filters,
             sortBy,
             sortOrder,
             parseInt(limit),
-            parseInt(offset)
+            parseInt(offset),
+            cursor
         );
 
-        const galleryWithUrls = await Promise.all(rows.map(async (entry) => {
-            if (entry.s3_key) {
-                entry.url = await s3Service.getPresignedUrl(entry.s3_key);
-            }
-            return { ...entry };
-        }));
+        const galleryWithUrls = await addImageUrls(page.rows, withFull);
 
-        const responseData = {
-            data: galleryWithUrls,
-            totalCount,
-            limit: parseInt(limit),
-            offset: parseInt(offset),
-        };
+        const responseData = listingResponse(page, galleryWithUrls, parseInt(limit), parseInt(offset));
 
-        await cacheService.set(cacheKey, responseData);
+        if (!withFull) {
+            await cacheService.setIn(namespace, cacheKey, generation, responseData, LISTING_TTL_SECONDS);
+        }
         res.json(responseData);
 
     } catch (error) {
@@ -57,6 +104,46 @@ router.get('/gallery', verifyToken, async (req, res) => {
     }
 });
 
+// The full image of one gallery entry, and its Deep Zoom descriptor if it has one.
+router.get('/gallery/:id/image', verifyToken, async (req, res) => {
+    const isAdmin = req.user.role === 'admin';
+
+    try {
+        const row = await Gallery.getGalleryImageKeys(req.params.id, req.user.id, isAdmin);
+        if (!row || !row.s3_key) {
+            return res.status(404).send('Gallery entry not found.');
+        }
+        const urls = await s3Service.getPresignedUrls([row.s3_key, row.tiles_key]);
+        res.json({
+            url: urls[row.s3_key],
+            tilesUrl: row.tiles_key ? urls[row.tiles_key] : null,
+        });
+    } catch (error) {
+        console.error(`Error in /gallery/${req.params.id}/image route:`, error);
+        res.status(500).send('Internal server error');
+    }
+});
+
+// One Deep Zoom tile, by redirect to its presigned URL, so a viewer can page
+// through a private bucket with the descriptor's relative tile paths.
+router.get('/gallery/:id/tiles/:level/:tile', verifyToken, async (req, res) => {
+    const { level, tile } = req.params;
+    if (!/^\d+$/.test(level) || !/^\d+_\d+\.(png|webp)$/.test(tile)) {
+        return res.status(400).send('Invalid tile.');
+    }
+
+    try {
+        const row = await Gallery.getGalleryImageKeys(req.params.id, req.user.id, req.user.role === 'admin');
+        if (!row || !row.tiles_key) {
+            return res.status(404).send('Gallery entry has no tiles.');
+        }
+        res.redirect(await s3Service.getPresignedUrl(`${pyramidService.tilesPrefix(row.tiles_key)}${level}/${tile}`));
+    } catch (error) {
+        console.error(`Error in /gallery/${req.params.id}/tiles route:`, error);
+        res.status(500).send('Internal server error');
+    }
+});
+
 router.delete('/gallery/:id', verifyToken, async (req, res) => {
     const galleryId = req.params.id;
     const userId = req.user.id;
@@ -77,14 +164,6 @@ router.delete('/gallery/:id', verifyToken, async (req, res) => {
 
         await Gallery.deleteGalleryEntry(galleryId, userId, isAdmin);
 
-        // Invalidate the default cache key for the user's gallery
-        const userCacheKey = generateCacheKey(userId, {}, 'added_at', 'DESC', 5, 0);
-        await cacheService.del(userCacheKey);
-
-        // Invalidate the default cache key for the admin gallery
-        const adminCacheKey = `admin:gallery:${JSON.stringify({})}:added_at:DESC:5:0`;
-        await cacheService.del(adminCacheKey);
-
         const countRow = await Gallery.countGalleryByFractalHash(fractalHash);
 
         if (parseInt(countRow.count) === 0) {
@@ -92,6 +171,7 @@ router.delete('/gallery/:id', verifyToken, async (req, res) => {
             if (fractalRow && fractalRow.s3_key) {
                 const s3KeyToDelete = fractalRow.s3_key;
                 await s3Service.deleteFile(s3KeyToDelete);
+                await pyramidService.deletePyramid(fractalRow);
                 await Fractal.deleteFractal(fractalId);
                 res.send({ message: "Gallery entry and associated fractal deleted successfully" });
             } else {
@@ -112,42 +192,47 @@ router.get('/admin/gallery', verifyToken, async (req, res) => {
         return res.status(403).send('Access denied. Admin role required.');
     }
 
-    const { limit = 5, offset = 0, sortBy = 'added_at', sortOrder = 'DESC', ...filters } = req.query;
+    const { limit = 5, offset = 0, cursor: cursorToken, full, ...query } = req.query;
+    let { sortBy = 'added_at', sortOrder = 'DESC', ...filters } = query;
+    const withFull = wantsFull(full);
 
-    const cacheKey = `admin:gallery:${JSON.stringify(filters)}:${sortBy}:${sortOrder}:${limit}:${offset}`;
+    const cursor = cursorToken ? pagination.decodeCursor(cursorToken, Gallery.ADMIN_SORT_KEYS) : null;
+    if (cursorToken && !cursor) {
+        return res.status(400).send('Invalid cursor.');
+    }
+    if (cursor) {
+        ({ sortBy, sortOrder } = cursor);
+    }
+
+    const cacheKey = generateCacheKey(filters, sortBy, sortOrder, limit, offset, cursorToken);
 
     try {
-        let cachedData = await cacheService.get(cacheKey);
+        const { value: cachedData, generation } = withFull ? {} : await cacheService.getIn(Gallery.ADMIN_NAMESPACE, cacheKey);
         if (cachedData) {
             return res.json(cachedData);
         }
 
-        const { rows, totalCount } = await Gallery.getAllGallery(
+        const page = await Gallery.getAllGallery(
             filters,
             sortBy,
             sortOrder,
             parseInt(limit),
-            parseInt(offset)
+            parseInt(offset),
+            cursor
         );
 
-        const galleryWithUrls = await Promise.all(rows.map(async (entry) => {
-            if (entry.s3_key) {
-                entry.url = await s3Service.getPresignedUrl(entry.s3_key);
-            }
-            return entry;
-        }));
+        const galleryWithUrls = await addImageUrls(page.rows, withFull);
 
         const responseData = {
-            data: galleryWithUrls,
-            totalCount,
-            limit: parseInt(limit),
-            offset: parseInt(offset),
+            ...listingResponse(page, galleryWithUrls, parseInt(limit), parseInt(offset)),
             filters,
             sortBy,
             sortOrder,
         };
 
-        await cacheService.set(cacheKey, responseData);
+        if (!withFull) {
+            await cacheService.setIn(Gallery.ADMIN_NAMESPACE, cacheKey, generation, responseData, LISTING_TTL_SECONDS);
+        }
         res.json(responseData);
 
     } catch (error) {
@@ -5,6 +5,7 @@ const History = require('../models/history.model.js');
 const Fractal = require('../models/fractal.model.js');
 const Gallery = require('../models/gallery.model.js');
 const s3Service = require('../services/s3Service');
+const pagination = require('../models/pagination.js');
 
 router.get('/admin/history', verifyToken, async (req, res) => {
     if (req.user.role !== 'admin') {
@@ -16,6 +17,10 @@ router.get('/admin/history', verifyToken, async (req, res) => {
         limit = Math.min(limit, 5);
     }
     const offset = parseInt(req.query.offset) || 0;
+    const cursor = req.query.cursor ? pagination.decodeCursor(req.query.cursor, History.SORT_KEYS) : null;
+    if (req.query.cursor && !cursor) {
+        return res.status(400).send('Invalid cursor.');
+    }
 
     const filters = {
         colourScheme: req.query.colourScheme,
@@ -25,16 +30,19 @@ router.get('/admin/history', verifyToken, async (req, res) => {
         height: parseInt(req.query.height)
     };
 
-    const sortBy = req.query.sortBy;
-    const sortOrder = req.query.sortOrder;
+    // A cursor carries the sort of the listing it came from.
+    const sortBy = cursor ? cursor.sortBy : req.query.sortBy;
+    const sortOrder = cursor ? cursor.sortOrder : req.query.sortOrder;
 
     try {
-        const { rows, totalCount } = await History.getAllHistory(filters, sortBy, sortOrder, limit, offset);
-        const historyWithUrls = await Promise.all(rows.map(async row => {
-            const fractalUrl = row.s3_key ? await s3Service.getPresignedUrl(row.s3_key) : null;
-            return { ...row, url: fractalUrl };
-        }));
-        res.json({ data: historyWithUrls, totalCount, limit, offset, filters, sortBy, sortOrder });
+        const { rows, totalCount, totalCountApproximate, next, prev } = await History.getAllHistory(filters, sortBy, sortOrder, limit, offset, cursor);
+        const urls = await s3Service.getPresignedUrls(rows.flatMap((row) => [row.s3_key, row.thumbnail_key]));
+        const historyWithUrls = rows.map((row) => {
+            const fractalUrl = row.s3_key ? urls[row.s3_key] : null;
+            const thumbnailUrl = row.thumbnail_key ? urls[row.thumbnail_key] : fractalUrl;
+            return { ...row, url: fractalUrl, thumbnailUrl };
+        });
+        res.json({ data: historyWithUrls, totalCount, totalCountApproximate, limit, offset, next, prev, filters, sortBy, sortOrder });
     } catch (err) {
         return res.status(500).send("Database error");
     }
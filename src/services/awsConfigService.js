@@ -1,5 +1,6 @@
 const { SecretsManagerClient, GetSecretValueCommand } = require("@aws-sdk/client-secrets-manager");
 const { SSMClient, GetParameterCommand } = require("@aws-sdk/client-ssm");
+const localStack = require("./localStack");
 
 let cachedAwsRegion = null;
 let jwtSecret = null;
@@ -9,6 +10,10 @@ async function getAwsRegion() {
     if (cachedAwsRegion) {
         return cachedAwsRegion;
     }
+    if (localStack.enabled) {
+        cachedAwsRegion = localStack.getParameter('/n11051337/aws_region');
+        return cachedAwsRegion;
+    }
     try {
         const client = new SSMClient({ region: "ap-southeast-2" });
         const command = new GetParameterCommand({
@@ -35,6 +40,10 @@ module.exports = {
         if (jwtSecret) {
             return jwtSecret;
         }
+        if (localStack.enabled) {
+            jwtSecret = localStack.SIGNING_KEY;
+            return jwtSecret;
+        }
 
         const region = await getAwsRegion();
         const secretsManagerClient = new SecretsManagerClient({ region: region });
@@ -64,6 +73,10 @@ module.exports = {
         if (cognitoClientSecret) {
             return cognitoClientSecret;
         }
+        if (localStack.enabled) {
+            cognitoClientSecret = localStack.SIGNING_KEY;
+            return cognitoClientSecret;
+        }
 
         const region = await getAwsRegion();
         const secretsManagerClient = new SecretsManagerClient({ region: region });
@@ -90,6 +103,9 @@ module.exports = {
         return null;
     },
     getParameter: async (parameterName) => {
+        if (localStack.enabled) {
+            return localStack.getParameter(parameterName);
+        }
         const region = await getAwsRegion();
         const ssmClient = new SSMClient({ region: region });
 
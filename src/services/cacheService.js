@@ -1,13 +1,34 @@
 const Memcached = require("memcached");
 const util = require("node:util");
 const { getParameter } = require("./awsConfigService");
+const crypto = require("crypto");
+const localStack = require("./localStack");
 
 let memcachedClient = null;
 let memcachedAddress = null;
 
+// Lookups and writes since the process started; see cacheService.metrics.
+const counters = { hits: 0, misses: 0, stale: 0, sets: 0, deletes: 0, invalidations: 0, errors: 0 };
+
+// Namespaced entries (a user's gallery pages, the admin views) are stored
+// with the generation of their namespace they were built under, and the
+// namespace's current generation is read with them in one round trip. An
+// entry from an older generation is stale and treated as a miss, so
+// invalidating every page in a namespace is one write of a new generation.
+// Generations are random tokens rather than counters, so an evicted
+// generation key can't come back as one that old entries still carry.
+const generationKey = (namespace) => `generation:${namespace}`;
+const namespacedKey = (namespace, key) => `${namespace}:${key}`;
+const newGeneration = () => crypto.randomBytes(8).toString("hex");
+
 const initCache = async () => {
     if (memcachedClient) return; // Already initialized
 
+    if (localStack.enabled) {
+        memcachedClient = localStack.cache;
+        return;
+    }
+
     memcachedAddress = await getParameter('/n11051337/memcached_address');
 
     if (!memcachedAddress) {
@@ -31,6 +52,7 @@ const initCache = async () => {
     });
 
     memcachedClient.aGet = util.promisify(memcachedClient.get);
+    memcachedClient.aGetMulti = util.promisify(memcachedClient.getMulti);
     memcachedClient.aSet = util.promisify(memcachedClient.set);
     memcachedClient.aDel = util.promisify(memcachedClient.del);
 };
@@ -42,23 +64,85 @@ const cacheService = {
         try {
             const value = await memcachedClient.aGet(key);
             if (value) {
-
+                counters.hits++;
             } else {
-
+                counters.misses++;
             }
             return value;
         } catch (error) {
+            counters.errors++;
             console.error("Error getting from Memcached:", error);
             return null;
         }
     },
 
+    // { value, generation } for `key` in `namespace`; value is null unless
+    // the entry is from the namespace's current generation. Pass the
+    // generation on to setIn, so a value computed from data read before an
+    // invalidation is stored as already stale.
+    getIn: async (namespace, key) => {
+        if (!memcachedClient) return { value: null, generation: null };
+        try {
+            const found = await memcachedClient.aGetMulti([generationKey(namespace), namespacedKey(namespace, key)]);
+            let generation = found[generationKey(namespace)];
+            if (!generation) {
+                generation = newGeneration();
+                await memcachedClient.aSet(generationKey(namespace), generation, 0);
+            }
+            const entry = found[namespacedKey(namespace, key)];
+            if (!entry) {
+                counters.misses++;
+                return { value: null, generation };
+            }
+            if (entry.generation !== generation) {
+                counters.stale++;
+                return { value: null, generation };
+            }
+            counters.hits++;
+            return { value: entry.value, generation };
+        } catch (error) {
+            counters.errors++;
+            console.error("Error getting from Memcached:", error);
+            return { value: null, generation: null };
+        }
+    },
+
+    setIn: async (namespace, key, generation, value, ttl = 60) => {
+        if (!memcachedClient || !generation) return;
+        try {
+            await memcachedClient.aSet(namespacedKey(namespace, key), { generation, value }, ttl);
+            counters.sets++;
+        } catch (error) {
+            counters.errors++;
+            console.error("Error setting to Memcached:", error);
+        }
+    },
+
+    // Makes every entry in `namespace` stale.
+    invalidate: async (namespace) => {
+        if (!memcachedClient) return;
+        try {
+            await memcachedClient.aSet(generationKey(namespace), newGeneration(), 0);
+            counters.invalidations++;
+        } catch (error) {
+            counters.errors++;
+            console.error("Error invalidating Memcached namespace:", error);
+        }
+    },
+
+    // Counters since the process started, and the share of lookups that hit.
+    metrics: () => {
+        const lookups = counters.hits + counters.misses + counters.stale;
+        return { ...counters, hitRate: lookups > 0 ? counters.hits / lookups : 0, enabled: Boolean(memcachedClient) };
+    },
+
     set: async (key, value, ttl = 60) => {
         if (!memcachedClient) return;
         try {
             await memcachedClient.aSet(key, value, ttl);
-
+            counters.sets++;
         } catch (error) {
+            counters.errors++;
             console.error("Error setting to Memcached:", error);
         }
     },
@@ -67,8 +151,9 @@ const cacheService = {
         if (!memcachedClient) return;
         try {
             await memcachedClient.aDel(key);
-
+            counters.deletes++;
         } catch (error) {
+            counters.errors++;
             console.error("Error deleting from Memcached:", error);
         }
     },
@@ -27,9 +27,7 @@ function hslToRgb(h, s, l) {
     return [Math.round(r * 255), Math.round(g * 255), Math.round(b * 255), 255];
 }
 
-function getColour(n, max, scheme) {
-    if (n >= max) return [0, 0, 0, 255];
-    const t = Math.sqrt(n / max);
+function schemeColour(t, scheme) {
     switch (scheme) {
         case "greyscale":
             const gray = Math.floor(t * 255);
@@ -46,6 +44,74 @@ function getColour(n, max, scheme) {
     }
 }
 
+// Colour tables hold this many entries per iteration of mu, up to
+// COLOUR_TABLE_MAX_STEPS + 1 in total. Keep in step with fractal_engine/colour.py.
+const COLOUR_TABLE_STEPS_PER_ITERATION = 16;
+const COLOUR_TABLE_MAX_STEPS = 1 << 16;
+const COLOUR_TABLE_CACHE_SIZE = 32;
+const colourTables = new Map();
+
+function colourTableSteps(maxIterations) {
+    return Math.min(maxIterations * COLOUR_TABLE_STEPS_PER_ITERATION, COLOUR_TABLE_MAX_STEPS);
+}
+
+// RGB table for mu in [0, maxIterations]: entry i is the colour at
+// t = sqrt(i / steps), the same t the schemes are defined over.
+function colourTable(scheme, maxIterations) {
+    const key = `${scheme}:${maxIterations}`;
+    let table = colourTables.get(key);
+    if (table) return table;
+
+    const steps = colourTableSteps(maxIterations);
+    table = new Uint8ClampedArray((steps + 1) * 3);
+    for (let i = 0; i <= steps; i++) {
+        const colour = schemeColour(Math.sqrt(i / steps), scheme);
+        table[i * 3] = colour[0];
+        table[i * 3 + 1] = colour[1];
+        table[i * 3 + 2] = colour[2];
+    }
+
+    if (colourTables.size >= COLOUR_TABLE_CACHE_SIZE) {
+        colourTables.delete(colourTables.keys().next().value);
+    }
+    colourTables.set(key, table);
+    return table;
+}
+
+// Writes RGBA for a buffer of smooth iteration counts into data. Points that
+// never escaped (mu >= maxIterations), and the odd negative mu from a very
+// fast escape, are black.
+function colourise(mu, maxIterations, colourScheme, data) {
+    const table = colourTable(colourScheme, maxIterations);
+    const scale = colourTableSteps(maxIterations) / maxIterations;
+    for (let i = 0; i < mu.length; i++) {
+        const value = mu[i];
+        const idx = i * 4;
+        if (value >= 0 && value < maxIterations) {
+            const entry = Math.round(value * scale) * 3;
+            data[idx] = table[entry];
+            data[idx + 1] = table[entry + 1];
+            data[idx + 2] = table[entry + 2];
+        } else {
+            data[idx] = 0;
+            data[idx + 1] = 0;
+            data[idx + 2] = 0;
+        }
+        data[idx + 3] = 255;
+    }
+    return data;
+}
+
+// Recolours a stored mu buffer into any scheme without iterating again.
+function renderPng(mu, width, height, maxIterations, colourScheme) {
+    const canvas = createCanvas(width, height);
+    const ctx = canvas.getContext('2d');
+    const imageData = ctx.createImageData(width, height);
+    colourise(mu, maxIterations, colourScheme, imageData.data);
+    ctx.putImageData(imageData, 0, 0);
+    return canvas.toBuffer('image/png');
+}
+
 function iterate(z, c, power) {
     const r = Math.sqrt(z.real * z.real + z.imag * z.imag);
     const theta = Math.atan2(z.imag, z.real);
@@ -56,7 +122,74 @@ function iterate(z, c, power) {
     };
 }
 
-async function generateFractal({
+// Interior short-circuits. Orbits are compared with a reference point refreshed
+// at iterations 2^k (Brent's scheme) from PERIODICITY_START on; an orbit that
+// returns to within PERIODICITY_EPSILON of it is cycling and never escapes.
+const PERIODICITY_START = 64;
+const PERIODICITY_EPSILON_SQUARED = 1e-26;
+
+function complexSqrt(re, im) {
+    const r = Math.sqrt(re * re + im * im);
+    const real = Math.sqrt((r + re) / 2);
+    const imag = Math.sqrt((r - re) / 2);
+    return { real, imag: im < 0 ? -imag : imag };
+}
+
+// For power 2, disks around an attracting fixed point (c in the main cardioid)
+// or 2-cycle (c in the period-2 bulb) that the map sends into themselves: any
+// orbit that enters one is bounded. Radii are half the analytic bound so that
+// rounding can't carry an orbit back out.
+function trapDisks(c, power) {
+    if (power !== 2) return [];
+
+    const root = complexSqrt(1 - 4 * c.real, -4 * c.imag);
+    const fixed = { real: (1 - root.real) / 2, imag: -root.imag / 2 };
+    const fixedMultiplier = 2 * Math.sqrt(fixed.real * fixed.real + fixed.imag * fixed.imag);
+    if (fixedMultiplier < 1) {
+        return [{ ...fixed, radiusSquared: ((1 - fixedMultiplier) / 2) ** 2 }];
+    }
+
+    const cycleMultiplier = 4 * Math.sqrt((c.real + 1) * (c.real + 1) + c.imag * c.imag);
+    if (cycleMultiplier < 1) {
+        const cycleRoot = complexSqrt(-3 - 4 * c.real, -4 * c.imag);
+        return [1, -1].map(sign => {
+            const z = { real: (-1 + sign * cycleRoot.real) / 2, imag: sign * cycleRoot.imag / 2 };
+            // |f(f(z + d)) - z| <= (lambda + a r + b r^2 + r^3) r
+            const a = Math.hypot(6 * (z.real * z.real - z.imag * z.imag) + 2 * c.real, 12 * z.real * z.imag + 2 * c.imag);
+            const b = 4 * Math.hypot(z.real, z.imag);
+            let lo = 0;
+            let hi = 1;
+            for (let i = 0; i < 60; i++) {
+                const r = (lo + hi) / 2;
+                if (cycleMultiplier + a * r + b * r * r + r * r * r < 1) lo = r; else hi = r;
+            }
+            return { ...z, radiusSquared: (lo / 2) ** 2 };
+        });
+    }
+
+    return [];
+}
+
+function isTrapped(z, disks) {
+    for (const disk of disks) {
+        const dr = z.real - disk.real;
+        const di = z.imag - disk.imag;
+        if (dr * dr + di * di < disk.radiusSquared) return true;
+    }
+    return false;
+}
+
+// Passes of the progressive renderer: each pass samples every `stride`-th pixel
+// and paints it as a stride x stride block, so a coarse image exists early
+// and is refined in place. Stride 1 is the full-resolution image.
+const PROGRESSIVE_STRIDES = [8, 4, 2, 1];
+
+// Smooth iteration counts for every pixel, refined pass by pass until maxTime.
+// Resolves to { mu, stride }, where stride is the finest completed pass (1 is
+// full resolution), or to null if not even the coarsest pass finished. With
+// `resume`, an earlier result cut short by its deadline, rendering carries on
+// from the pass after `resume.stride`.
+async function computeIterations({
     width = 800,
     height = 600,
     maxIterations = 500,
@@ -65,54 +198,99 @@ async function generateFractal({
     scale = 1.5,
     offsetX = 0,
     offsetY = 0,
-    colourScheme = "rainbow",
     maxTime = 120000,
+    progressive = true,
+    resume = null,
     debugLog = null
 }) {
-    const canvas = createCanvas(width, height);
-    const ctx = canvas.getContext('2d');
-    const imageData = ctx.createImageData(width, height);
-    const data = imageData.data;
+    const mu = resume ? Float64Array.from(resume.mu) : new Float64Array(width * height).fill(NaN);
 
     const startTime = Date.now();
+    const disks = trapDisks(c, power);
+    const strides = (progressive ? PROGRESSIVE_STRIDES : [1]).filter((stride) => !resume || stride < resume.stride);
+    let completedStride = resume ? resume.stride : null;
+    let timedOut = false;
 
-    for (let x = 0; x < width; x++) {
-        for (let y = 0; y < height; y++) {
+    for (let pass = 0; pass < strides.length && !timedOut; pass++) {
+        const stride = strides[pass];
+        const previousStride = pass > 0 ? strides[pass - 1] : completedStride;
 
-            if (Date.now() - startTime > maxTime) {
-                return null;
-            }
+        for (let x = 0; x < width && !timedOut; x += stride) {
+            for (let y = 0; y < height; y += stride) {
+                // Already sampled by the previous, coarser pass.
+                if (previousStride && x % previousStride === 0 && y % previousStride === 0) continue;
 
-            let z = {
-                real: map(x, 0, width, -scale + offsetX, scale + offsetX),
-                imag: map(y, 0, height, -scale + offsetY, scale + offsetY)
-            };
+                if (Date.now() - startTime > maxTime) {
+                    timedOut = true;
+                    break;
+                }
 
-            let n = 0;
-            while (n < maxIterations) {
-                z = iterate(z, c, power);
-                if ((z.real * z.real + z.imag * z.imag) > 4) break;
-                n++;
-            }
+                let z = {
+                    real: map(x, 0, width, -scale + offsetX, scale + offsetX),
+                    imag: map(y, 0, height, -scale + offsetY, scale + offsetY)
+                };
+
+                let n = 0;
+                let reference = null;
+                while (n < maxIterations) {
+                    z = iterate(z, c, power);
+                    if ((z.real * z.real + z.imag * z.imag) > 4) break;
+                    n++;
+
+                    if (reference) {
+                        const dr = z.real - reference.real;
+                        const di = z.imag - reference.imag;
+                        if (dr * dr + di * di < PERIODICITY_EPSILON_SQUARED) {
+                            n = maxIterations;
+                            break;
+                        }
+                    }
+                    if (isTrapped(z, disks)) {
+                        n = maxIterations;
+                        break;
+                    }
+                    if (n >= PERIODICITY_START && (n & (n - 1)) === 0) {
+                        reference = z;
+                    }
+                }
+
+                let smooth = n;
+                if (n < maxIterations) {
+                    smooth = n + 1 - Math.log(Math.log(Math.sqrt(z.real * z.real + z.imag * z.imag))) / Math.log(power);
+                }
 
-            let mu = n;
-            if (n < maxIterations) {
-                mu = n + 1 - Math.log(Math.log(Math.sqrt(z.real * z.real + z.imag * z.imag))) / Math.log(power);
+                const blockWidth = Math.min(stride, width - x);
+                const blockHeight = Math.min(stride, height - y);
+                for (let dy = 0; dy < blockHeight; dy++) {
+                    mu.fill(smooth, (y + dy) * width + x, (y + dy) * width + x + blockWidth);
+                }
             }
 
-            const colour = getColour(mu, maxIterations, colourScheme);
-            const idx = (y * width + x) * 4;
-            data[idx] = colour[0];
-            data[idx + 1] = colour[1];
-            data[idx + 2] = colour[2];
-            data[idx + 3] = colour[3];
+            await new Promise(resolve => setImmediate(resolve));
         }
 
-        await new Promise(resolve => setImmediate(resolve));
+        if (!timedOut) {
+            completedStride = stride;
+        }
     }
 
-    ctx.putImageData(imageData, 0, 0);
-    return canvas.toBuffer('image/png');
+    if (completedStride === null) {
+        return null;
+    }
+    if (completedStride !== 1 && debugLog) {
+        debugLog(`Deadline of ${maxTime}ms reached; returning image refined to 1/${completedStride} resolution.`);
+    }
+
+    return { mu, stride: completedStride };
+}
+
+async function generateFractal(options) {
+    const result = await computeIterations(options);
+    if (!result) {
+        return null;
+    }
+    const { width = 800, height = 600, maxIterations = 500, colourScheme = "rainbow" } = options;
+    return renderPng(result.mu, width, height, maxIterations, colourScheme);
 }
 
-module.exports = { generateFractal };
\ No newline at end of file
+module.exports = { generateFractal, computeIterations, renderPng, colourise };
\ No newline at end of file
@@ -0,0 +1,94 @@
+const crypto = require('crypto');
+const os = require('os');
+const zlib = require('zlib');
+const s3Service = require('./s3Service');
+
+// Smooth iteration buffers are kept next to the images so a request that
+// only changes the colour scheme can be recoloured instead of re-rendered.
+// They are stored as little-endian float32 split into four byte planes
+// (all first bytes, then all second bytes, ...), which deflates far better
+// than interleaved floats, keyed by a hash of every option except
+// colourScheme. fractal_engine/iterations.py reads and
+// writes the same format.
+const FOLDER = 'iterations';
+// Buffers of renders cut short by their deadline, which the job's next
+// attempt carries on from (see fractal.worker.js).
+const PARTIAL_FOLDER = `${FOLDER}/partial`;
+
+function geometryHash(options) {
+    const { colourScheme, ...geometry } = options;
+    return crypto.createHash('sha256').update(JSON.stringify(geometry)).digest('hex');
+}
+
+function keyFor(options) {
+    return `${FOLDER}/${geometryHash(options)}.f32.z`;
+}
+
+function partialKeyFor(options) {
+    return `${PARTIAL_FOLDER}/${geometryHash(options)}.f32.z`;
+}
+
+function encode(mu) {
+    const values = Float32Array.from(mu);
+    const bytes = Buffer.from(values.buffer, values.byteOffset, values.byteLength);
+    if (os.endianness() !== 'LE') {
+        bytes.swap32();
+    }
+    const planes = Buffer.allocUnsafe(bytes.length);
+    const count = values.length;
+    for (let i = 0; i < count; i++) {
+        planes[i] = bytes[i * 4];
+        planes[count + i] = bytes[i * 4 + 1];
+        planes[2 * count + i] = bytes[i * 4 + 2];
+        planes[3 * count + i] = bytes[i * 4 + 3];
+    }
+    return zlib.deflateSync(planes);
+}
+
+function decode(data, pixels) {
+    const planes = zlib.inflateSync(data);
+    if (planes.length !== pixels * 4) {
+        throw new Error(`Stored iterations hold ${planes.length / 4} values, expected ${pixels}.`);
+    }
+    const bytes = Buffer.alloc(planes.length);
+    for (let i = 0; i < pixels; i++) {
+        bytes[i * 4] = planes[i];
+        bytes[i * 4 + 1] = planes[pixels + i];
+        bytes[i * 4 + 2] = planes[2 * pixels + i];
+        bytes[i * 4 + 3] = planes[3 * pixels + i];
+    }
+    if (os.endianness() !== 'LE') {
+        bytes.swap32();
+    }
+    return new Float32Array(bytes.buffer, bytes.byteOffset, pixels);
+}
+
+const iterationStoreService = {
+    geometryHash,
+
+    async save(options, mu) {
+        return s3Service.uploadObject(encode(mu), 'application/octet-stream', keyFor(options));
+    },
+
+    // Resolves to the stored buffer for these options' geometry, or null.
+    async load(options) {
+        const data = await s3Service.getObject(keyFor(options));
+        return data ? decode(data, options.width * options.height) : null;
+    },
+
+    async savePartial(options, mu) {
+        return s3Service.uploadObject(encode(mu), 'application/octet-stream', partialKeyFor(options));
+    },
+
+    // Resolves to the partial buffer saved for these options' geometry, or null.
+    async loadPartial(options) {
+        const data = await s3Service.getObject(partialKeyFor(options));
+        return data ? decode(data, options.width * options.height) : null;
+    },
+
+    async deletePartial(options) {
+        return s3Service.deleteFile(partialKeyFor(options));
+    },
+};
+
+module.exports = iterationStoreService;
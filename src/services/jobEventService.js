@@ -0,0 +1,60 @@
+const db = require('../database.js');
+const Fractal = require('../models/fractal.model.js');
+
+// Lets requests wait for a job's next status change instead of polling for it.
+// Workers publish changes with Fractal.notifyStatus; this process listens on
+// the channel once and wakes the waiters for that hash.
+const waiters = new Map();
+let listening = null;
+
+function onNotification(payload) {
+    let event;
+    try {
+        event = JSON.parse(payload);
+    } catch (err) {
+        console.error('Ignoring malformed status notification:', payload);
+        return;
+    }
+    const forHash = waiters.get(event.hash);
+    if (!forHash) return;
+    waiters.delete(event.hash);
+    for (const wake of forHash) {
+        wake(event.status);
+    }
+}
+
+function startListening() {
+    if (!listening) {
+        listening = db.listen(Fractal.STATUS_CHANNEL, onNotification).catch((err) => {
+            console.error('Could not listen for status notifications:', err);
+            listening = null;
+        });
+    }
+    return listening;
+}
+
+// Returns { changed, cancel }: `changed` resolves to the first status published
+// for `hash` after this call, or to null after timeoutMs or on cancel(). Wait
+// first and read the row second, so a change in between is not missed.
+function waitForStatus(hash, timeoutMs) {
+    startListening();
+    let wake;
+    const changed = new Promise((resolve) => {
+        const timer = setTimeout(() => finish(null), timeoutMs);
+        const finish = (status) => {
+            clearTimeout(timer);
+            const forHash = waiters.get(hash);
+            if (forHash) {
+                forHash.delete(wake);
+                if (forHash.size === 0) waiters.delete(hash);
+            }
+            resolve(status);
+        };
+        wake = finish;
+        if (!waiters.has(hash)) waiters.set(hash, new Set());
+        waiters.get(hash).add(wake);
+    });
+    return { changed, cancel: () => wake(null) };
+}
+
+module.exports = { waitForStatus, startListening };
@@ -0,0 +1,448 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const { Worker, isMainThread, parentPort, workerData } = require('worker_threads');
+const jwt = require('jsonwebtoken');
+
+// Stand-ins for every AWS service and server the API and worker use, so the
+// whole submit -> render -> store -> poll pipeline runs in one process with
+// no network: `LOCAL_STACK=1 node server.js`, or `npm run local`.
+//   Parameter Store, Secrets Manager   PARAMETERS below; LOCAL_PARAMETER_<name> overrides one
+//   SQS        an in-memory queue with visibility timeouts and long polling
+//   S3         files under LOCAL_STACK_DIR/objects, served from OBJECTS_PATH by
+//              signed URLs that expire like presigned ones
+//   Postgres   embedded-postgres in LOCAL_STACK_DIR/postgres, or any server at LOCAL_DATABASE_URL
+//   Memcached  an in-process map with TTLs
+//   Cognito    users from LOCAL_USERS (name:password[:admin], comma-separated),
+//              with id tokens signed by a local key
+// Routes and models are unchanged, so clients see the production /auth,
+// /fractal, /fractal/status, /gallery and /admin contract.
+//
+// The queue worker (fractal.worker.js) runs on LOCAL_WORKERS worker threads
+// started by server.js, so renders don't block the API's event loop. Its
+// queue and cache calls are forwarded to the main thread, which owns them;
+// objects and the database are shared through the filesystem and Postgres.
+const enabled = ['1', 'true'].includes((process.env.LOCAL_STACK || '').toLowerCase());
+// Set in worker threads started by startWorkers.
+const shared = !isMainThread && workerData && workerData.localStack;
+
+const STACK_DIR = path.resolve(process.env.LOCAL_STACK_DIR || '.local-stack');
+const PORT = process.env.PORT || '3000';
+const PUBLIC_URL = process.env.LOCAL_PUBLIC_URL || `http://localhost:${PORT}`;
+const OBJECTS_PATH = '/local-objects';
+const QUEUE_URL = 'local://fractal-jobs';
+const API_KEY = process.env.LOCAL_API_KEY || 'local-api-key';
+const DEFAULT_USERS = 'user:Testtest123!,admin:Testtest123!:admin';
+
+const PARAMETERS = {
+    '/n11051337/port': PORT,
+    '/n11051337/aws_region': 'local',
+    '/n11051337/user_pool_id': 'local',
+    '/n11051337/client_id': 'local',
+    '/n11051337/sqs_queue_url': QUEUE_URL,
+    '/n11051337/s3_bucket_name': 'local',
+    '/n11051337/s3_tag_qut_username': null,
+    '/n11051337/s3_tag_purpose': null,
+    '/n11051337/memcached_address': 'local',
+    '/a3/group123/dlq_api_key': API_KEY,
+};
+
+// Seconds a received message stays hidden before it is delivered again, as
+// SQS's default visibility timeout.
+const VISIBILITY_TIMEOUT_SECONDS = 30;
+// Lifetime of local id tokens, as Cognito's default.
+const TOKEN_SECONDS = 3600;
+// Signs tokens and object URLs; a fresh one per process unless pinned.
+const SIGNING_KEY = shared ? shared.signingKey : (process.env.LOCAL_SIGNING_KEY || crypto.randomBytes(32).toString('hex'));
+// Ends up in signup confirmation codes, which the stack prints instead of emailing.
+const CONFIRMATION_CODE = '123456';
+
+function getParameter(name) {
+    const override = process.env[`LOCAL_PARAMETER_${name.replace(/[^A-Za-z0-9]/g, '_')}`];
+    return override !== undefined ? override : (PARAMETERS[name] !== undefined ? PARAMETERS[name] : null);
+}
+
+// SQSClient.send for the commands the API and worker use, by command name.
+class LocalQueue {
+    constructor() {
+        this.messages = []; // { id, body, visibleAt, receipt }
+        this.waiters = [];
+        this.sequence = 0;
+    }
+
+    async send(command) {
+        return this.handle(command.constructor.name, command.input);
+    }
+
+    async handle(name, input) {
+        switch (name) {
+            case 'SendMessageCommand':
+                return { MessageId: this._push(input.MessageBody) };
+            case 'SendMessageBatchCommand':
+                return { Successful: input.Entries.map((entry) => ({ Id: entry.Id, MessageId: this._push(entry.MessageBody) })), Failed: [] };
+            case 'ReceiveMessageCommand':
+                return { Messages: await this._receive(input.MaxNumberOfMessages || 1, input.WaitTimeSeconds || 0, input.VisibilityTimeout) };
+            case 'DeleteMessageCommand':
+                this.messages = this.messages.filter((message) => message.receipt !== input.ReceiptHandle);
+                return {};
+            case 'ChangeMessageVisibilityCommand': {
+                const message = this.messages.find((m) => m.receipt === input.ReceiptHandle);
+                if (message) {
+                    message.visibleAt = Date.now() + input.VisibilityTimeout * 1000;
+                    this._wakeAt(message.visibleAt);
+                }
+                return {};
+            }
+            default:
+                throw new Error(`The local queue does not support ${name}.`);
+        }
+    }
+
+    get depth() {
+        return this.messages.length;
+    }
+
+    _push(body) {
+        const id = String(++this.sequence);
+        this.messages.push({ id, body, visibleAt: 0, receipt: null });
+        this._wake();
+        return id;
+    }
+
+    _take(max, visibility) {
+        const now = Date.now();
+        const taken = [];
+        for (const message of this.messages) {
+            if (taken.length >= max) break;
+            if (message.visibleAt <= now) {
+                message.visibleAt = now + (visibility !== undefined ? visibility : VISIBILITY_TIMEOUT_SECONDS) * 1000;
+                message.receipt = crypto.randomUUID();
+                this._wakeAt(message.visibleAt);
+                taken.push({ MessageId: message.id, Body: message.body, ReceiptHandle: message.receipt });
+            }
+        }
+        return taken;
+    }
+
+    async _receive(max, waitSeconds, visibility) {
+        const deadline = Date.now() + waitSeconds * 1000;
+        for (;;) {
+            const taken = this._take(max, visibility);
+            if (taken.length > 0 || Date.now() >= deadline) {
+                return taken;
+            }
+            await new Promise((resolve) => {
+                const timer = setTimeout(done, deadline - Date.now());
+                function done() {
+                    clearTimeout(timer);
+                    resolve();
+                }
+                this.waiters.push(done);
+            });
+        }
+    }
+
+    _wake() {
+        const waiters = this.waiters;
+        this.waiters = [];
+        waiters.forEach((done) => done());
+    }
+
+    // Messages becoming visible again wake long-polling receivers then.
+    _wakeAt(time) {
+        setTimeout(() => this._wake(), Math.max(0, time - Date.now())).unref();
+    }
+}
+
+// The S3 operations s3Service uses, on files under STACK_DIR/objects.
+const objects = {
+    dir: path.join(STACK_DIR, 'objects'),
+
+    _path(key) {
+        const file = path.resolve(objects.dir, key);
+        if (!file.startsWith(objects.dir + path.sep)) {
+            throw new Error(`Invalid object key '${key}'.`);
+        }
+        return file;
+    },
+
+    async put(key, body) {
+        const file = objects._path(key);
+        await fs.promises.mkdir(path.dirname(file), { recursive: true });
+        await fs.promises.writeFile(file, body);
+        return key;
+    },
+
+    async get(key) {
+        try {
+            return await fs.promises.readFile(objects._path(key));
+        } catch (error) {
+            if (error.code === 'ENOENT') return null;
+            throw error;
+        }
+    },
+
+    async delete(key) {
+        await fs.promises.rm(objects._path(key), { force: true });
+    },
+
+    async deletePrefix(prefix) {
+        // Prefixes end in '/' wherever s3Service uses them, so they name a directory.
+        await fs.promises.rm(objects._path(prefix), { recursive: true, force: true });
+    },
+
+    _signature(key, expires) {
+        return crypto.createHmac('sha256', SIGNING_KEY).update(`${key}\n${expires}`).digest('hex');
+    },
+
+    url(key, expiresSeconds) {
+        const expires = Math.floor(Date.now() / 1000) + expiresSeconds;
+        const encoded = key.split('/').map(encodeURIComponent).join('/');
+        return `${PUBLIC_URL}${OBJECTS_PATH}/${encoded}?expires=${expires}&signature=${objects._signature(key, expires)}`;
+    },
+
+    // Express handler for OBJECTS_PATH: serves an object to a valid, unexpired URL.
+    serve(req, res) {
+        const key = decodeURIComponent(req.path.slice(1));
+        const expires = parseInt(req.query.expires);
+        const signature = String(req.query.signature || '');
+        const expected = objects._signature(key, expires);
+        if (!expires || expires < Date.now() / 1000 || signature.length !== expected.length
+            || !crypto.timingSafeEqual(Buffer.from(signature), Buffer.from(expected))) {
+            return res.status(403).send('Request has expired or is not signed.');
+        }
+        res.sendFile(objects._path(key), (error) => {
+            if (error && !res.headersSent) res.status(404).send('NoSuchKey');
+        });
+    },
+};
+
+// The memcached client's aGet/aGetMulti/aSet/aDel. Values are stored as JSON, so callers
+// get copies back, as they do from memcached.
+const cache = {
+    entries: new Map(),
+
+    async aGet(key) {
+        const entry = cache.entries.get(key);
+        if (!entry) return undefined;
+        if (entry.expiresAt && entry.expiresAt <= Date.now()) {
+            cache.entries.delete(key);
+            return undefined;
+        }
+        return JSON.parse(entry.value);
+    },
+
+    async aGetMulti(keys) {
+        const found = {};
+        for (const key of keys) {
+            const value = await cache.aGet(key);
+            if (value !== undefined) found[key] = value;
+        }
+        return found;
+    },
+
+    async aSet(key, value, ttl) {
+        cache.entries.set(key, { value: JSON.stringify(value), expiresAt: ttl ? Date.now() + ttl * 1000 : 0 });
+        return true;
+    },
+
+    async aDel(key) {
+        return cache.entries.delete(key);
+    },
+};
+
+// Cognito's sign-up, confirmation, password and refresh-token flows for auth.js.
+// Answers carry AuthenticationResult fields like InitiateAuth's; failures
+// throw with Cognito's messages.
+const identity = {
+    users: new Map(),
+    refreshTokens: new Map(),
+
+    seed(spec) {
+        for (const entry of spec.split(',').filter(Boolean)) {
+            const [username, password, group] = entry.split(':');
+            identity.users.set(username, { sub: crypto.randomUUID(), username, password, email: `${username}@localhost`, confirmed: true, groups: group ? [group] : [] });
+        }
+    },
+
+    signUp(username, email, password) {
+        if (identity.users.has(username)) {
+            throw new Error('User already exists');
+        }
+        identity.users.set(username, { sub: crypto.randomUUID(), username, password, email, confirmed: false, groups: [] });
+        console.log(`[local stack] Confirmation code for ${username}: ${CONFIRMATION_CODE}`);
+    },
+
+    confirmSignUp(username, code) {
+        const user = identity.users.get(username);
+        if (!user || code !== CONFIRMATION_CODE) {
+            throw new Error('Invalid verification code provided, please try again.');
+        }
+        user.confirmed = true;
+    },
+
+    _tokens(user) {
+        const claims = { sub: user.sub, 'cognito:username': user.username, email: user.email, 'cognito:groups': user.groups };
+        const idToken = jwt.sign({ ...claims, token_use: 'id' }, SIGNING_KEY, { expiresIn: TOKEN_SECONDS });
+        const accessToken = jwt.sign({ ...claims, token_use: 'access' }, SIGNING_KEY, { expiresIn: TOKEN_SECONDS });
+        return { IdToken: idToken, AccessToken: accessToken, ExpiresIn: TOKEN_SECONDS, TokenType: 'Bearer' };
+    },
+
+    login(username, password) {
+        const user = identity.users.get(username);
+        if (!user || user.password !== password) {
+            throw new Error('Incorrect username or password.');
+        }
+        if (!user.confirmed) {
+            throw new Error('User is not confirmed.');
+        }
+        const refreshToken = crypto.randomBytes(32).toString('hex');
+        identity.refreshTokens.set(refreshToken, username);
+        return { ...identity._tokens(user), RefreshToken: refreshToken };
+    },
+
+    refresh(refreshToken) {
+        const user = identity.users.get(identity.refreshTokens.get(refreshToken));
+        if (!user) {
+            throw new Error('Invalid Refresh Token');
+        }
+        return identity._tokens(user);
+    },
+
+    // The id token's payload, as CognitoJwtVerifier.verify resolves it.
+    verify(token) {
+        const payload = jwt.verify(token, SIGNING_KEY);
+        if (payload.token_use !== 'id') {
+            throw new Error('Not an id token.');
+        }
+        return payload;
+    },
+};
+
+identity.seed(process.env.LOCAL_USERS || DEFAULT_USERS);
+
+let database = null;
+
+// Connection settings in the shape of the RDS secret database.js reads.
+// Starts (and on first use creates) the embedded server, unless
+// LOCAL_DATABASE_URL names one; worker threads get the main thread's.
+function startDatabase() {
+    if (!database) {
+        database = shared ? Promise.resolve(shared.database) : launchDatabase();
+    }
+    return database;
+}
+
+async function launchDatabase() {
+    if (process.env.LOCAL_DATABASE_URL) {
+        const url = new URL(process.env.LOCAL_DATABASE_URL);
+        return {
+            host: url.hostname,
+            port: parseInt(url.port) || 5432,
+            username: decodeURIComponent(url.username),
+            password: decodeURIComponent(url.password),
+            dbname: url.pathname.slice(1),
+        };
+    }
+    let EmbeddedPostgres;
+    try {
+        EmbeddedPostgres = (await import('embedded-postgres')).default;
+    } catch (error) {
+        throw new Error('The local stack needs embedded-postgres, an optional dependency skipped by npm install --omit=optional or on an unsupported platform, or LOCAL_DATABASE_URL.');
+    }
+    const settings = { host: 'localhost', port: parseInt(process.env.LOCAL_DATABASE_PORT) || 54329, username: 'postgres', password: 'postgres', dbname: 'fractals' };
+    const dataDir = path.join(STACK_DIR, 'postgres');
+    const server = new EmbeddedPostgres({ databaseDir: dataDir, user: settings.username, password: settings.password, port: settings.port, persistent: true });
+    const created = !fs.existsSync(path.join(dataDir, 'PG_VERSION'));
+    if (created) {
+        await server.initialise();
+    }
+    await server.start();
+    if (created) {
+        await server.createDatabase(settings.dbname);
+    }
+    for (const signal of ['SIGINT', 'SIGTERM']) {
+        process.once(signal, async () => {
+            await server.stop();
+            process.exit(0);
+        });
+    }
+    return settings;
+}
+
+// Calls to the main thread's queue and cache from a worker thread.
+const calls = new Map();
+let callSequence = 0;
+
+function callMain(target, method, args) {
+    return new Promise((resolve, reject) => {
+        const id = ++callSequence;
+        calls.set(id, { resolve, reject });
+        parentPort.postMessage({ localStackCall: { id, target, method, args } });
+    });
+}
+
+if (shared) {
+    parentPort.on('message', (message) => {
+        const reply = message && message.localStackReply;
+        if (!reply || !calls.has(reply.id)) return;
+        const { resolve, reject } = calls.get(reply.id);
+        calls.delete(reply.id);
+        if (reply.error) {
+            reject(new Error(reply.error));
+        } else {
+            resolve(reply.result);
+        }
+    });
+}
+
+const queue = shared
+    ? { send: (command) => callMain('queue', 'handle', [command.constructor.name, command.input]) }
+    : new LocalQueue();
+
+const cacheClient = shared
+    ? Object.fromEntries(['aGet', 'aGetMulti', 'aSet', 'aDel'].map((method) => [method, (...args) => callMain('cache', method, args)]))
+    : cache;
+
+// Runs `script` on `count` worker threads sharing this thread's stand-ins.
+// A thread that dies is replaced a second later.
+async function startWorkers(script, count) {
+    const settings = { database: await startDatabase(), signingKey: SIGNING_KEY };
+    const targets = { queue, cache };
+    const start = (index) => {
+        const worker = new Worker(script, { workerData: { localStack: settings } });
+        worker.on('message', async (message) => {
+            const call = message && message.localStackCall;
+            if (!call) return;
+            try {
+                const result = await targets[call.target][call.method](...call.args);
+                worker.postMessage({ localStackReply: { id: call.id, result } });
+            } catch (error) {
+                worker.postMessage({ localStackReply: { id: call.id, error: error.message } });
+            }
+        });
+        worker.on('error', (error) => console.error(`[local stack] Worker thread ${index} failed:`, error));
+        worker.on('exit', (code) => {
+            console.error(`[local stack] Worker thread ${index} exited with code ${code}; restarting it.`);
+            setTimeout(() => start(index), 1000);
+        });
+    };
+    for (let i = 0; i < count; i++) {
+        start(i);
+    }
+}
+
+module.exports = {
+    enabled,
+    getParameter,
+    queue,
+    objects,
+    cache: cacheClient,
+    identity,
+    startDatabase,
+    startWorkers,
+    OBJECTS_PATH,
+    QUEUE_URL,
+    SIGNING_KEY,
+    STACK_DIR,
+};
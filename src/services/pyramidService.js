@@ -0,0 +1,93 @@
+const { createCanvas, loadImage } = require('canvas');
+const s3Service = require('./s3Service');
+
+// Thumbnails and Deep Zoom (DZI) tile pyramids, stored next to each fractal
+// image so the gallery can show a small preview and fetch the full image only
+// when it is opened. The layout matches fractal_engine/pyramid.py:
+//   thumbnails/<hash>.png                           at most THUMBNAIL_SIZE on its long side
+//   fractals/<hash>.dzi                             the descriptor
+//   fractals/<hash>_files/<level>/<col>_<row>.png   the tiles; level 0 is 1x1,
+//                                                   each level doubles the one below
+const THUMBNAIL_SIZE = 480;
+const TILE_SIZE = 254;
+const TILE_OVERLAP = 1;
+// Tiles uploaded at once.
+const UPLOAD_CONCURRENCY = 16;
+
+const thumbnailKey = (hash) => `thumbnails/${hash}.png`;
+const tilesKey = (hash) => `fractals/${hash}.dzi`;
+const tilesPrefix = (descriptorKey) => descriptorKey.replace(/\.dzi$/, '_files/');
+
+function descriptor(width, height) {
+    return '<?xml version="1.0" encoding="UTF-8"?>\n'
+        + `<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" Overlap="${TILE_OVERLAP}" TileSize="${TILE_SIZE}">`
+        + `<Size Width="${width}" Height="${height}"/></Image>\n`;
+}
+
+// Each level is the one above drawn at half size (rounded up), full frame first.
+function levels(image) {
+    let level = Math.ceil(Math.log2(Math.max(image.width, image.height, 1)));
+    let canvas = createCanvas(image.width, image.height);
+    canvas.getContext('2d').drawImage(image, 0, 0);
+    const out = [{ level, canvas }];
+    while (level > 0) {
+        level--;
+        const half = createCanvas(Math.ceil(canvas.width / 2), Math.ceil(canvas.height / 2));
+        const ctx = half.getContext('2d');
+        ctx.imageSmoothingQuality = 'high';
+        ctx.drawImage(canvas, 0, 0, half.width, half.height);
+        canvas = half;
+        out.push({ level, canvas });
+    }
+    return out;
+}
+
+function tile(canvas, x, y) {
+    const left = Math.max(0, x - TILE_OVERLAP);
+    const top = Math.max(0, y - TILE_OVERLAP);
+    const width = Math.min(canvas.width, x + TILE_SIZE + TILE_OVERLAP) - left;
+    const height = Math.min(canvas.height, y + TILE_SIZE + TILE_OVERLAP) - top;
+    const out = createCanvas(width, height);
+    out.getContext('2d').drawImage(canvas, left, top, width, height, 0, 0, width, height);
+    return out.toBuffer('image/png');
+}
+
+// Builds and uploads the thumbnail and tiles of a fractal's PNG. Resolves to
+// { thumbnailKey, tilesKey }; the thumbnail is uploaded last, once every tile
+// it could lead a viewer to is in place.
+async function storePyramid(hash, png) {
+    const image = await loadImage(png);
+    const uploads = [];
+    let thumbnail = null;
+    for (const { level, canvas } of levels(image)) {
+        if (!thumbnail && Math.max(canvas.width, canvas.height) <= THUMBNAIL_SIZE) {
+            thumbnail = canvas.toBuffer('image/png');
+        }
+        for (let row = 0, y = 0; y < canvas.height; row++, y += TILE_SIZE) {
+            for (let column = 0, x = 0; x < canvas.width; column++, x += TILE_SIZE) {
+                uploads.push({ key: `fractals/${hash}_files/${level}/${column}_${row}.png`, body: tile(canvas, x, y), contentType: 'image/png' });
+            }
+        }
+    }
+    uploads.push({ key: tilesKey(hash), body: Buffer.from(descriptor(image.width, image.height)), contentType: 'application/xml' });
+
+    for (let i = 0; i < uploads.length; i += UPLOAD_CONCURRENCY) {
+        await Promise.all(uploads.slice(i, i + UPLOAD_CONCURRENCY).map(({ key, body, contentType }) =>
+            s3Service.uploadObject(body, contentType, key)));
+    }
+    await s3Service.uploadObject(thumbnail, 'image/png', thumbnailKey(hash));
+    return { thumbnailKey: thumbnailKey(hash), tilesKey: tilesKey(hash) };
+}
+
+// Removes whatever previews a fractal row has; rows from before previews have none.
+async function deletePyramid(fractal) {
+    if (fractal.thumbnail_key) {
+        await s3Service.deleteFile(fractal.thumbnail_key);
+    }
+    if (fractal.tiles_key) {
+        await s3Service.deletePrefix(tilesPrefix(fractal.tiles_key));
+        await s3Service.deleteFile(fractal.tiles_key);
+    }
+}
+
+module.exports = { storePyramid, deletePyramid, tilesPrefix, THUMBNAIL_SIZE };
@@ -1,7 +1,8 @@
-const { S3Client, PutObjectCommand, DeleteObjectCommand, GetObjectCommand, CreateBucketCommand, PutBucketTaggingCommand, HeadBucketCommand } = require('@aws-sdk/client-s3');
-const { getSignedUrl } = require('@aws-sdk/s3-request-presigner');
+const { S3Client, PutObjectCommand, DeleteObjectCommand, DeleteObjectsCommand, ListObjectsV2Command, GetObjectCommand, CreateBucketCommand, PutBucketTaggingCommand, HeadBucketCommand } = require('@aws-sdk/client-s3');
+const { getSignedUrl, S3RequestPresigner } = require('@aws-sdk/s3-request-presigner');
 const { v4: uuidv4 } = require('uuid');
 const { getAwsRegion, getParameter } = require("./awsConfigService");
+const localStack = require("./localStack");
 
 let s3ClientInstance = null;
 let BUCKET_NAME;
@@ -10,6 +11,41 @@ let PURPOSE;
 
 let s3ConfigInitialised = null;
 
+// Presigned URLs are signed for exactly the lifetime asked for and reused
+// from an in-process cache until less than URL_REUSE_FRACTION of it is left,
+// so listings and status polls re-sign an object at most twice per lifetime.
+// A URL handed out therefore expires within the lifetime asked for, and is
+// valid for at least half of it.
+const URL_REUSE_FRACTION = 0.5;
+// Most URLs kept. When full, expired URLs and the oldest quarter are dropped
+// in one pass; deleting one at a time from the front of a Map slows down as
+// deleted entries pile up.
+const URL_CACHE_SIZE = 10000;
+
+const urlCache = new Map(); // `${expiresSeconds}:${key}` -> { url: Promise, reuseUntil }
+
+// S3's escaping of an object key in a request path: each segment
+// URI-encoded, including the characters encodeURIComponent leaves.
+const escapeKey = (key) => key.split('/').map((segment) => encodeURIComponent(segment)
+  .replace(/[!'()*]/g, (c) => `%${c.charCodeAt(0).toString(16).toUpperCase()}`)).join('/');
+
+const formatUrl = ({ protocol, hostname, port, path, query }) => {
+  const search = Object.keys(query).sort()
+    .map((name) => `${encodeURIComponent(name)}=${encodeURIComponent(query[name])}`).join('&');
+  return `${protocol}//${hostname}${port ? `:${port}` : ''}${path}?${search}`;
+};
+
+function makeRoomInUrlCache() {
+  const now = Date.now();
+  let oldest = URL_CACHE_SIZE / 4;
+  for (const [cacheKey, entry] of urlCache) {
+    if (oldest > 0 || entry.reuseUntil <= now) {
+      urlCache.delete(cacheKey);
+      oldest--;
+    }
+  }
+}
+
 async function initialiseS3Config() {
   BUCKET_NAME = await getParameter('/n11051337/s3_bucket_name');
   QUT_USERNAME = await getParameter('/n11051337/s3_tag_qut_username');
@@ -38,6 +74,9 @@ async function getS3Client() {
 const s3Service = {
   async ensureBucketAndTags() {
     await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return;
+    }
     if (!BUCKET_NAME) {
       console.error('S3_BUCKET_NAME is not defined in Parameter Store. Exiting application.');
       throw new Error('S3_BUCKET_NAME is not defined.');
@@ -81,12 +120,19 @@ const s3Service = {
   },
 
   async uploadFile(fileBuffer, contentType, folder = 'fractals', fileName = null) {
-    await s3ConfigInitialised;
     const key = fileName ? `${folder}/${fileName}.png` : `${folder}/${uuidv4()}.png`;
+    return s3Service.uploadObject(fileBuffer, contentType, key);
+  },
+
+  async uploadObject(body, contentType, key) {
+    await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return localStack.objects.put(key, body);
+    }
     const params = {
       Bucket: BUCKET_NAME,
       Key: key,
-      Body: fileBuffer,
+      Body: body,
       ContentType: contentType,
       ACL: 'private',
     };
@@ -102,8 +148,104 @@ const s3Service = {
     }
   },
 
-  async getPresignedUrl(key, expiresSeconds = 300) {
+  // Resolves to the object's bytes, or to null if there is no such key.
+  async getObject(key) {
+    await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return localStack.objects.get(key);
+    }
+    try {
+      const s3Client = await getS3Client();
+      const response = await s3Client.send(new GetObjectCommand({ Bucket: BUCKET_NAME, Key: key }));
+      return Buffer.from(await response.Body.transformToByteArray());
+    } catch (error) {
+      if (error.name === 'NoSuchKey' || error.name === 'NotFound') {
+        return null;
+      }
+      console.error('Error downloading file from S3:', error);
+      throw new Error('Failed to download file from S3.');
+    }
+  },
+
+  // A URL for the object that expires within `expiresSeconds` and is valid
+  // for at least half of it, from the cache if one is.
+  getPresignedUrl(key, expiresSeconds = 300) {
+    return s3Service.getPresignedUrls([key], expiresSeconds).then((urls) => urls[key]);
+  },
+
+  // getPresignedUrl for every key of a page at once: { key: url }. Repeated
+  // keys are signed once, missing (null) ones skipped, and the keys not
+  // cached signed together by signUrls.
+  async getPresignedUrls(keys, expiresSeconds = 300) {
+    const unique = [...new Set(keys.filter(Boolean))];
+    const now = Date.now();
+    const missing = []; // Indexes into unique.
+    const urls = unique.map((key, index) => {
+      const cached = urlCache.get(`${expiresSeconds}:${key}`);
+      if (cached && cached.reuseUntil > now) return cached.url;
+      missing.push(index);
+      return null;
+    });
+    if (missing.length > 0) {
+      if (urlCache.size + missing.length > URL_CACHE_SIZE) {
+        makeRoomInUrlCache();
+      }
+      // Concurrent requests for the same objects share one signing.
+      const signed = s3Service.signUrls(missing.map((index) => unique[index]), expiresSeconds);
+      const reuseUntil = now + expiresSeconds * (1 - URL_REUSE_FRACTION) * 1000;
+      missing.forEach((index, i) => {
+        const cacheKey = `${expiresSeconds}:${unique[index]}`;
+        urls[index] = signed.then((all) => all[i]);
+        urls[index].catch(() => urlCache.delete(cacheKey));
+        urlCache.delete(cacheKey); // Re-inserted at the back, so eviction stays oldest first.
+        urlCache.set(cacheKey, { url: urls[index], reuseUntil });
+      });
+    }
+    const resolved = await Promise.all(urls);
+    return Object.fromEntries(unique.map((key, i) => [key, resolved[i]]));
+  },
+
+  // Freshly signed URLs for `keys`, in order, bypassing the cache. The first
+  // is signed by getSignedUrl, which resolves the endpoint and credentials;
+  // the rest reuse its endpoint and one presigner at the same signing date,
+  // so the signing key is derived once and each further URL is only an
+  // HMAC over its canonical request, with no pass through the client's
+  // middleware.
+  async signUrls(keys, expiresSeconds) {
+    await s3ConfigInitialised;
+    if (localStack.enabled || keys.length < 2) {
+      return Promise.all(keys.map((key) => s3Service.signUrl(key, expiresSeconds)));
+    }
+    try {
+      const s3Client = await getS3Client();
+      const signingDate = new Date();
+      const first = await getSignedUrl(s3Client, new GetObjectCommand({ Bucket: BUCKET_NAME, Key: keys[0] }),
+        { expiresIn: expiresSeconds, signingDate });
+      const { protocol, hostname, port, pathname } = new URL(first);
+      if (!pathname.endsWith(escapeKey(keys[0]))) {
+        // An endpoint that doesn't put the key at the end of the path: sign each on its own.
+        return [first, ...await Promise.all(keys.slice(1).map((key) => s3Service.signUrl(key, expiresSeconds)))];
+      }
+      const prefix = pathname.slice(0, pathname.length - escapeKey(keys[0]).length);
+      const host = port ? `${hostname}:${port}` : hostname;
+      const presigner = new S3RequestPresigner({ ...s3Client.config });
+      const rest = await Promise.all(keys.slice(1).map(async (key) => formatUrl(await presigner.presign({
+        method: 'GET', protocol, hostname, port: port ? parseInt(port) : undefined,
+        path: prefix + escapeKey(key), query: {}, headers: { host },
+      }, { expiresIn: expiresSeconds, signingDate }))));
+      return [first, ...rest];
+    } catch (error) {
+      console.error('Error generating pre-signed URLs:', error);
+      throw new Error('Failed to generate pre-signed URL.');
+    }
+  },
+
+  // A freshly signed URL, bypassing the cache.
+  async signUrl(key, expiresSeconds) {
     await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return localStack.objects.url(key, expiresSeconds);
+    }
     const command = new GetObjectCommand({
       Bucket: BUCKET_NAME,
       Key: key,
@@ -120,6 +262,9 @@ const s3Service = {
 
   async deleteFile(key) {
     await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return localStack.objects.delete(key);
+    }
     const params = {
       Bucket: BUCKET_NAME,
       Key: key,
@@ -134,6 +279,35 @@ const s3Service = {
       throw new Error('Failed to delete file from S3.');
     }
   },
+
+  // Deletes every object under the prefix, a page (up to 1000 keys) per request.
+  async deletePrefix(prefix) {
+    await s3ConfigInitialised;
+    if (localStack.enabled) {
+      return localStack.objects.deletePrefix(prefix);
+    }
+    try {
+      const s3Client = await getS3Client();
+      let continuationToken;
+      do {
+        const page = await s3Client.send(new ListObjectsV2Command({
+          Bucket: BUCKET_NAME,
+          Prefix: prefix,
+          ContinuationToken: continuationToken,
+        }));
+        if (page.Contents && page.Contents.length > 0) {
+          await s3Client.send(new DeleteObjectsCommand({
+            Bucket: BUCKET_NAME,
+            Delete: { Objects: page.Contents.map(({ Key }) => ({ Key })), Quiet: true },
+          }));
+        }
+        continuationToken = page.IsTruncated ? page.NextContinuationToken : undefined;
+      } while (continuationToken);
+    } catch (error) {
+      console.error('Error deleting files from S3:', error);
+      throw new Error('Failed to delete files from S3.');
+    }
+  },
 };
 
 module.exports = s3Service;
\ No newline at end of file
@@ -1,19 +1,36 @@
 require('dotenv').config();
-const { SQSClient, ReceiveMessageCommand, DeleteMessageCommand } = require('@aws-sdk/client-sqs');
-const { generateFractal } = require('../services/fractalGenerationService');
+const os = require('os');
+const { SQSClient, ReceiveMessageCommand, SendMessageCommand, DeleteMessageCommand, ChangeMessageVisibilityCommand } = require('@aws-sdk/client-sqs');
+const { computeIterations, renderPng } = require('../services/fractalGenerationService');
 const s3Service = require('../services/s3Service');
+const iterationStore = require('../services/iterationStoreService');
+const pyramidService = require('../services/pyramidService');
 const Fractal = require('../models/fractal.model');
 const History = require('../models/history.model');
 const Gallery = require('../models/gallery.model');
 const cacheService = require('../services/cacheService');
 const awsConfigService = require('../services/awsConfigService');
+const localStack = require('../services/localStack');
 
 let sqsClient;
 let queueUrl;
 
+// Render claims are leased per worker so concurrent duplicates of a hash are
+// rendered once. The lease outlasts generateFractal's maxTime plus upload.
+const WORKER_ID = `${os.hostname()}:${process.pid}`;
+const LEASE_SECONDS = 180;
+// A duplicate whose hash is leased elsewhere goes back on the queue for this
+// long (at most) before looking again for the winner's result.
+const DUPLICATE_RECHECK_SECONDS = 30;
+// A render its deadline cuts short is not stored as the fractal's image: its
+// partial iterations are saved and the job re-queued to carry on from them,
+// up to this many times. After that the coarse image is kept, flagged by its
+// resolution_stride.
+const MAX_REFINEMENTS = 3;
+
 async function initialise() {
     const region = await awsConfigService.getAwsRegion();
-    sqsClient = new SQSClient({ region });
+    sqsClient = localStack.enabled ? localStack.queue : new SQSClient({ region });
     queueUrl = await awsConfigService.getParameter('/n11051337/sqs_queue_url');
     if (!queueUrl) {
         console.error('SQS_QUEUE_URL not found in Parameter Store. Exiting worker.');
@@ -44,6 +61,81 @@ async function pollQueue() {
     }
 }
 
+// { buffer, stride, mu } for the job's options, with the PNG in buffer and
+// the finest progressive pass completed in stride (1 is full resolution),
+// or null if nothing could be rendered in time. A colour-only variant of an
+// earlier job is recoloured from that job's stored iteration buffer;
+// anything else is rendered, carrying on from the partial buffer a cut-short
+// attempt saved at `resumeStride`, and a full-resolution result stored for
+// later variants.
+async function renderFractal(options, hash, resumeStride) {
+    const { width, height, maxIterations, colourScheme } = options;
+    const log = (message) => console.log(`[${new Date().toISOString()}] ${hash}: ${message}`);
+
+    try {
+        const stored = await iterationStore.load(options);
+        if (stored) {
+            log('Recolouring stored iteration buffer.');
+            return { buffer: renderPng(stored, width, height, maxIterations, colourScheme), stride: 1, mu: stored };
+        }
+    } catch (error) {
+        console.error(`Could not load stored iterations for hash ${hash}; rendering instead:`, error);
+    }
+
+    let resume = null;
+    if (resumeStride) {
+        try {
+            const partial = await iterationStore.loadPartial(options);
+            if (partial) {
+                log(`Carrying on from the 1/${resumeStride} resolution pass of an earlier attempt.`);
+                resume = { mu: partial, stride: resumeStride };
+            }
+        } catch (error) {
+            console.error(`Could not load partial iterations for hash ${hash}; rendering from scratch:`, error);
+        }
+    }
+
+    const result = await computeIterations({ ...options, resume, debugLog: log });
+    if (!result) {
+        return null;
+    }
+    if (result.stride === 1) {
+        try {
+            await iterationStore.save(options, result.mu);
+        } catch (error) {
+            console.error(`Could not store iterations for hash ${hash}:`, error);
+        }
+    }
+    return { buffer: renderPng(result.mu, width, height, maxIterations, colourScheme), stride: result.stride, mu: result.mu };
+}
+
+// Saves a cut-short render's iterations and queues the job again to refine
+// them, releasing this worker's claim so any worker can pick it up. The
+// fractal stays 'generating' meanwhile.
+async function requeueRefinement(job, message, rendered) {
+    const refinements = (job.refinements || 0) + 1;
+    await iterationStore.savePartial(job.options, rendered.mu);
+    await sqsClient.send(new SendMessageCommand({
+        QueueUrl: queueUrl,
+        MessageBody: JSON.stringify({ ...job, refinements, resumeStride: rendered.stride }),
+    }));
+    await Fractal.releaseClaim(job.hash, WORKER_ID);
+    await sqsClient.send(new DeleteMessageCommand({ QueueUrl: queueUrl, ReceiptHandle: message.ReceiptHandle }));
+    console.log(`[${new Date().toISOString()}] Hash ${job.hash} reached 1/${rendered.stride} resolution before its deadline; queued refinement ${refinements} of ${MAX_REFINEMENTS}.\n----------------------------------------`);
+}
+
+// A duplicate job whose fractal another job already finished: give this
+// job's user the result instead of rendering it again.
+async function finishDuplicate(job, fractal) {
+    if (!fractal) return;
+    if (job.historyId) {
+        await History.updateHistoryStatus(job.historyId, fractal.status);
+    }
+    if (fractal.status === 'complete' && job.user && job.user.id) {
+        await Gallery.addToGallery(job.user.id, fractal.id, fractal.hash);
+    }
+}
+
 async function processMessage(message) {
     let job;
     let existingFractal;
@@ -62,6 +154,7 @@ async function processMessage(message) {
 
         if (existingFractal && (existingFractal.status === 'complete' || existingFractal.status === 'too_complex')) {
             console.log(`Fractal with hash ${hash} already ${existingFractal.status}. Skipping generation.`);
+            await finishDuplicate(job, existingFractal);
             const deleteCommand = new DeleteMessageCommand({
                 QueueUrl: queueUrl,
                 ReceiptHandle: message.ReceiptHandle,
@@ -71,20 +164,52 @@ async function processMessage(message) {
             return;
         }
 
-        await Fractal.updateFractalStatus(hash, 'generating', (existingFractal && existingFractal.retry_count !== null && existingFractal.retry_count !== undefined ? existingFractal.retry_count : 0));
+        const claim = await Fractal.claimFractal(hash, WORKER_ID, LEASE_SECONDS);
+        if (!claim.claimed) {
+            if (claim.retryAfterSeconds === 0) {
+                // Finished by another worker since the lookup above.
+                console.log(`Fractal with hash ${hash} finished elsewhere. Skipping generation.`);
+                await finishDuplicate(job, await Fractal.findFractalByHash(hash));
+                await sqsClient.send(new DeleteMessageCommand({ QueueUrl: queueUrl, ReceiptHandle: message.ReceiptHandle }));
+            } else {
+                const delay = Math.max(1, Math.min(claim.retryAfterSeconds, DUPLICATE_RECHECK_SECONDS));
+                console.log(`Fractal with hash ${hash} is being rendered by another worker. Checking again in ${delay}s.`);
+                await sqsClient.send(new ChangeMessageVisibilityCommand({
+                    QueueUrl: queueUrl,
+                    ReceiptHandle: message.ReceiptHandle,
+                    VisibilityTimeout: delay,
+                }));
+            }
+            return;
+        }
         await History.updateHistoryStatus(historyId, 'generating');
+        await Fractal.notifyStatus(hash, 'generating');
 
     try {
-        const buffer = await generateFractal(options);
-        if (!buffer) {
+        const rendered = await renderFractal(options, hash, job.resumeStride);
+        if (!rendered) {
             console.error(`[${new Date().toISOString()}] Fractal generation timed out or failed for hash: ${hash}\n----------------------------------------`);
             await Fractal.updateFractalStatus(hash, 'too_complex', (existingFractal && existingFractal.retry_count !== null && existingFractal.retry_count !== undefined ? existingFractal.retry_count : 0));
+            await Fractal.releaseClaim(hash, WORKER_ID);
             await History.updateHistoryStatus(historyId, 'too_complex');
+            await Fractal.notifyStatus(hash, 'too_complex');
+            return;
+        }
+        if (rendered.stride > 1 && (job.refinements || 0) < MAX_REFINEMENTS) {
+            await requeueRefinement(job, message, rendered);
             return;
         }
 
+        const { buffer, stride } = rendered;
         console.log(`Storing fractal image in S3 for hash ${hash}...`);
         const s3Key = await s3Service.uploadFile(buffer, 'image/png', 'fractals', hash);
+        let previews = {};
+        try {
+            previews = await pyramidService.storePyramid(hash, buffer);
+        } catch (error) {
+            // The gallery falls back to the full image.
+            console.error(`Could not store previews for hash ${hash}:`, error);
+        }
         console.log(`Storing fractal metadata in database for hash ${hash}...`);
 
         let fractalIdToUse;
@@ -97,14 +222,16 @@ async function processMessage(message) {
             const { id: newFractalId } = await Fractal.createFractal(fractalData);
             fractalIdToUse = newFractalId;
         }
+        await Fractal.updateFractalPreviewKeys(hash, previews.thumbnailKey, previews.tilesKey);
+        await Fractal.updateFractalResolution(hash, stride);
+        if (job.resumeStride) {
+            iterationStore.deletePartial(options).catch((error) => console.error(`Could not delete partial iterations for hash ${hash}:`, error));
+        }
 
+        await Fractal.releaseClaim(hash, WORKER_ID);
         await History.updateHistoryStatus(historyId, 'complete');
         await Gallery.addToGallery(user.id, fractalIdToUse, hash);
-
-        const userCacheKey = `gallery:${user.id}:${JSON.stringify({})}:added_at:DESC:5:0`;
-        await cacheService.del(userCacheKey);
-        const adminCacheKey = `admin:gallery:${JSON.stringify({})}:added_at:DESC:5:0`;
-        await cacheService.del(adminCacheKey);
+        await Fractal.notifyStatus(hash, 'complete');
 
         console.log(`[${new Date().toISOString()}] Successfully processed and stored fractal with hash: ${hash}`);
 
@@ -118,13 +245,17 @@ async function processMessage(message) {
     } catch (innerError) {
         console.error(`\n--- ERROR ---\n[${new Date().toISOString()}] Failed during fractal generation or storage for hash ${hash}:`, innerError);
         await Fractal.updateFractalStatus(hash, 'failed', (existingFractal && existingFractal.retry_count !== null && existingFractal.retry_count !== undefined ? existingFractal.retry_count : 0) + 1);
+        await Fractal.releaseClaim(hash, WORKER_ID);
         await History.updateHistoryStatus(historyId, 'failed');
+        await Fractal.notifyStatus(hash, 'failed');
     }
 
     } catch (error) {
         console.error(`\n--- ERROR ---\n[${new Date().toISOString()}] Failed to process job for hash ${hash}:`, error);
         await Fractal.updateFractalStatus(hash, 'failed', (existingFractal && existingFractal.retry_count !== null && existingFractal.retry_count !== undefined ? existingFractal.retry_count : 0) + 1);
+        await Fractal.releaseClaim(hash, WORKER_ID);
         await History.updateHistoryStatus(historyId, 'failed');
+        await Fractal.notifyStatus(hash, 'failed');
         console.error('----------------------------------------');
     }
 }